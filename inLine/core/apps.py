@@ -1,12 +1,15 @@
 # core/apps.py
 from django.apps import AppConfig
-from django.db import connection
+
 
 class CoreConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "core"
 
+    # Os PRAGMAs do SQLite são aplicados em cada conexão nova via
+    # DATABASES["default"]["OPTIONS"]["init_command"] (settings.SQLITE_PERFIS)
+
     def ready(self):
-        with connection.cursor() as cursor:
-            cursor.execute("PRAGMA journal_mode=WAL;")
-            cursor.execute("PRAGMA synchronous=NORMAL;")
+        # Registra os ouvintes de métricas e da fila em memória no barramento
+        # (sem consultas ao banco: a fila só carrega no primeiro uso)
+        from . import fila_memoria, metricas  # noqa: F401
@@ -0,0 +1,222 @@
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from .cache_versoes import versoes
+from .models import Pedido, FilaPrato, ChaveIdempotencia, TMA, RegistroMudanca
+
+
+# =========================
+# ARQUIVO (BANCO ANEXADO)
+# =========================
+
+ESQUEMA = "arquivo"
+
+# Tabelas com histórico unificado (main + arquivo) nas visões de relatório
+HISTORICO = {
+    "historico_pedido": Pedido,
+    "historico_filaprato": FilaPrato,
+    "historico_tma": TMA,
+    "historico_mudanca": RegistroMudanca,
+}
+
+
+def _anexado(cursor):
+    cursor.execute("PRAGMA database_list")
+    return any(linha[1] == ESQUEMA for linha in cursor.fetchall())
+
+
+def anexar(cursor):
+    """ATTACH do arquivo (fora de transação, como o SQLite exige)."""
+    if not _anexado(cursor):
+        cursor.execute(f"ATTACH DATABASE %s AS {ESQUEMA}", [str(settings.ARQUIVO_DB_PATH)])
+
+
+def desanexar(cursor):
+    if _anexado(cursor):
+        cursor.execute(f"DETACH DATABASE {ESQUEMA}")
+
+
+def _colunas(cursor, esquema, tabela):
+    cursor.execute(f'PRAGMA {esquema}.table_info("{tabela}")')
+    return [(nome, tipo, pk) for _, nome, tipo, _, _, pk in cursor.fetchall()]
+
+
+def sincronizar_esquema(cursor, model):
+    """
+    Garante a tabela espelho no arquivo, com as mesmas colunas da tabela viva.
+
+    Só a chave primária é copiada (sem FKs/índices): é o que permite o
+    INSERT OR REPLACE idempotente. Colunas novas (migrations posteriores)
+    entram via ALTER TABLE ADD COLUMN, sem reescrever o histórico.
+    """
+    tabela = model._meta.db_table
+    vivas = _colunas(cursor, "main", tabela)
+    existentes = {nome for nome, _, _ in _colunas(cursor, ESQUEMA, tabela)}
+
+    if not existentes:
+        definicao = ", ".join(
+            f'"{nome}" {tipo}' + (" PRIMARY KEY" if pk else "") for nome, tipo, pk in vivas
+        )
+        cursor.execute(f'CREATE TABLE {ESQUEMA}."{tabela}" ({definicao})')
+    else:
+        for nome, tipo, _ in vivas:
+            if nome not in existentes:
+                cursor.execute(f'ALTER TABLE {ESQUEMA}."{tabela}" ADD COLUMN "{nome}" {tipo}')
+
+    return [nome for nome, _, _ in vivas]
+
+
+def _copiar(cursor, model, coluna, valores):
+    tabela = model._meta.db_table
+    colunas = ", ".join(f'"{c}"' for c in sincronizar_esquema(cursor, model))
+    marcadores = ", ".join(["%s"] * len(valores))
+    cursor.execute(
+        f'INSERT OR REPLACE INTO {ESQUEMA}."{tabela}" ({colunas}) '
+        f'SELECT {colunas} FROM main."{tabela}" WHERE "{coluna}" IN ({marcadores})',
+        valores,
+    )
+
+
+def _apagar_arquivados(cursor, model, coluna, valores):
+    # Só o que já está no arquivo sai da tabela viva
+    tabela = model._meta.db_table
+    pk = model._meta.pk.column
+    filtro = f'"{coluna}" IN ({", ".join(["%s"] * len(valores))})'
+    cursor.execute(
+        f'DELETE FROM main."{tabela}" WHERE {filtro} '
+        f'AND "{pk}" IN (SELECT "{pk}" FROM {ESQUEMA}."{tabela}" WHERE {filtro})',
+        list(valores) * 2,
+    )
+    return cursor.rowcount
+
+
+def _mover(cursor, passos, using):
+    """
+    Move as linhas de cada passo (model, coluna, valores) para o arquivo.
+
+    No WAL, um COMMIT que escreve nos dois arquivos não é atômico entre eles:
+    o main poderia gravar o DELETE e o arquivo perder o INSERT. Por isso são
+    duas transações: a cópia é commitada no arquivo primeiro e só depois o
+    main apaga as linhas que já estão lá. Se cair entre as duas, a linha fica
+    nos dois bancos e a próxima execução refaz a cópia (OR REPLACE) e apaga.
+    Retorna quantas linhas cada passo tirou da tabela viva.
+    """
+    with transaction.atomic(using=using):
+        for model, coluna, valores in passos:
+            _copiar(cursor, model, coluna, valores)
+
+    with transaction.atomic(using=using):
+        # Na ordem dos passos: filhos antes do pai, as FKs continuam válidas
+        return [_apagar_arquivados(cursor, model, coluna, valores) for model, coluna, valores in passos]
+
+
+def arquivar_retirados(antes_de, lote=500, using="default"):
+    """
+    Move pedidos RETIRADO criados antes de `antes_de` (com itens e chaves de
+    idempotência) para o arquivo, em transações curtas por lote: o lock de
+    escrita fica preso só por alguns milissegundos de cada vez, e o evento
+    segue rodando.
+    """
+    conexao = connections[using]
+    pk = Pedido._meta.pk
+    total = {"pedidos": 0, "itens": 0}
+
+    with conexao.cursor() as cursor:
+        anexar(cursor)
+        try:
+            while True:
+                ids = list(
+                    Pedido.objects.using(using)
+                    .filter(status=Pedido.Status.RETIRADO, created_at__lt=antes_de)
+                    .order_by("created_at")
+                    .values_list("id", flat=True)[:lote]
+                )
+                if not ids:
+                    break
+                valores = [pk.get_db_prep_value(i, conexao) for i in ids]
+
+                _, itens, pedidos = _mover(cursor, [
+                    (ChaveIdempotencia, "pedido_id", valores),
+                    (FilaPrato, "pedido_id", valores),
+                    (Pedido, "id", valores),
+                ], using)
+                total["itens"] += itens
+                total["pedidos"] += pedidos
+                if not pedidos:
+                    break  # Nada saiu do banco vivo: não insiste no mesmo lote
+        finally:
+            desanexar(cursor)
+
+    if total["pedidos"]:
+        versoes.incrementar("fila")  # Contagens do dashboard mudam
+    return total
+
+
+def _arquivar_por_data(model, campo, antes_de, lote, using):
+    conexao = connections[using]
+    total = 0
+
+    with conexao.cursor() as cursor:
+        anexar(cursor)
+        try:
+            while True:
+                # Em ordem de id: o que fica no banco vivo é sempre um sufixo
+                ids = list(
+                    model.objects.using(using)
+                    .filter(**{f"{campo}__lt": antes_de})
+                    .order_by("id")
+                    .values_list("id", flat=True)[:lote]
+                )
+                if not ids:
+                    break
+                movidos = _mover(cursor, [(model, "id", ids)], using)[0]
+                if not movidos:
+                    break
+                total += movidos
+        finally:
+            desanexar(cursor)
+
+    return total
+
+
+def arquivar_tma(antes_de, lote=500, using="default"):
+    """Move o histórico de TMA anterior a `antes_de` (o valor vigente fica em TMAAtual)."""
+    return _arquivar_por_data(TMA, "calculado_em", antes_de, lote, using)
+
+
+def compactar_mudancas(antes_de, lote=500, using="default"):
+    """
+    Compacta o log de mudanças: registros anteriores a `antes_de` saem do
+    banco vivo para o arquivo (auditoria continua possível via
+    historico_mudanca). Clientes com `since` anterior ao corte recebem 410
+    em /api/v1/changes/ e recarregam o estado inteiro.
+    """
+    return _arquivar_por_data(RegistroMudanca, "criado_em", antes_de, lote, using)
+
+
+@contextmanager
+def historico(using="default"):
+    """
+    Cursor com o arquivo anexado e as visões TEMP historico_* (tabela viva
+    UNION ALL arquivo) para relatórios de vários dias. Visões permanentes no
+    main não podem apontar para outro banco; as TEMP somem com o DETACH.
+    """
+    with connections[using].cursor() as cursor:
+        anexar(cursor)
+        try:
+            for visao, model in HISTORICO.items():
+                tabela = model._meta.db_table
+                colunas = ", ".join(f'"{c}"' for c in sincronizar_esquema(cursor, model))
+                cursor.execute(f"DROP VIEW IF EXISTS temp.{visao}")
+                cursor.execute(
+                    f"CREATE TEMP VIEW {visao} AS "
+                    f'SELECT {colunas} FROM main."{tabela}" '
+                    f'UNION ALL SELECT {colunas} FROM {ESQUEMA}."{tabela}"'
+                )
+            yield cursor
+        finally:
+            for visao in HISTORICO:
+                cursor.execute(f"DROP VIEW IF EXISTS temp.{visao}")
+            desanexar(cursor)
@@ -0,0 +1,203 @@
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+
+
+# =========================
+# VERSÕES POR DOMÍNIO (MEMÓRIA COMPARTILHADA)
+# =========================
+# Um contador por domínio de dados, num arquivo mapeado em memória (mmap)
+# que todos os workers do servidor abrem: ler a versão é ler 8 bytes, sem
+# consulta nem syscall. Os services incrementam o contador depois do COMMIT;
+# uma resposta calculada com a versão N vale até alguém gravar de novo.
+#
+# O cabeçalho guarda uma época aleatória, sorteada quando o arquivo nasce:
+# se ele for apagado, os contadores recomeçam do zero sem reaproveitar os
+# ETags que os clientes já têm.
+
+DOMINIOS = ("catalogo", "fila", "metricas")
+
+_CAMPO = struct.Struct("<Q")
+TAMANHO = _CAMPO.size * (1 + len(DOMINIOS))
+
+
+@contextmanager
+def _travado(fd):
+    # Incremento entre processos; sem fcntl (Windows) o servidor roda em um processo só
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    try:
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+class VersoesCompartilhadas:
+    def __init__(self, caminho=None):
+        self._caminho = caminho
+        self._lock = threading.Lock()
+        self._fd = None
+        self._mapa = None
+        self._falhou = False
+
+    def _abrir(self):
+        with self._lock:
+            if self._mapa is not None or self._falhou:
+                return self._mapa
+
+            caminho = Path(self._caminho or getattr(
+                settings, "CACHE_VERSOES_ARQUIVO", settings.BASE_DIR / "versoes_cache.bin"
+            ))
+            try:
+                fd = os.open(caminho, os.O_RDWR | os.O_CREAT, 0o644)
+                with _travado(fd):
+                    if os.fstat(fd).st_size < TAMANHO:
+                        # Arquivo novo (ou de uma versão com menos domínios)
+                        os.ftruncate(fd, TAMANHO)
+                    mapa = mmap.mmap(fd, TAMANHO)
+                    if _CAMPO.unpack_from(mapa, 0)[0] == 0:
+                        _CAMPO.pack_into(mapa, 0, int.from_bytes(os.urandom(8), "little") or 1)
+            except OSError as e:
+                print(f"Aviso: Cache de respostas desligado (versões em {caminho}): {e}")
+                self._falhou = True
+                return None
+
+            self._fd, self._mapa = fd, mapa
+            return mapa
+
+    @staticmethod
+    def _posicao(dominio):
+        return _CAMPO.size * (1 + DOMINIOS.index(dominio))
+
+    def ler(self, dominios):
+        """(época, versão de cada domínio) ou None se o arquivo não pôde ser aberto."""
+        mapa = self._mapa or self._abrir()
+        if mapa is None:
+            return None
+        return (_CAMPO.unpack_from(mapa, 0)[0],) + tuple(
+            _CAMPO.unpack_from(mapa, self._posicao(d))[0] for d in dominios
+        )
+
+    def incrementar(self, *dominios):
+        mapa = self._mapa or self._abrir()
+        if mapa is None:
+            return
+        with self._lock, _travado(self._fd):
+            for dominio in dominios:
+                posicao = self._posicao(dominio)
+                _CAMPO.pack_into(mapa, posicao, _CAMPO.unpack_from(mapa, posicao)[0] + 1)
+
+
+versoes = VersoesCompartilhadas()
+
+
+def invalidar(*dominios):
+    """Nova versão dos domínios depois do COMMIT (na hora, fora de transação)."""
+    transaction.on_commit(lambda: versoes.incrementar(*dominios))
+
+
+# =========================
+# CACHE DE RESPOSTAS (POR PROCESSO)
+# =========================
+
+class CacheRespostas:
+    """LRU das respostas já renderizadas; entradas de versões antigas saem pelo limite."""
+
+    def __init__(self, maximo=256):
+        self.maximo = maximo
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obter(self, chave):
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is not None:
+                self._itens.move_to_end(chave)
+            return item
+
+    def guardar(self, chave, resposta):
+        with self._lock:
+            self._itens[chave] = (resposta.content, dict(resposta.items()))
+            self._itens.move_to_end(chave)
+            while len(self._itens) > getattr(settings, "CACHE_RESPOSTAS_MAX", self.maximo):
+                self._itens.popitem(last=False)
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+
+respostas = CacheRespostas()
+
+
+def cache_por_versao(*dominios, validade=None):
+    """
+    Decorator de view (GET): a chave é rota + parâmetros + Accept + versão
+    dos `dominios` (+ a janela de `validade` segundos, para respostas com
+    tempo decorrido). A mesma chave vira o ETag: If-None-Match igual
+    responde 304 sem tocar no banco; senão a resposta sai do cache do
+    processo ou é calculada e guardada.
+    """
+    def decorador(view):
+        @wraps(view)
+        def envolvida(request, *args, **kwargs):
+            # Dentro de uma transação a view pode enxergar o que ainda não foi commitado
+            if (
+                request.method != "GET"
+                or not getattr(settings, "CACHE_RESPOSTAS_ATIVO", True)
+                or connection.in_atomic_block
+            ):
+                return view(request, *args, **kwargs)
+
+            atuais = versoes.ler(dominios)
+            if atuais is None:
+                return view(request, *args, **kwargs)
+
+            chave = (
+                request.path,
+                tuple(sorted((k, tuple(v)) for k, v in request.GET.lists())),
+                request.META.get("HTTP_ACCEPT", ""),
+                atuais,
+                int(time.time() // validade) if validade else None,
+            )
+            etag = f'"{hashlib.blake2b(repr(chave).encode(), digest_size=12).hexdigest()}"'
+
+            if etag in parse_etags(request.META.get("HTTP_IF_NONE_MATCH", "")):
+                resposta = HttpResponseNotModified()
+            else:
+                guardada = respostas.obter(chave)
+                if guardada is not None:
+                    conteudo, cabecalhos = guardada
+                    resposta = HttpResponse(conteudo, headers=cabecalhos)
+                else:
+                    resposta = view(request, *args, **kwargs)
+                    if hasattr(resposta, "render") and not resposta.is_rendered:
+                        resposta.render()  # Response do DRF / TemplateResponse
+                    if resposta.status_code != 200 or resposta.streaming:
+                        return resposta
+                    respostas.guardar(chave, resposta)
+
+            resposta["ETag"] = etag
+            resposta["Cache-Control"] = "no-cache"  # O navegador sempre revalida
+            return resposta
+
+        return envolvida
+
+    return decorador
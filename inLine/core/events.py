@@ -0,0 +1,145 @@
+import asyncio
+import itertools
+import json
+import threading
+
+from django.db import transaction
+
+
+# =========================
+# BARRAMENTO DE EVENTOS (EM PROCESSO)
+# =========================
+
+class EventBus:
+    """
+    Barramento de eventos local, sem dependências externas.
+
+    Os services publicam fatos ("pedido_criado", "item_finalizado"...) e as
+    telas conectadas via SSE recebem o aviso na hora, em vez de consultar o
+    banco a cada 5 segundos. Ouvintes síncronos também podem se registrar
+    (ex.: métricas internas), sempre rodando na thread de quem publicou.
+    """
+
+    TAMANHO_FILA_ASSINANTE = 100
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ouvintes = []
+        self._assinantes = set()
+        self._seq = itertools.count(1)
+
+    def assinar(self, callback):
+        """Registra um ouvinte síncrono: callback(evento)."""
+        with self._lock:
+            self._ouvintes.append(callback)
+        return callback
+
+    def desassinar(self, callback):
+        with self._lock:
+            self._ouvintes = [c for c in self._ouvintes if c != callback]
+
+    def conectar(self):
+        """Cria a fila de um assinante assíncrono (deve rodar dentro do event loop)."""
+        fila = asyncio.Queue(maxsize=self.TAMANHO_FILA_ASSINANTE)
+        with self._lock:
+            self._assinantes.add((asyncio.get_running_loop(), fila))
+        return fila
+
+    def desconectar(self, fila):
+        with self._lock:
+            self._assinantes = {(loop, f) for loop, f in self._assinantes if f is not fila}
+
+    def publicar(self, tipo, /, **dados):
+        evento = {"id": next(self._seq), "tipo": tipo, "dados": dados}
+
+        with self._lock:
+            ouvintes = list(self._ouvintes)
+            assinantes = list(self._assinantes)
+
+        for callback in ouvintes:
+            try:
+                callback(evento)
+            except Exception as e:
+                print(f"Erro em ouvinte do evento {tipo}: {e}")
+
+        for loop, fila in assinantes:
+            try:
+                loop.call_soon_threadsafe(_entregar, fila, evento)
+            except RuntimeError:
+                # Loop já encerrado: o assinante caiu sem se desconectar
+                self.desconectar(fila)
+
+        return evento
+
+
+def _entregar(fila, evento):
+    # Tela lenta não pode segurar o barramento: descartamos o aviso mais antigo.
+    # Os eventos são apenas "algo mudou", a tela sempre recarrega o estado.
+    if fila.full():
+        fila.get_nowait()
+    fila.put_nowait(evento)
+
+
+bus = EventBus()
+
+
+def publicar_apos_commit(tipo, /, **dados):
+    """Publica somente depois do COMMIT, para a tela nunca ler um estado que ainda não existe."""
+    transaction.on_commit(lambda: bus.publicar(tipo, **dados))
+
+
+# =========================
+# CANAL SSE (SERVIDO PELO ASGI)
+# =========================
+
+SSE_PATH = "/api/v1/eventos/"
+HEARTBEAT_SEG = 15
+
+
+async def sse_application(scope, receive, send):
+    """Aplicação ASGI mínima que entrega os eventos do barramento como Server-Sent Events."""
+    fila = bus.conectar()
+    desconexao = asyncio.ensure_future(_aguardar_desconexao(receive))
+
+    try:
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream"),
+                (b"cache-control", b"no-cache"),
+                (b"x-accel-buffering", b"no"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": b"retry: 3000\n\n", "more_body": True})
+
+        while not desconexao.done():
+            proximo = asyncio.ensure_future(fila.get())
+            await asyncio.wait({proximo, desconexao}, timeout=HEARTBEAT_SEG, return_when=asyncio.FIRST_COMPLETED)
+
+            if proximo.done():
+                evento = proximo.result()
+                corpo = (
+                    f"id: {evento['id']}\n"
+                    f"event: {evento['tipo']}\n"
+                    f"data: {json.dumps(evento['dados'])}\n\n"
+                )
+            else:
+                proximo.cancel()
+                if desconexao.done():
+                    break
+                corpo = ": ping\n\n"
+
+            await send({"type": "http.response.body", "body": corpo.encode(), "more_body": True})
+    except OSError:
+        pass
+    finally:
+        desconexao.cancel()
+        bus.desconectar(fila)
+
+
+async def _aguardar_desconexao(receive):
+    while True:
+        mensagem = await receive()
+        if mensagem["type"] == "http.disconnect":
+            return
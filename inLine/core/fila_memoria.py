@@ -0,0 +1,497 @@
+import heapq
+import threading
+import time
+import uuid
+from collections import Counter, deque
+
+from django.conf import settings
+from django.db import close_old_connections, router, transaction
+from django.utils.dateparse import parse_datetime
+
+from .cache_versoes import versoes
+from .events import bus
+from .models import Pedido, RegistroMudanca
+from .mudancas import ultima_sequencia
+from .routers import usar_leitura
+from .selectors import pedidos_na_fila, unidades_no_painel
+
+
+# =========================
+# FILA EM MEMÓRIA (UM HEAP POR PRATO)
+# =========================
+# "Fila não é tabela. É estado." O banco continua sendo a fonte da verdade;
+# aqui fica um espelho por processo, atualizado pelos eventos que os services
+# publicam após o commit (pedido_criado, pedido_liberado, item_iniciado,
+# item_finalizado). Painel, lista do atendimento e a escolha do próximo item
+# da estação leem daqui sem consultar o SQLite.
+#
+# Um só processo é dono da fila (flock em FILA_MEMORIA_LOCK): os outros
+# workers, se houver, leem pelo SQL de sempre. As escritas servidas por
+# esses workers não passam pelo barramento do dono: ele acompanha o log de
+# mudanças (RegistroMudanca) pelo seq, aplicando tudo em ordem. Os eventos
+# do próprio processo chegam pelo barramento e, se forem o seq seguinte,
+# são aplicados sem consultar o log. A cada FILA_MEMORIA_VERIFICACAO_SEG o
+# dono ainda confere os ids pendentes com o banco e recarrega tudo se
+# divergirem duas vezes seguidas.
+#
+# Cada entrada/saída de unidade no painel incrementa a versão da fila e fica
+# num histórico circular: o painel responde `since=<versão>` só com o que
+# mudou, sem reenviar a fila inteira.
+
+
+def _chave(prioridade, criado_em, ident):
+    return (prioridade, criado_em.timestamp(), ident)
+
+
+def _ordem(unidade):
+    return unidade["_chave"]
+
+
+def _data(valor):
+    return parse_datetime(valor) if isinstance(valor, str) else valor
+
+
+class _Heap:
+    """Heap com remoção preguiçosa: a entrada removida só sai quando chega ao topo."""
+
+    def __init__(self):
+        self._heap = []
+        self.itens = {}  # id -> dados (com a chave de ordenação)
+
+    def __len__(self):
+        return len(self.itens)
+
+    def inserir(self, chave, ident, dados):
+        if ident in self.itens:
+            return None
+        self.itens[ident] = {**dados, "_chave": chave}
+        heapq.heappush(self._heap, chave)
+        return self.itens[ident]
+
+    def remover(self, ident):
+        dados = self.itens.pop(ident, None)
+        # Muitas entradas mortas: reconstrói
+        if len(self._heap) > 2 * len(self.itens) + 64:
+            self._heap = [d["_chave"] for d in self.itens.values()]
+            heapq.heapify(self._heap)
+        return dados
+
+    def retirar(self):
+        while self._heap:
+            chave = heapq.heappop(self._heap)
+            dados = self.itens.get(chave[2])
+            if dados is not None and dados["_chave"] == chave:
+                del self.itens[chave[2]]
+                return dados
+        return None
+
+    def ordenados(self, limite=None, apos=None):
+        vivos = [d["_chave"] for d in self.itens.values() if apos is None or d["_chave"] > apos]
+        chaves = heapq.nsmallest(limite, vivos) if limite else sorted(vivos)
+        return [self.itens[c[2]] for c in chaves]
+
+
+def _adquirir_posse():
+    """flock exclusivo e não bloqueante; o arquivo fica aberto enquanto o processo viver."""
+    try:
+        import fcntl
+    except ImportError:
+        return True, None  # Windows: o servidor do evento roda em um processo só
+
+    caminho = getattr(settings, "FILA_MEMORIA_LOCK", settings.BASE_DIR / "fila_memoria.lock")
+    arquivo = open(caminho, "a+")
+    try:
+        fcntl.flock(arquivo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        arquivo.close()
+        return False, None
+    return True, arquivo
+
+
+class FilaMemoria:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._inicio = threading.Lock()
+        self._pedidos = _Heap()  # Pedidos PENDENTES (atendimento)
+        self._pratos = {}        # prato_id -> _Heap das unidades liberadas e PENDENTES
+        self._reservas = {}      # fila_id -> (unidade, instante): tiradas do heap, claim ainda sem commit
+        self._seq = 0  # Último registro do log de mudanças já aplicado
+        self._acompanhando = threading.Lock()
+        self._divergencias = 0
+        self._dono = None
+        self._trava = None
+        self.carregado = False
+        self.ressincronizacoes = 0
+        # Versão da fila do painel: "<época do processo>.<contador>"
+        self._epoca = uuid.uuid4().hex[:8]
+        self._versao = 0
+        self._base = 0  # Versões anteriores a esta não têm mais histórico (recarga)
+        self._mudancas = deque(maxlen=getattr(settings, "FILA_MEMORIA_HISTORICO", 5000))
+
+    # -------------------------
+    # POSSE E CARGA
+    # -------------------------
+
+    def disponivel(self):
+        """True se este processo serve as filas da memória (sobe tudo no primeiro uso)."""
+        if not getattr(settings, "FILA_MEMORIA_ATIVA", True):
+            return False
+        if self._dono is None:
+            with self._inicio:
+                if self._dono is None:
+                    dono, self._trava = _adquirir_posse()
+                    if dono:
+                        self.carregar()
+                        threading.Thread(target=self._vigiar, name="fila-memoria", daemon=True).start()
+                    self._dono = dono
+        return self._dono
+
+    def carregar(self):
+        """Reconstrói os heaps a partir do banco (início, restart ou divergência)."""
+        with usar_leitura():
+            alias = router.db_for_read(Pedido)
+            # Uma transação de leitura: retrato e seq do log no mesmo instante
+            with transaction.atomic(using=alias):
+                seq = ultima_sequencia(alias)
+                pedidos = list(pedidos_na_fila().values("id", "senha", "tipo", "prioridade", "created_at"))
+                unidades = list(unidades_no_painel().values(
+                    "id", "prato_id", "prato__nome", "prioridade", "created_at",
+                    "pedido_id", "pedido__senha", "pedido__tipo",
+                ))
+
+        novos_pedidos, novos_pratos = _Heap(), {}
+        for p in pedidos:
+            novos_pedidos.inserir(_chave(p["prioridade"], p["created_at"], str(p["id"])), str(p["id"]), {
+                "pedido_id": str(p["id"]),
+                "senha": Pedido.formatar_senha(p["senha"], p["id"]),
+                "tipo": p["tipo"],
+                "criado_em": p["created_at"],
+            })
+        for u in unidades:
+            heap = novos_pratos.setdefault(str(u["prato_id"]), _Heap())
+            heap.inserir(_chave(u["prioridade"], u["created_at"], str(u["id"])), str(u["id"]), {
+                "fila_id": str(u["id"]),
+                "pedido_id": str(u["pedido_id"]),
+                "senha": Pedido.formatar_senha(u["pedido__senha"], u["pedido_id"]),
+                "prato_id": str(u["prato_id"]),
+                "prato_nome": u["prato__nome"],
+                "tipo": u["pedido__tipo"],
+                "prioridade": u["prioridade"],
+                "criado_em": u["created_at"],
+            })
+
+        with self._lock:
+            self._pedidos, self._pratos = novos_pedidos, novos_pratos
+            self._reservas.clear()  # O retrato já traz o estado commitado de cada unidade
+            self._versao += 1
+            self._base = self._versao
+            self._mudancas.clear()
+            self._seq = seq
+            self.carregado = True
+            self._divergencias = 0
+
+        # O que foi commitado durante as consultas vem do log, depois do retrato
+        self.acompanhar()
+        # Respostas em cache calculadas com o espelho antigo deixam de valer
+        versoes.incrementar("fila")
+
+    # -------------------------
+    # WRITE-THROUGH (EVENTOS E LOG)
+    # -------------------------
+
+    def ao_evento(self, evento):
+        seq = evento["dados"].get("seq")
+        if seq is None or not self.carregado:
+            return
+        with self._lock:
+            if seq <= self._seq:
+                return  # Já veio pelo log
+            if seq == self._seq + 1:
+                self._aplicar(evento)
+                self._seq = seq
+        # Buraco antes deste seq (escritas de outro processo no meio): quem
+        # publicou é a thread do request; o _vigiar lê o log em instantes
+
+    def acompanhar(self, lote=500):
+        """Aplica, em ordem de seq, o que o log tem depois do último aplicado."""
+        with self._acompanhando:
+            compactado = self._ler_log(lote)
+        if compactado:
+            print("Aviso: Log de mudanças compactado à frente da fila em memória; recarregando")
+            self.carregar()
+
+    def _ler_log(self, lote):
+        # True se o trecho seguinte já saiu para o arquivo (só recarregando)
+        while True:
+            desde = self._seq
+            with usar_leitura():
+                registros = list(
+                    RegistroMudanca.objects.filter(id__gt=desde)
+                    .order_by("id")
+                    .values_list("id", "tipo", "dados")[:lote]
+                )
+            if not registros:
+                return False
+            if registros[0][0] > desde + 1:
+                return True
+
+            with self._lock:
+                aplicados = 0
+                for seq, tipo, dados in registros:
+                    if seq <= self._seq:
+                        continue  # O barramento chegou antes
+                    self._aplicar({"tipo": tipo, "dados": dados})
+                    self._seq = seq
+                    aplicados += 1
+            if aplicados:
+                # O worker que gravou já subiu a versão antes deste espelho mudar
+                versoes.incrementar("fila")
+            if len(registros) < lote:
+                return False
+
+    def _aplicar(self, evento):
+        tipo, dados = evento["tipo"], evento["dados"]
+
+        if tipo == "pedido_criado":
+            criado_em = _data(dados["criado_em"])
+            prioridade = Pedido.prioridade_do_tipo(dados["tipo"])
+            self._pedidos.inserir(_chave(prioridade, criado_em, dados["pedido_id"]), dados["pedido_id"], {
+                "pedido_id": dados["pedido_id"],
+                "senha": dados.get("senha"),
+                "tipo": dados["tipo"],
+                "criado_em": criado_em,
+            })
+
+        elif tipo == "pedido_liberado":
+            self._pedidos.remover(dados["pedido_id"])
+            criado_em = _data(dados["criado_em"])
+            for fila_id, prato_id, prato_nome in dados.get("unidades", ()):
+                heap = self._pratos.setdefault(prato_id, _Heap())
+                self._registrar("+", heap.inserir(_chave(dados["prioridade"], criado_em, fila_id), fila_id, {
+                    "fila_id": fila_id,
+                    "pedido_id": dados["pedido_id"],
+                    "senha": dados.get("senha"),
+                    "prato_id": prato_id,
+                    "prato_nome": prato_nome,
+                    "tipo": dados["tipo"],
+                    "prioridade": dados["prioridade"],
+                    "criado_em": criado_em,
+                }))
+
+        elif tipo in ("item_iniciado", "item_finalizado"):
+            self._reservas.pop(dados["fila_id"], None)  # Claim confirmado (ou item já pronto)
+            heap = self._pratos.get(dados["prato_id"])
+            if heap is not None:
+                self._registrar("-", heap.remover(dados["fila_id"]))
+
+    def _registrar(self, sinal, unidade):
+        # None: nada mudou (evento repetido ou unidade já reservada)
+        if unidade is not None:
+            self._versao += 1
+            self._mudancas.append((self._versao, sinal, unidade))
+
+    # -------------------------
+    # LEITURAS
+    # -------------------------
+
+    def pedidos_pendentes(self, limite=None):
+        with self._lock:
+            return self._pedidos.ordenados(limite)
+
+    def painel(self, prato_id=None, limite=None, apos=None):
+        """
+        Unidades na ordem da fila, até `limite`, depois do cursor `apos`
+        (prioridade, criado_em, fila_id). Retorna (unidades, versão).
+        """
+        if apos is not None:
+            apos = (apos[0], apos[1].timestamp(), str(apos[2]))
+        with self._lock:
+            return self._ordenados(prato_id, limite, apos), self.versao()
+
+    def _ordenados(self, prato_id, limite, apos=None):
+        if prato_id:
+            heap = self._pratos.get(str(prato_id))
+            return heap.ordenados(limite, apos) if heap else []
+        # Todos os pratos: os primeiros de cada heap bastam para o limite
+        unidades = [u for heap in self._pratos.values() for u in heap.ordenados(limite, apos)]
+        if limite:
+            return heapq.nsmallest(limite, unidades, key=_ordem)
+        return sorted(unidades, key=_ordem)
+
+    def versao(self):
+        return f"{self._epoca}.{self._versao}"
+
+    def mudancas_desde(self, versao, prato_id=None, limite=None):
+        """
+        (inseridas, ids removidos, versão atual) para quem viu a fila na
+        `versao` — com `limite`, relativo à janela das primeiras `limite`
+        unidades (quem entrou ou saiu dela). None se a versão não serve mais
+        (outro processo, recarga ou histórico já descartado): mande tudo.
+        """
+        try:
+            epoca, numero = versao.split(".")
+            numero = int(numero)
+        except (AttributeError, ValueError):
+            return None
+        prato_id = str(prato_id) if prato_id else None
+
+        with self._lock:
+            if epoca != self._epoca or not self._base <= numero <= self._versao:
+                return None
+            if self._mudancas and self._mudancas[0][0] > numero + 1:
+                return None  # O histórico circular já perdeu parte das mudanças
+
+            inseridas, removidas = set(), {}
+            for v, sinal, unidade in self._mudancas:
+                if v <= numero or (prato_id and unidade["prato_id"] != prato_id):
+                    continue
+                if sinal == "+":
+                    inseridas.add(unidade["fila_id"])
+                else:
+                    removidas[unidade["fila_id"]] = unidade
+
+            if not limite:
+                # Fila inteira: entrou = inserida e ainda presente; saiu = já estava e foi removida
+                presentes = {}
+                for heap in ([self._pratos.get(prato_id)] if prato_id else self._pratos.values()):
+                    presentes.update(heap.itens if heap else {})
+                return (
+                    sorted((presentes[i] for i in inseridas if i in presentes), key=_ordem),
+                    [i for i in removidas if i not in inseridas],
+                    self.versao(),
+                )
+
+            # Janela vista na `versao`: o que ainda está na fila e já estava lá,
+            # mais o que saiu depois (sem contar o que entrou e saiu no meio)
+            atuais = self._ordenados(prato_id, limite + len(inseridas))
+            antes = [u for u in atuais if u["fila_id"] not in inseridas]
+            antes += [u for i, u in removidas.items() if i not in inseridas]
+            antes = heapq.nsmallest(limite, antes, key=_ordem)
+            atuais = atuais[:limite]
+
+            vistos = {u["fila_id"] for u in antes}
+            agora = {u["fila_id"] for u in atuais}
+            return (
+                [u for u in atuais if u["fila_id"] not in vistos],
+                [u["fila_id"] for u in antes if u["fila_id"] not in agora],
+                self.versao(),
+            )
+
+    def reservar(self, prato_id):
+        """
+        Tira do heap o próximo item do prato (O(log n)); o chamador confirma no
+        banco. A unidade fica reservada até o item_iniciado do commit chegar:
+        se a transação do claim voltar, devolver() (ou o prazo da reserva) a
+        põe de novo na fila, no mesmo lugar.
+        """
+        with self._lock:
+            heap = self._pratos.get(str(prato_id))
+            unidade = heap.retirar() if heap else None
+            if unidade is not None:
+                self._reservas[unidade["fila_id"]] = (unidade, time.monotonic())
+            self._registrar("-", unidade)
+            return unidade
+
+    def descartar(self, fila_id):
+        """O banco recusou a reserva (item já não estava PENDENTE): some de vez."""
+        with self._lock:
+            self._reservas.pop(fila_id, None)
+
+    def devolver(self, fila_id):
+        """Claim desfeito (rollback): a unidade volta ao heap do prato."""
+        with self._lock:
+            reserva = self._reservas.pop(fila_id, None)
+            if reserva is None:
+                return None
+            unidade = {k: v for k, v in reserva[0].items() if k != "_chave"}
+            heap = self._pratos.setdefault(unidade["prato_id"], _Heap())
+            devolvida = heap.inserir(reserva[0]["_chave"], fila_id, unidade)
+            self._registrar("+", devolvida)
+            return devolvida
+
+    def devolver_vencidas(self, prazo):
+        """
+        Reservas sem item_iniciado há mais de `prazo` segundos: o commit nunca
+        veio (ex.: o COMMIT do lote da fila de escrita falhou). Se o evento
+        ainda chegar, ele tira a unidade de novo.
+        """
+        limite = time.monotonic() - prazo
+        with self._lock:
+            vencidas = [fila_id for fila_id, (_, desde) in self._reservas.items() if desde < limite]
+        return [fila_id for fila_id in vencidas if self.devolver(fila_id)]
+
+    # -------------------------
+    # DIVERGÊNCIA
+    # -------------------------
+
+    def contagens(self):
+        with self._lock:
+            return len(self._pedidos), Counter({p: len(h) for p, h in self._pratos.items() if len(h)})
+
+    def _ids(self):
+        with self._lock:
+            return set(self._pedidos.itens), {(p, i) for p, h in self._pratos.items() for i in h.itens}
+
+    def verificar(self):
+        """
+        Depois de acompanhar o log, compara os ids pendentes com o banco
+        (contagens iguais não bastam: uma unidade pode ter trocado por
+        outra). Uma divergência isolada pode ser só um commit a caminho;
+        duas seguidas recarregam tudo. Retorna True se recarregou.
+        """
+        self.acompanhar()
+        with usar_leitura():
+            pedidos_db = {str(i) for i in pedidos_na_fila().values_list("id", flat=True)}
+            unidades_db = {
+                (str(prato_id), str(fila_id))
+                for fila_id, prato_id in unidades_no_painel().order_by().values_list("id", "prato_id")
+            }
+
+        if (pedidos_db, unidades_db) == self._ids():
+            self._divergencias = 0
+            return False
+
+        self._divergencias += 1
+        if self._divergencias < 2:
+            return False
+
+        print("Aviso: Fila em memória divergiu do banco; recarregando")
+        self.carregar()
+        self.ressincronizacoes += 1
+        return True
+
+    def _vigiar(self):
+        intervalo = getattr(settings, "FILA_MEMORIA_ACOMPANHAMENTO_SEG", 0.5)
+        verificacao = getattr(settings, "FILA_MEMORIA_VERIFICACAO_SEG", 10)
+        prazo_reserva = getattr(settings, "FILA_MEMORIA_RESERVA_SEG", 60)
+        proxima = time.monotonic() + verificacao
+        while True:
+            time.sleep(intervalo)
+            try:
+                # Escritas dos outros workers chegam por aqui
+                if time.monotonic() >= proxima:
+                    proxima = time.monotonic() + verificacao
+                    self.verificar()
+                else:
+                    self.acompanhar()
+                # Depois do log: reserva confirmada já saiu daqui pelo item_iniciado
+                self.devolver_vencidas(prazo_reserva)
+            except Exception as e:
+                print(f"Aviso: Falha ao acompanhar a fila em memória: {e}")
+            finally:
+                close_old_connections()
+
+    def estado(self):
+        pedidos, unidades = self.contagens()
+        return {
+            "dono": bool(self._dono),
+            "carregado": self.carregado,
+            "seq": self._seq,
+            "pedidos_pendentes": pedidos,
+            "unidades_por_prato": dict(unidades),
+            "ressincronizacoes": self.ressincronizacoes,
+        }
+
+
+fila_memoria = FilaMemoria()
+bus.assinar(fila_memoria.ao_evento)
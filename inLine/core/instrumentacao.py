@@ -0,0 +1,122 @@
+import ipaddress
+import threading
+import time
+from collections import deque
+
+from .medicao import percentil
+
+
+# =========================
+# INSTRUMENTAÇÃO SQL POR ROTA
+# =========================
+
+ENDERECOS_LOCAIS = {"127.0.0.1", "::1"}
+
+
+def requisicao_local(request):
+    """Diagnóstico só para a própria máquina do servidor."""
+    return request.META.get("REMOTE_ADDR") in ENDERECOS_LOCAIS
+
+
+def requisicao_da_lan(request):
+    """Rede local do evento (scraper de métricas na mesma LAN) ou a própria máquina."""
+    try:
+        ip = ipaddress.ip_address(request.META.get("REMOTE_ADDR", ""))
+    except ValueError:
+        return False
+    return ip.is_private or ip.is_loopback
+
+
+class MedicaoSQL:
+    """execute_wrapper que conta as consultas de UM request e guarda a mais lenta."""
+
+    def __init__(self):
+        self.consultas = 0
+        self.db_seg = 0.0
+        self.mais_lenta = None  # (segundos, sql)
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            decorrido = time.perf_counter() - inicio
+            self.consultas += 1
+            self.db_seg += decorrido
+            if self.mais_lenta is None or decorrido > self.mais_lenta[0]:
+                # Só o SQL com placeholders: nenhum dado do cliente vai para o agregado
+                self.mais_lenta = (decorrido, sql)
+
+
+class AgregadorRotas:
+    """
+    Agregados em memória por rota (por processo): totais desde o início e
+    uma janela das últimas `amostras` requisições para os percentis.
+    """
+
+    def __init__(self, amostras=500):
+        self.amostras = amostras
+        self._rotas = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, rota, medicao, total_seg, status):
+        with self._lock:
+            r = self._rotas.get(rota)
+            if r is None:
+                r = self._rotas[rota] = {
+                    "requisicoes": 0,
+                    "erros": 0,
+                    "consultas": 0,
+                    "db_seg": 0.0,
+                    "max_consultas": 0,
+                    "mais_lenta": None,
+                    "janela_consultas": deque(maxlen=self.amostras),
+                    "janela_db": deque(maxlen=self.amostras),
+                    "janela_total": deque(maxlen=self.amostras),
+                }
+
+            r["requisicoes"] += 1
+            r["erros"] += status >= 500
+            r["consultas"] += medicao.consultas
+            r["db_seg"] += medicao.db_seg
+            r["max_consultas"] = max(r["max_consultas"], medicao.consultas)
+            if medicao.mais_lenta and (r["mais_lenta"] is None or medicao.mais_lenta[0] > r["mais_lenta"][0]):
+                r["mais_lenta"] = medicao.mais_lenta
+            r["janela_consultas"].append(medicao.consultas)
+            r["janela_db"].append(medicao.db_seg)
+            r["janela_total"].append(total_seg)
+
+    def exportar(self):
+        with self._lock:
+            resultado = [self._resumo(rota, r) for rota, r in self._rotas.items()]
+
+        # Quem mais gasta banco primeiro
+        return sorted(resultado, key=lambda r: r["db_ms_total"], reverse=True)
+
+    @staticmethod
+    def _resumo(rota, r):
+        janela = r["janela_consultas"]
+        return {
+            "rota": rota,
+            "requisicoes": r["requisicoes"],
+            "erros": r["erros"],
+            "consultas_media": round(r["consultas"] / r["requisicoes"], 2),
+            "consultas_max": r["max_consultas"],
+            "consultas_recentes_media": round(sum(janela) / len(janela), 2),
+            "db_ms_total": round(r["db_seg"] * 1000, 2),
+            "db_p95_ms": percentil(r["janela_db"], 95),
+            "total_p50_ms": percentil(r["janela_total"], 50),
+            "total_p95_ms": percentil(r["janela_total"], 95),
+            "total_p99_ms": percentil(r["janela_total"], 99),
+            "consulta_mais_lenta": {
+                "ms": round(r["mais_lenta"][0] * 1000, 2),
+                "sql": r["mais_lenta"][1][:500],
+            } if r["mais_lenta"] else None,
+        }
+
+    def limpar(self):
+        with self._lock:
+            self._rotas.clear()
+
+
+agregador = AgregadorRotas()
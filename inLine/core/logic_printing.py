@@ -0,0 +1,366 @@
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Min, Q
+from django.utils import timezone
+
+from .models import Pedido, TrabalhoImpressao
+
+
+# =========================
+# ESC/POS (IMPRESSORA TÉRMICA)
+# =========================
+
+INICIAR = b"\x1b@"
+TABELA_PC850 = b"\x1bt\x02"
+CENTRO = b"\x1ba\x01"
+ESQUERDA = b"\x1ba\x00"
+NEGRITO = b"\x1bE\x01"
+SEM_NEGRITO = b"\x1bE\x00"
+NORMAL = b"\x1d!\x00"
+DUPLO = b"\x1d!\x11"
+TRIPLO = b"\x1d!\x22"
+CORTAR = b"\n\n\n\x1dVB\x03"  # Avança o papel e faz o corte parcial
+
+
+def _texto(valor):
+    return f"{valor}\n".encode("cp850", errors="replace")
+
+
+def _linha():
+    return _texto("-" * getattr(settings, "IMPRESSAO_COLUNAS", 42))
+
+
+@lru_cache(maxsize=None)
+def _molde_senha(cabecalho):
+    """Parte fixa do cupom do cliente: (antes da senha, entre senha e itens)."""
+    return (
+        INICIAR + TABELA_PC850 + CENTRO + NEGRITO + _texto(cabecalho) + SEM_NEGRITO
+        + _linha() + _texto("SUA SENHA") + TRIPLO,
+        _linha() + ESQUERDA,
+    )
+
+
+@lru_cache(maxsize=256)
+def _molde_comanda(prato):
+    """Parte fixa da via da cozinha de um prato: só muda a senha e a quantidade."""
+    return (
+        INICIAR + TABELA_PC850 + CENTRO + DUPLO + NEGRITO + _texto(prato) + SEM_NEGRITO + NORMAL
+        + _linha() + DUPLO,
+        _linha(),
+    )
+
+
+def renderizar(tipo, dados):
+    """Bytes ESC/POS de um trabalho (cupom SENHA ou COMANDA da cozinha)."""
+    preferencial = dados["tipo"] == Pedido.Tipo.PREFERENCIAL
+
+    if tipo == TrabalhoImpressao.Tipo.SENHA:
+        antes, depois = _molde_senha(getattr(settings, "IMPRESSAO_CABECALHO", "InLine"))
+        corpo = antes + _texto(dados["senha"]) + NORMAL
+        if preferencial:
+            corpo += NEGRITO + _texto("PREFERENCIAL") + SEM_NEGRITO
+        corpo += depois
+        for item in dados["itens"]:
+            corpo += _texto(f"{item['quantidade']}x {item['nome']}")
+        return corpo + CENTRO + _linha() + _texto(dados["hora"]) + CORTAR
+
+    antes, depois = _molde_comanda(dados["prato"])
+    corpo = antes + _texto(f"SENHA {dados['senha']}") + _texto(f"{dados['quantidade']}x") + NORMAL
+    if preferencial:
+        corpo += NEGRITO + _texto("*** PREFERENCIAL ***") + SEM_NEGRITO
+    return corpo + depois + _texto(dados["hora"]) + CORTAR
+
+
+# =========================
+# IMPRESSORAS
+# =========================
+
+class ImpressoraArquivo:
+    """Substituta para testes/bancada: acrescenta os bytes ESC/POS a um arquivo."""
+
+    def __init__(self, caminho):
+        self.caminho = Path(caminho)
+
+    def enviar(self, conteudo):
+        self.caminho.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.caminho, "ab") as arquivo:
+            arquivo.write(conteudo)
+
+
+class ImpressoraTCP:
+    """Impressora de rede no modo RAW (porta 9100 na maioria das térmicas)."""
+
+    def __init__(self, host, porta, timeout):
+        self.host = host
+        self.porta = porta
+        self.timeout = timeout
+
+    def enviar(self, conteudo):
+        with socket.create_connection((self.host, self.porta), timeout=self.timeout) as conexao:
+            conexao.sendall(conteudo)
+
+
+def abrir_impressora(nome):
+    """settings.IMPRESSORAS: "arquivo:<caminho>" ou "tcp://<host>:<porta>"."""
+    destino = getattr(settings, "IMPRESSORAS", {}).get(nome)
+    if not destino:
+        raise ValueError(f"Impressora '{nome}' não configurada")
+
+    if destino.startswith("arquivo:"):
+        return ImpressoraArquivo(destino[len("arquivo:"):])
+    if destino.startswith("tcp://"):
+        host, _, porta = destino[len("tcp://"):].rpartition(":")
+        return ImpressoraTCP(host, int(porta or 9100), getattr(settings, "IMPRESSAO_TIMEOUT_SEG", 5))
+    raise ValueError(f"Destino de impressora inválido: {destino}")
+
+
+# =========================
+# FILA DE IMPRESSÃO
+# =========================
+
+def enfileirar_pedido_liberado(pedido, itens):
+    """
+    Chamado dentro da transação que libera o pedido: o cupom do cliente e uma
+    comanda por prato entram na fila junto com a mudança de status (ou nenhum
+    dos dois). A impressão em si fica para o spooler, depois do commit.
+    """
+    if not getattr(settings, "IMPRESSAO_ATIVA", False):
+        return
+
+    base = {
+        "senha": pedido.senha_exibicao,
+        "tipo": pedido.tipo,
+        "hora": timezone.localtime().strftime("%H:%M"),
+    }
+    por_prato = getattr(settings, "IMPRESSORA_POR_PRATO", {})
+
+    trabalhos = [
+        TrabalhoImpressao(
+            tipo=TrabalhoImpressao.Tipo.SENHA,
+            impressora="balcao",
+            pedido_id=pedido.id,
+            dados={**base, "itens": itens},
+        )
+    ] + [
+        TrabalhoImpressao(
+            tipo=TrabalhoImpressao.Tipo.COMANDA,
+            impressora=por_prato.get(item["nome"], "cozinha"),
+            pedido_id=pedido.id,
+            dados={**base, "prato": item["nome"], "quantidade": item["quantidade"]},
+        )
+        for item in itens
+    ]
+    TrabalhoImpressao.objects.bulk_create(trabalhos)
+
+    transaction.on_commit(spooler.acordar)
+
+
+def _atrasar(tentativas):
+    # Backoff exponencial: 2s, 4s, 8s... até 1 minuto
+    return timedelta(seconds=min(2 ** tentativas, 60))
+
+
+def imprimir_trabalho(trabalho_id):
+    """
+    Imprime um trabalho já marcado IMPRIMINDO. Falha volta para PENDENTE com
+    backoff; depois de IMPRESSAO_MAX_TENTATIVAS fica FALHOU.
+    """
+    trabalho = TrabalhoImpressao.objects.get(id=trabalho_id)
+    try:
+        abrir_impressora(trabalho.impressora).enviar(renderizar(trabalho.tipo, trabalho.dados))
+    except Exception as e:
+        tentativas = trabalho.tentativas + 1
+        esgotou = tentativas >= getattr(settings, "IMPRESSAO_MAX_TENTATIVAS", 10)
+        TrabalhoImpressao.objects.filter(id=trabalho_id).update(
+            status=TrabalhoImpressao.Status.FALHOU if esgotou else TrabalhoImpressao.Status.PENDENTE,
+            tentativas=tentativas,
+            proxima_tentativa=timezone.now() + _atrasar(tentativas),
+            ultimo_erro=str(e)[:500],
+        )
+        print(f"Aviso: Falha ao imprimir na '{trabalho.impressora}' (tentativa {tentativas}): {e}")
+        return False
+
+    TrabalhoImpressao.objects.filter(id=trabalho_id).update(
+        status=TrabalhoImpressao.Status.IMPRESSO,
+        tentativas=trabalho.tentativas + 1,
+        impresso_em=timezone.now(),
+        ultimo_erro="",
+    )
+    return True
+
+
+def _proximos_por_impressora(excluir=()):
+    """
+    O trabalho pendente mais antigo de cada impressora. A ordem de impressão
+    por impressora é preservada: se o mais antigo está em backoff, a
+    impressora inteira espera (em vez de pular para o próximo cupom).
+    """
+    cabecas = (
+        TrabalhoImpressao.objects.filter(status=TrabalhoImpressao.Status.PENDENTE)
+        .exclude(impressora__in=excluir)
+        .values("impressora")
+        .annotate(primeiro=Min("id"))
+        .values_list("primeiro", flat=True)
+    )
+    return list(TrabalhoImpressao.objects.filter(id__in=list(cabecas)).only("id", "impressora", "proxima_tentativa"))
+
+
+def _reservar(trabalho_id):
+    # UPDATE condicional: só um despachante (ou processo) leva cada trabalho
+    return TrabalhoImpressao.objects.filter(
+        id=trabalho_id, status=TrabalhoImpressao.Status.PENDENTE
+    ).update(status=TrabalhoImpressao.Status.IMPRIMINDO, reservado_em=timezone.now()) == 1
+
+
+def devolver_interrompidos():
+    """
+    Trabalhos IMPRIMINDO há mais de IMPRESSAO_RESERVA_SEG voltam para a fila:
+    o processo que os reservou caiu no meio. Reservas recentes são de outro
+    processo ainda imprimindo e ficam como estão (senão o cupom sai duas vezes).
+    """
+    prazo = max(
+        getattr(settings, "IMPRESSAO_RESERVA_SEG", 60), 2 * getattr(settings, "IMPRESSAO_TIMEOUT_SEG", 5)
+    )
+    presos = TrabalhoImpressao.objects.filter(status=TrabalhoImpressao.Status.IMPRIMINDO).filter(
+        Q(reservado_em__lt=timezone.now() - timedelta(seconds=prazo)) | Q(reservado_em=None)
+    )
+    # Consulta antes: sem nada preso, a varredura não pega o lock de escrita
+    if not presos.exists():
+        return 0
+    return presos.update(status=TrabalhoImpressao.Status.PENDENTE)
+
+
+def _liberar_reserva(trabalho_id, erro):
+    # imprimir_trabalho falhou fora do próprio try (ex.: banco travado): devolve já
+    return TrabalhoImpressao.objects.filter(
+        id=trabalho_id, status=TrabalhoImpressao.Status.IMPRIMINDO
+    ).update(
+        status=TrabalhoImpressao.Status.PENDENTE,
+        proxima_tentativa=timezone.now() + _atrasar(1),
+        ultimo_erro=str(erro)[:500],
+    )
+
+
+def processar_pendentes():
+    """Esvazia a fila na thread atual (modo síncrono e `manage.py impressao --processar`)."""
+    devolver_interrompidos()
+    impressos, falhas = 0, set()
+    while True:
+        agora = timezone.now()
+        prontos = [t for t in _proximos_por_impressora(excluir=falhas) if t.proxima_tentativa <= agora]
+        if not prontos:
+            return impressos
+        for trabalho in prontos:
+            if not _reservar(trabalho.id):
+                continue
+            if imprimir_trabalho(trabalho.id):
+                impressos += 1
+            else:
+                falhas.add(trabalho.impressora)  # Não insiste nesta passada
+
+
+class Spooler:
+    """
+    Despachante em thread própria + pool pequeno de threads de impressão.
+
+    O request que libera o pedido só grava os trabalhos; uma impressora
+    lenta ou travada ocupa no máximo uma thread do pool (um trabalho por
+    impressora por vez) e nunca segura um request.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._acordado = False
+        self._ocupadas = set()
+        self._thread = None
+        self._executor = None
+
+    def acordar(self):
+        if not getattr(settings, "IMPRESSAO_ASYNC", True):
+            # Modo síncrono (testes/diagnóstico): imprime na hora
+            processar_pendentes()
+            return
+
+        with self._cond:
+            self._garantir_thread()
+            self._acordado = True
+            self._cond.notify()
+
+    def _garantir_thread(self):
+        # Só sobe as threads no primeiro uso, como o worker de TMA
+        if self._thread and self._thread.is_alive():
+            return
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, "IMPRESSAO_THREADS", 3), thread_name_prefix="impressao"
+        )
+        self._thread = threading.Thread(target=self._loop, name="impressao-spooler", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        varredura = getattr(settings, "IMPRESSAO_VARREDURA_SEG", 30)
+
+        while True:
+            try:
+                espera = self._despachar()
+            except Exception as e:
+                print(f"Aviso: Falha no spooler de impressão: {e}")
+                espera = varredura
+            finally:
+                close_old_connections()
+
+            with self._cond:
+                if not self._acordado:
+                    self._cond.wait(min(espera, varredura))
+                self._acordado = False
+
+    def _despachar(self):
+        """Envia ao pool o que está pronto; retorna quantos segundos até o próximo retry."""
+        # Interrompidos no meio (processo que caiu com trabalho IMPRIMINDO) voltam para a fila
+        devolver_interrompidos()
+
+        agora = timezone.now()
+        espera = float("inf")
+
+        with self._cond:
+            ocupadas = set(self._ocupadas)
+
+        for trabalho in _proximos_por_impressora(excluir=ocupadas):
+            if trabalho.proxima_tentativa > agora:
+                espera = min(espera, (trabalho.proxima_tentativa - agora).total_seconds())
+                continue
+            if not _reservar(trabalho.id):
+                continue
+            with self._cond:
+                self._ocupadas.add(trabalho.impressora)
+            self._executor.submit(self._imprimir, trabalho.id, trabalho.impressora)
+
+        return espera
+
+    def _imprimir(self, trabalho_id, impressora):
+        try:
+            imprimir_trabalho(trabalho_id)
+        except Exception as e:
+            print(f"Aviso: Falha ao processar trabalho de impressão {trabalho_id}: {e}")
+            try:
+                _liberar_reserva(trabalho_id, e)
+            except Exception as e:
+                # Banco ainda indisponível: a varredura devolve quando a reserva vencer
+                print(f"Aviso: Trabalho de impressão {trabalho_id} segue reservado: {e}")
+        finally:
+            close_old_connections()
+            with self._cond:
+                self._ocupadas.discard(impressora)
+                # Impressora livre: o próximo trabalho dela já pode sair
+                self._acordado = True
+                self._cond.notify()
+
+
+spooler = Spooler()
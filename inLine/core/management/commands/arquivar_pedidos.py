@@ -0,0 +1,90 @@
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from core.arquivo import arquivar_retirados, arquivar_tma, compactar_mudancas, historico
+
+
+class Command(BaseCommand):
+    help = (
+        "Fechamento do dia: move pedidos RETIRADO (com seus itens) e o histórico "
+        "antigo de TMA e o log de mudanças antigo para o banco de arquivo, em lotes curtos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--antes-de",
+            help="Data ou data/hora ISO. Padrão: início de hoje (o dia corrente fica no banco vivo)",
+        )
+        parser.add_argument(
+            "--tudo", action="store_true", help="Arquiva todos os RETIRADO até agora (fim do evento)"
+        )
+        parser.add_argument("--tma-dias", type=int, default=1, help="Dias de histórico de TMA mantidos")
+        parser.add_argument(
+            "--mudancas-horas",
+            type=float,
+            default=settings.MUDANCAS_RETENCAO_HORAS,
+            help="Horas do log de mudanças mantidas no banco vivo (clientes mais atrasados recebem 410)",
+        )
+        parser.add_argument("--lote", type=int, default=500, help="Pedidos por transação")
+        parser.add_argument("--vacuum", action="store_true", help="Devolve ao disco o espaço liberado")
+        parser.add_argument(
+            "--relatorio", action="store_true", help="Só lista pedidos e faturamento por dia (vivo + arquivo)"
+        )
+
+    def handle(self, *args, **options):
+        if options["relatorio"]:
+            return self._relatorio()
+
+        corte = self._corte(options)
+        self.stdout.write(f"Arquivo: {settings.ARQUIVO_DB_PATH}")
+        self.stdout.write(f"Pedidos retirados antes de {corte.isoformat()}...")
+
+        total = arquivar_retirados(corte, lote=options["lote"])
+        self.stdout.write(self.style.SUCCESS(f"  {total['pedidos']} pedidos / {total['itens']} itens arquivados"))
+
+        corte_tma = timezone.now() - timedelta(days=options["tma_dias"])
+        movidos = arquivar_tma(corte_tma, lote=options["lote"])
+        self.stdout.write(self.style.SUCCESS(f"  {movidos} registros de TMA arquivados"))
+
+        corte_mudancas = timezone.now() - timedelta(hours=options["mudancas_horas"])
+        compactados = compactar_mudancas(corte_mudancas, lote=options["lote"])
+        self.stdout.write(self.style.SUCCESS(f"  {compactados} registros do log de mudanças compactados"))
+
+        if options["vacuum"]:
+            with connection.cursor() as cursor:
+                cursor.execute("VACUUM")
+            self.stdout.write("  VACUUM concluído")
+
+    def _corte(self, options):
+        if options["tudo"]:
+            return timezone.now()
+
+        valor = options["antes_de"]
+        if not valor:
+            return timezone.make_aware(datetime.combine(timezone.localdate(), time.min))
+
+        data_hora = parse_datetime(valor)
+        if data_hora is None:
+            data = parse_date(valor)
+            if data is None:
+                raise CommandError(f"Data inválida: {valor}")
+            data_hora = datetime.combine(data, time.min)
+        if timezone.is_naive(data_hora):
+            data_hora = timezone.make_aware(data_hora)
+        return data_hora
+
+    def _relatorio(self):
+        with historico() as cursor:
+            cursor.execute(
+                "SELECT date(created_at), COUNT(*), SUM(total) "
+                "FROM historico_pedido GROUP BY 1 ORDER BY 1"
+            )
+            linhas = cursor.fetchall()
+
+        for dia, pedidos, faturamento in linhas:
+            self.stdout.write(f"  {dia}  pedidos={pedidos:<6} faturamento=R$ {faturamento or 0:.2f}")
@@ -0,0 +1,176 @@
+import json
+import multiprocessing
+import random
+import threading
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test.utils import override_settings
+
+from core.medicao import resumir
+from core.models import Pedido, Prato
+from core.stress import _inicializar
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara a latência das escritas (p50/p95/p99) com e sem o escritor único "
+        "(WRITE_QUEUE_ENABLED): caixas, atendentes, estações e balcão em vários "
+        "processos disputando o mesmo SQLite. Roda em um banco de teste descartável."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processos", type=int, default=2,
+            help="Processos de aplicação (o escritor único é por processo)",
+        )
+        parser.add_argument("--caixas", type=int, default=8, help="Threads por processo")
+        parser.add_argument("--estacoes", type=int, default=12, help="Threads por processo")
+        parser.add_argument("--atendentes", type=int, default=2, help="Threads por processo")
+        parser.add_argument("--balcoes", type=int, default=2, help="Threads por processo")
+        parser.add_argument("--duracao", type=float, default=10.0, help="Segundos por modo")
+        parser.add_argument("--json", action="store_true", help="Saída em JSON")
+
+    def handle(self, *args, **options):
+        # Nunca mexe no banco do evento: cria (e destrói) o banco de teste
+        nome_original = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=False)
+
+        try:
+            relatorio = {
+                modo: self._rodar(ligado, options)
+                for modo, ligado in (("direto", False), ("fila", True))
+            }
+        finally:
+            connection.creation.destroy_test_db(nome_original, verbosity=0)
+
+        if options["json"]:
+            self.stdout.write(json.dumps(relatorio, indent=2))
+            return
+
+        for modo, operacoes in relatorio.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"Modo: {modo} ({options['processos']} processos)"
+            ))
+            for operacao, r in operacoes.items():
+                self.stdout.write(
+                    f"  {operacao:<18} n={r['n']:<6} erros={r['erros']:<4} "
+                    f"p50={r['p50_ms']}ms p95={r['p95_ms']}ms p99={r['p99_ms']}ms max={r['max_ms']}ms"
+                )
+
+    def _rodar(self, ligado, options):
+        Pedido.objects.all().delete()
+        Prato.objects.all().delete()
+        prato_ids = [str(Prato.objects.create(nome=f"Prato {i}", preco="10.00").id) for i in range(4)]
+        nome_banco = str(connection.settings_dict["NAME"])
+        connections.close_all()  # Nada de conexão herdada pelos filhos
+
+        processos = options["processos"]
+        contexto = multiprocessing.get_context()
+        with contexto.Pool(processos, initializer=_inicializar, initargs=(nome_banco,)) as pool:
+            medicoes = pool.map(_processo, [(ligado, options, prato_ids, i) for i in range(processos)])
+
+        latencias, erros = {}, {}
+        for medicao in medicoes:
+            for operacao, valores in medicao["latencias"].items():
+                latencias.setdefault(operacao, []).extend(valores)
+            for operacao, n in medicao["erros"].items():
+                erros[operacao] = erros.get(operacao, 0) + n
+
+        return {
+            operacao: resumir(valores, erros.get(operacao, 0))
+            for operacao, valores in sorted(latencias.items())
+        }
+
+
+def _processo(args):
+    # Um processo de aplicação: as mesmas threads de request que o servidor teria
+    ligado, options, prato_ids, numero = args
+    with override_settings(WRITE_QUEUE_ENABLED=ligado):
+        return _threads_do_processo(options, prato_ids, numero)
+
+
+def _threads_do_processo(options, prato_ids, numero):
+    from core.services import (
+        chamar_proximo_pedido,
+        claim_next,
+        create_order,
+        finalize_prato,
+        registrar_retirada_total_pedido,
+    )
+
+    latencias = {}
+    erros = {}
+    lock = threading.Lock()
+    fim = time.monotonic() + options["duracao"]
+
+    def medir(operacao, funcao, *args):
+        inicio = time.perf_counter()
+        try:
+            return funcao(*args)
+        except Exception:
+            with lock:
+                erros[operacao] = erros.get(operacao, 0) + 1
+        finally:
+            with lock:
+                latencias.setdefault(operacao, []).append(time.perf_counter() - inicio)
+
+    def caixa():
+        while time.monotonic() < fim:
+            itens = [
+                {"prato_id": p, "quantidade": random.randint(1, 3)}
+                for p in random.sample(prato_ids, random.randint(1, 3))
+            ]
+            tipo = random.choice([Pedido.Tipo.NORMAL] * 4 + [Pedido.Tipo.PREFERENCIAL])
+            medir("create_order", create_order, tipo, itens)
+
+    def atendente():
+        while time.monotonic() < fim:
+            if not medir("chamar_proximo", chamar_proximo_pedido):
+                time.sleep(0.05)
+
+    def estacao(n):
+        prato_id = prato_ids[n % len(prato_ids)]
+        while time.monotonic() < fim:
+            item = medir("claim_next", claim_next, prato_id, f"P{numero}E{n}")
+            if item:
+                medir("finalize_prato", finalize_prato, item.id)
+            else:
+                time.sleep(0.05)
+
+    def retirar(pedido_id):
+        try:
+            return registrar_retirada_total_pedido(pedido_id)
+        except ValidationError:
+            return None  # Outro balcão entregou antes: não é erro de escrita
+
+    def balcao():
+        while time.monotonic() < fim:
+            prontos = list(
+                Pedido.objects.filter(status=Pedido.Status.FINALIZADO).values_list("id", flat=True)[:5]
+            )
+            if not prontos:
+                time.sleep(0.05)
+                continue
+            medir("retirada", retirar, random.choice(prontos))
+
+    def executar(alvo, *args):
+        try:
+            alvo(*args)
+        finally:
+            connection.close()
+
+    threads = (
+        [threading.Thread(target=executar, args=(caixa,)) for _ in range(options["caixas"])]
+        + [threading.Thread(target=executar, args=(atendente,)) for _ in range(options["atendentes"])]
+        + [threading.Thread(target=executar, args=(estacao, i)) for i in range(options["estacoes"])]
+        + [threading.Thread(target=executar, args=(balcao,)) for _ in range(options["balcoes"])]
+    )
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    return {"latencias": latencias, "erros": erros}
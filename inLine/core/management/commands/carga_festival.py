@@ -0,0 +1,254 @@
+import json
+import random
+import threading
+import time
+import uuid
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.medicao import resumir
+
+
+# Quantos pratos diferentes cada venda leva (1, 2 ou 3) e quantas unidades de cada
+MIX_PRATOS_POR_VENDA = ((1, 0.5), (2, 0.35), (3, 0.15))
+MIX_QUANTIDADE = ((1, 0.7), (2, 0.25), (3, 0.05))
+
+
+def sortear(pesos):
+    valores, chances = zip(*pesos)
+    return random.choices(valores, weights=chances)[0]
+
+
+class Cliente:
+    """HTTP mínimo (urllib) que mede cada chamada pelo nome da rota."""
+
+    def __init__(self, base, timeout):
+        self.base = base.rstrip("/")
+        self.timeout = timeout
+        self.latencias = {}
+        self.erros = {}
+        self.status = {}
+        self._lock = threading.Lock()
+
+    def chamar(self, rota, metodo, caminho, corpo=None, cabecalhos=None):
+        dados = json.dumps(corpo).encode() if corpo is not None else None
+        req = Request(self.base + caminho, data=dados, method=metodo)
+        req.add_header("Content-Type", "application/json")
+        for nome, valor in (cabecalhos or {}).items():
+            req.add_header(nome, valor)
+
+        codigo, resposta = None, None
+        inicio = time.perf_counter()
+        try:
+            with urlopen(req, timeout=self.timeout) as r:
+                codigo = r.status
+                conteudo = r.read()
+            resposta = json.loads(conteudo) if conteudo else None
+        except HTTPError as e:
+            codigo = e.code
+        except (URLError, OSError, ValueError):
+            codigo = None
+        finally:
+            decorrido = time.perf_counter() - inicio
+            with self._lock:
+                self.latencias.setdefault(rota, []).append(decorrido)
+                contagem = self.status.setdefault(rota, {})
+                contagem[str(codigo)] = contagem.get(str(codigo), 0) + 1
+                if codigo is None or codigo >= 500:
+                    self.erros[rota] = self.erros.get(rota, 0) + 1
+
+        return codigo, resposta
+
+
+class Command(BaseCommand):
+    help = (
+        "Gerador de carga de pico: R caixas, S estações, A atendentes e M monitores "
+        "simultâneos contra as rotas /api/v1 de um servidor rodando. Relatório em JSON "
+        "com vazão e p50/p95/p99 por endpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000", help="Servidor alvo")
+        parser.add_argument("--caixas", type=int, default=6)
+        parser.add_argument("--estacoes", type=int, default=12)
+        parser.add_argument("--atendentes", type=int, default=2)
+        parser.add_argument("--monitores", type=int, default=4)
+        parser.add_argument("--duracao", type=float, default=60.0, help="Segundos de carga")
+        parser.add_argument("--preferencial", type=float, default=0.15, help="Fração de pedidos preferenciais")
+        parser.add_argument("--intervalo-caixa", type=float, default=1.0, help="Pausa média entre vendas (s)")
+        parser.add_argument("--preparo", type=float, default=0.5, help="Tempo médio de preparo por unidade (s)")
+        parser.add_argument("--intervalo-monitor", type=float, default=2.0, help="Polling das telas (s)")
+        parser.add_argument("--criar-pratos", type=int, default=6, help="Pratos criados se o cardápio estiver vazio")
+        parser.add_argument("--timeout", type=float, default=10.0)
+        parser.add_argument("--seed", type=int)
+        parser.add_argument("--saida", help="Grava o relatório JSON neste arquivo")
+
+    def handle(self, *args, **options):
+        if options["seed"] is not None:
+            random.seed(options["seed"])
+
+        cliente = Cliente(options["url"], options["timeout"])
+        pratos = self._cardapio(cliente, options["criar_pratos"])
+
+        # Popularidade desigual (o primeiro prato vende mais): mix de festival
+        pesos_pratos = [1 / (i + 1) for i in range(len(pratos))]
+        # Rotas de preparação (cardápio) não entram no relatório
+        cliente.latencias, cliente.erros, cliente.status = {}, {}, {}
+
+        self.fim = time.monotonic() + options["duracao"]
+        self.opcoes = options
+        self.totais = {"pedidos_criados": 0, "itens_finalizados": 0, "pedidos_retirados": 0}
+        self._lock = threading.Lock()
+        self._liberados = []  # Senhas chamadas pelo atendimento, aguardando retirada
+
+        threads = (
+            [threading.Thread(target=self._caixa, args=(cliente, pratos, pesos_pratos)) for _ in range(options["caixas"])]
+            + [threading.Thread(target=self._estacao, args=(cliente, pratos[i % len(pratos)], i)) for i in range(options["estacoes"])]
+            + [threading.Thread(target=self._atendente, args=(cliente,)) for _ in range(options["atendentes"])]
+            + [threading.Thread(target=self._monitor, args=(cliente,)) for _ in range(options["monitores"])]
+        )
+
+        inicio = time.monotonic()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        duracao = time.monotonic() - inicio
+
+        relatorio = {
+            "url": options["url"],
+            "config": {
+                chave: options[chave]
+                for chave in (
+                    "caixas", "estacoes", "atendentes", "monitores", "duracao",
+                    "preferencial", "intervalo_caixa", "preparo", "intervalo_monitor", "seed",
+                )
+            },
+            "duracao_s": round(duracao, 2),
+            "totais": self.totais,
+            "endpoints": {
+                rota: {**resumir(valores, cliente.erros.get(rota, 0), duracao), "status": cliente.status[rota]}
+                for rota, valores in sorted(cliente.latencias.items())
+            },
+        }
+
+        saida = json.dumps(relatorio, indent=2, ensure_ascii=False)
+        if options["saida"]:
+            with open(options["saida"], "w", encoding="utf-8") as arquivo:
+                arquivo.write(saida)
+            self.stderr.write(f"Relatório gravado em {options['saida']}")
+        self.stdout.write(saida)
+
+    def _rodando(self):
+        return time.monotonic() < self.fim
+
+    def _contar(self, chave):
+        with self._lock:
+            self.totais[chave] += 1
+
+    def _cardapio(self, cliente, criar):
+        codigo, pratos = cliente.chamar("GET /api/v1/pratos/", "GET", "/api/v1/pratos/")
+        if codigo != 200:
+            raise CommandError(f"Servidor não respondeu em {cliente.base} (status {codigo})")
+
+        if not pratos:
+            for i in range(criar):
+                cliente.chamar(
+                    "POST /api/v1/pratos/criar/", "POST", "/api/v1/pratos/criar/",
+                    {"nome": f"Carga {i + 1}", "preco": "15.00"},
+                )
+            _, pratos = cliente.chamar("GET /api/v1/pratos/", "GET", "/api/v1/pratos/")
+
+        if not pratos:
+            raise CommandError("Cardápio vazio: cadastre pratos ou use --criar-pratos")
+        return [p["id"] for p in pratos]
+
+    # -------------------------
+    # PAPÉIS
+    # -------------------------
+
+    def _caixa(self, cliente, pratos, pesos):
+        while self._rodando():
+            quantos = min(sortear(MIX_PRATOS_POR_VENDA), len(pratos))
+            escolhidos = set()
+            while len(escolhidos) < quantos:
+                escolhidos.add(random.choices(pratos, weights=pesos)[0])
+
+            tipo = "PREFERENCIAL" if random.random() < self.opcoes["preferencial"] else "NORMAL"
+            codigo, _ = cliente.chamar(
+                "POST /api/v1/pedidos/criar/", "POST", "/api/v1/pedidos/criar/",
+                {"tipo": tipo, "itens": [{"prato_id": p, "quantidade": sortear(MIX_QUANTIDADE)} for p in escolhidos]},
+                {"Idempotency-Key": uuid.uuid4().hex},
+            )
+            if codigo == 201:
+                self._contar("pedidos_criados")
+
+            time.sleep(random.expovariate(1 / self.opcoes["intervalo_caixa"]))
+
+    def _estacao(self, cliente, prato_id, numero):
+        while self._rodando():
+            codigo, item = cliente.chamar(
+                "POST /api/v1/fila/iniciar/<prato_id>/", "POST", f"/api/v1/fila/iniciar/{prato_id}/",
+                {"estacao": f"CARGA-{numero}"},
+            )
+            if codigo != 200:
+                time.sleep(0.2)
+                continue
+
+            time.sleep(random.expovariate(1 / self.opcoes["preparo"]))
+            codigo, _ = cliente.chamar(
+                "POST /api/v1/fila/finalizar/<id>/", "POST", f"/api/v1/fila/finalizar/{item['fila_id']}/"
+            )
+            if codigo == 200:
+                self._contar("itens_finalizados")
+
+    def _atendente(self, cliente):
+        while self._rodando():
+            codigo, pedido = cliente.chamar("POST /api/v1/fila/proximo/", "POST", "/api/v1/fila/proximo/")
+            if codigo == 200:
+                with self._lock:
+                    self._liberados.append(pedido["senha"])
+
+            # Balcão: o cliente mais antigo chamado volta para retirar
+            with self._lock:
+                senha = self._liberados.pop(0) if self._liberados else None
+            if senha is not None:
+                self._retirar(cliente, senha)
+
+            if codigo != 200:
+                time.sleep(0.2)
+
+    def _retirar(self, cliente, senha):
+        if not str(senha).isdigit():
+            return  # Pedido anterior à senha sequencial
+        codigo, pedido = cliente.chamar(
+            "GET /api/v1/pedidos/senha/<n>/", "GET", f"/api/v1/pedidos/senha/{int(senha)}/"
+        )
+        if codigo != 200:
+            return
+
+        if pedido["status"] != "FINALIZADO":
+            # Ainda em preparo: volta para o fim da fila do balcão
+            with self._lock:
+                self._liberados.append(senha)
+            return
+
+        codigo, _ = cliente.chamar(
+            "POST /api/v1/pedidos/retirar/<id>/", "POST", f"/api/v1/pedidos/retirar/{pedido['pedido_id']}/"
+        )
+        if codigo == 200:
+            self._contar("pedidos_retirados")
+
+    def _monitor(self, cliente):
+        # Telas penduradas no evento: monitor do cliente, painel da cozinha e TMA
+        telas = (
+            ("GET /api/v1/monitor/pedidos/", "/api/v1/monitor/pedidos/"),
+            ("GET /api/v1/fila/painel/", "/api/v1/fila/painel/"),
+            ("GET /api/v1/metrica/tma-dashboard/", "/api/v1/metrica/tma-dashboard/"),
+        )
+        while self._rodando():
+            for rota, caminho in telas:
+                cliente.chamar(rota, "GET", caminho)
+            time.sleep(self.opcoes["intervalo_monitor"])
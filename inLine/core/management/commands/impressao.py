@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from core.logic_printing import processar_pendentes
+from core.models import TrabalhoImpressao
+
+
+class Command(BaseCommand):
+    help = (
+        "Situação da fila de impressão do spooler (por impressora e status), "
+        "reenvio dos trabalhos que esgotaram as tentativas e impressão imediata."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reenviar", action="store_true", help="FALHOU volta para PENDENTE")
+        parser.add_argument("--processar", action="store_true", help="Imprime agora o que estiver pendente")
+        parser.add_argument("--limpar", action="store_true", help="Apaga os trabalhos já impressos")
+
+    def handle(self, *args, **options):
+        if options["reenviar"]:
+            n = TrabalhoImpressao.objects.filter(status=TrabalhoImpressao.Status.FALHOU).update(
+                status=TrabalhoImpressao.Status.PENDENTE, tentativas=0
+            )
+            self.stdout.write(f"{n} trabalhos de volta à fila")
+
+        if options["processar"]:
+            self.stdout.write(f"{processar_pendentes()} trabalhos impressos")
+
+        if options["limpar"]:
+            n, _ = TrabalhoImpressao.objects.filter(status=TrabalhoImpressao.Status.IMPRESSO).delete()
+            self.stdout.write(f"{n} trabalhos impressos removidos")
+
+        self.stdout.write(self.style.MIGRATE_HEADING("Fila de impressão"))
+        linhas = (
+            TrabalhoImpressao.objects.values("impressora", "status")
+            .annotate(n=Count("id"))
+            .order_by("impressora", "status")
+        )
+        if not linhas:
+            self.stdout.write("  (vazia)")
+        for linha in linhas:
+            self.stdout.write(f"  {linha['impressora']:<20} {linha['status']:<12} {linha['n']:>6}")
+
+        falhas = TrabalhoImpressao.objects.filter(
+            status__in=[TrabalhoImpressao.Status.PENDENTE, TrabalhoImpressao.Status.FALHOU], tentativas__gt=0
+        ).order_by("-id")[:5]
+        for t in falhas:
+            self.stdout.write(self.style.WARNING(f"  #{t.id} {t.impressora} ({t.tentativas}x): {t.ultimo_erro}"))
@@ -0,0 +1,86 @@
+import io
+import pstats
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.perfilamento import listar_perfis, pasta_perfis
+
+
+class Command(BaseCommand):
+    help = (
+        "Lista os perfis capturados pelo PerfilamentoMiddleware e resume um deles "
+        "(funções mais caras no pstats e folhas mais amostradas no .folded)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rota", help="Filtra pela rota (trecho)")
+        parser.add_argument("--resumo", metavar="NOME", help="Nome do perfil ou 'ultimo'")
+        parser.add_argument("--top", type=int, default=15, help="Linhas no resumo")
+        parser.add_argument("--limpar", action="store_true", help="Apaga todos os perfis gravados")
+
+    def handle(self, *args, **options):
+        if options["limpar"]:
+            apagados = 0
+            for arquivo in pasta_perfis().glob("*") if pasta_perfis().exists() else []:
+                arquivo.unlink()
+                apagados += 1
+            self.stdout.write(f"{apagados} arquivos removidos de {pasta_perfis()}")
+            return
+
+        perfis = [p for p in listar_perfis() if not options["rota"] or options["rota"] in p["rota"]]
+
+        if options["resumo"]:
+            if options["resumo"] == "ultimo":
+                if not perfis:
+                    raise CommandError("Nenhum perfil gravado")
+                nome = perfis[0]["nome"]
+            else:
+                nome = options["resumo"]
+            return self._resumo(nome, options["top"])
+
+        if not perfis:
+            self.stdout.write(f"Nenhum perfil em {pasta_perfis()}")
+            return
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Perfis em {pasta_perfis()}"))
+        for p in perfis:
+            self.stdout.write(
+                f"  {p['nome']:<70} {p['modo']:<11} {p['duracao_ms']:>9.2f}ms  amostras={p['amostras']}"
+            )
+
+        # Resumo por rota: quantas capturas e a duração média
+        por_rota = {}
+        for p in perfis:
+            por_rota.setdefault(p["rota"], []).append(p["duracao_ms"])
+        self.stdout.write(self.style.MIGRATE_HEADING("Por rota"))
+        for rota, duracoes in sorted(por_rota.items(), key=lambda r: -max(r[1])):
+            self.stdout.write(
+                f"  {rota:<50} n={len(duracoes):<4} media={sum(duracoes) / len(duracoes):.2f}ms "
+                f"max={max(duracoes):.2f}ms"
+            )
+
+    def _resumo(self, nome, top):
+        pasta = pasta_perfis()
+        prof, folded = pasta / f"{nome}.prof", pasta / f"{nome}.folded"
+        if not prof.exists() and not folded.exists():
+            raise CommandError(f"Perfil não encontrado: {nome}")
+
+        if prof.exists():
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{nome}.prof (tempo acumulado)"))
+            saida = io.StringIO()
+            pstats.Stats(str(prof), stream=saida).strip_dirs().sort_stats("cumulative").print_stats(top)
+            self.stdout.write(saida.getvalue())
+
+        if folded.exists():
+            # Folha = função em execução no momento da amostra (tempo próprio)
+            folhas, total = Counter(), 0
+            for linha in folded.read_text(encoding="utf-8").splitlines():
+                pilha, _, n = linha.rpartition(" ")
+                folhas[pilha.rsplit(";", 1)[-1]] += int(n)
+                total += int(n)
+
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{nome}.folded ({total} amostras, tempo próprio)"))
+            for funcao, n in folhas.most_common(top):
+                self.stdout.write(f"  {n / total:6.1%}  {funcao}")
+            self.stdout.write(f"\nFlamegraph: flamegraph.pl {folded} > perfil.svg (ou abra no speedscope.app)")
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+
+class Command(BaseCommand):
+    help = "Mostra o perfil de PRAGMAs do SQLite e os valores efetivos em uma conexão nova."
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Perfil: {settings.SQLITE_PERFIL}"))
+
+        with connection.cursor() as cursor:
+            for nome, esperado in settings.SQLITE_PRAGMAS.items():
+                cursor.execute(f"PRAGMA {nome}")
+                efetivo = cursor.fetchone()[0]
+                self.stdout.write(f"  {nome:<14} configurado={esperado!s:<12} efetivo={efetivo}")
@@ -0,0 +1,63 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core.stress import executar_stress
+
+
+class Command(BaseCommand):
+    help = (
+        "Stress do service layer: vários processos e threads criando, finalizando e "
+        "retirando pedidos no mesmo SQLite. Confere as invariantes e pode servir de "
+        "gate de regressão (--max-p99-ms). Roda em um banco de teste descartável."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processos", type=int, default=4)
+        parser.add_argument("--threads", type=int, default=4, help="Threads por processo")
+        parser.add_argument("--pedidos", type=int, default=200)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--max-p99-ms", type=float, help="Falha se alguma operação passar deste p99")
+        parser.add_argument("--json", action="store_true", help="Saída em JSON")
+
+    def handle(self, *args, **options):
+        # Nunca mexe no banco do evento: cria (e destrói) o banco de teste
+        nome_original = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=False)
+
+        try:
+            relatorio = executar_stress(
+                processos=options["processos"],
+                threads=options["threads"],
+                pedidos=options["pedidos"],
+                semente=options["seed"],
+            )
+        finally:
+            connection.creation.destroy_test_db(nome_original, verbosity=0)
+
+        if options["json"]:
+            self.stdout.write(json.dumps(relatorio, indent=2, ensure_ascii=False))
+        else:
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{relatorio['processos']} processos x {relatorio['threads']} threads, "
+                f"{relatorio['pedidos']} pedidos em {relatorio['duracao_s']}s"
+            ))
+            for operacao, r in relatorio["operacoes"].items():
+                self.stdout.write(
+                    f"  {operacao:<20} n={r['n']:<6} busy={r['sqlite_busy']:<4} tentativas={r['tentativas']:<4} "
+                    f"p50={r['p50_ms']}ms p95={r['p95_ms']}ms p99={r['p99_ms']}ms max={r['max_ms']}ms"
+                )
+
+        falhas = list(relatorio["violacoes"])
+        limite = options["max_p99_ms"]
+        if limite is not None:
+            falhas += [
+                f"{operacao}: p99 {r['p99_ms']}ms acima de {limite}ms"
+                for operacao, r in relatorio["operacoes"].items()
+                if r["p99_ms"] is not None and r["p99_ms"] > limite
+            ]
+
+        if falhas:
+            raise CommandError("Stress reprovado:\n  " + "\n  ".join(falhas))
+        self.stderr.write(self.style.SUCCESS("Invariantes OK"))
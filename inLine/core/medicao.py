@@ -0,0 +1,30 @@
+import statistics
+
+
+# =========================
+# MEDIÇÃO (BENCHMARKS)
+# =========================
+
+def percentil(valores, p):
+    """Percentil `p` (0-100) de latências em segundos, devolvido em ms."""
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, round(p / 100 * (len(ordenados) - 1)))
+    return round(ordenados[indice] * 1000, 2)
+
+
+def resumir(valores, erros=0, duracao=None):
+    """Resumo de uma série de latências (segundos) no formato dos relatórios JSON."""
+    resumo = {
+        "n": len(valores),
+        "erros": erros,
+        "media_ms": round(statistics.mean(valores) * 1000, 2) if valores else None,
+        "p50_ms": percentil(valores, 50),
+        "p95_ms": percentil(valores, 95),
+        "p99_ms": percentil(valores, 99),
+        "max_ms": round(max(valores) * 1000, 2) if valores else None,
+    }
+    if duracao:
+        resumo["por_segundo"] = round(len(valores) / duracao, 2)
+    return resumo
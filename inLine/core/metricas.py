@@ -0,0 +1,278 @@
+import bisect
+import threading
+import time
+
+from django.utils.dateparse import parse_datetime
+
+from .events import bus
+
+
+# =========================
+# MÉTRICAS (FORMATO PROMETHEUS)
+# =========================
+
+BUCKETS_HTTP = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _rotulos(nomes, valores, extra=()):
+    pares = list(zip(nomes, valores)) + list(extra)
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{n}="{_escapar(v)}"' for n, v in pares) + "}"
+
+
+class _Metrica:
+    tipo = None
+
+    def __init__(self, nome, ajuda, rotulos=()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def _chave(self, rotulos):
+        return tuple(str(rotulos[n]) for n in self.rotulos)
+
+    def cabecalho(self):
+        return [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} {self.tipo}"]
+
+    def exportar(self):
+        with self._lock:
+            valores = dict(self._valores)
+        return self.cabecalho() + [
+            f"{self.nome}{_rotulos(self.rotulos, chave)} {valor}" for chave, valor in sorted(valores.items())
+        ]
+
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def inc(self, valor=1, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+
+class Medidor(_Metrica):
+    """Gauge: valor que sobe e desce (profundidade de fila, itens em produção...)."""
+
+    tipo = "gauge"
+
+    def inc(self, valor=1, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            # Nunca negativo: um evento perdido não pode deixar a fila "devendo"
+            self._valores[chave] = max(0, self._valores.get(chave, 0) + valor)
+
+    def dec(self, valor=1, **rotulos):
+        self.inc(-valor, **rotulos)
+
+    def definir(self, valores):
+        """Substitui todos os valores ({tupla de rótulos: valor})."""
+        with self._lock:
+            self._valores = dict(valores)
+
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nome, ajuda, rotulos=(), buckets=BUCKETS_HTTP):
+        super().__init__(nome, ajuda, rotulos)
+        self.buckets = tuple(buckets)
+
+    def observar(self, valor, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            serie = self._valores.get(chave)
+            if serie is None:
+                serie = self._valores[chave] = {"contagens": [0] * (len(self.buckets) + 1), "soma": 0.0}
+            serie["contagens"][bisect.bisect_left(self.buckets, valor)] += 1
+            serie["soma"] += valor
+
+    def exportar(self):
+        with self._lock:
+            series = {chave: {"contagens": list(s["contagens"]), "soma": s["soma"]} for chave, s in self._valores.items()}
+
+        linhas = self.cabecalho()
+        for chave, serie in sorted(series.items()):
+            acumulado = 0
+            for limite, contagem in zip(self.buckets + ("+Inf",), serie["contagens"]):
+                acumulado += contagem
+                linhas.append(f"{self.nome}_bucket{_rotulos(self.rotulos, chave, [('le', limite)])} {acumulado}")
+            linhas.append(f"{self.nome}_sum{_rotulos(self.rotulos, chave)} {serie['soma']:.6f}")
+            linhas.append(f"{self.nome}_count{_rotulos(self.rotulos, chave)} {acumulado}")
+        return linhas
+
+
+# -------------------------
+# MÉTRICAS DO SISTEMA
+# -------------------------
+
+pedidos_criados = Contador("inline_pedidos_criados_total", "Pedidos criados no caixa.", ["tipo"])
+pedidos_liberados = Contador("inline_pedidos_liberados_total", "Pedidos liberados para a cozinha.", ["tipo"])
+pedidos_retirados = Contador("inline_pedidos_retirados_total", "Pedidos entregues no balcão.")
+itens_iniciados = Contador("inline_itens_iniciados_total", "Unidades puxadas por uma estação.", ["prato_id"])
+itens_finalizados = Contador("inline_itens_finalizados_total", "Unidades finalizadas pela cozinha.", ["prato_id"])
+
+fila_pendente = Medidor("inline_fila_pendente", "Unidades aguardando produção, por prato.", ["prato_id"])
+itens_em_producao = Medidor("inline_itens_em_producao", "Unidades em produção, por prato.", ["prato_id"])
+pedidos_abertos = Medidor("inline_pedidos_abertos", "Pedidos ainda não finalizados.", ["status"])
+pedido_mais_antigo = Medidor(
+    "inline_pedido_aberto_mais_antigo_segundos", "Idade do pedido aberto mais antigo.", ["status"]
+)
+prato_info = Medidor("inline_prato_info", "Nome de cada prato (para juntar com prato_id).", ["prato_id", "prato"])
+
+http_duracao = Histograma(
+    "inline_http_request_duracao_segundos", "Duração dos requests por rota.", ["rota", "status"]
+)
+http_db = Histograma("inline_http_db_segundos", "Tempo de banco por request, por rota.", ["rota"])
+
+REGISTRO = (
+    pedidos_criados, pedidos_liberados, pedidos_retirados, itens_iniciados, itens_finalizados,
+    fila_pendente, itens_em_producao, pedidos_abertos, pedido_mais_antigo, prato_info,
+    http_duracao, http_db,
+)
+
+
+# -------------------------
+# ESTADO ALIMENTADO PELOS EVENTOS
+# -------------------------
+
+class _PedidosAbertos:
+    """pedido_id -> (status, criado_em) dos pedidos não finalizados, só em memória."""
+
+    def __init__(self):
+        self._pedidos = {}
+        self._lock = threading.Lock()
+        self.carregado = False
+
+    def carregar(self, pedidos):
+        with self._lock:
+            self._pedidos = dict(pedidos)
+            self.carregado = True
+
+    def abrir(self, pedido_id, criado_em):
+        with self._lock:
+            self._pedidos[pedido_id] = ("PENDENTE", criado_em)
+
+    def liberar(self, pedido_id):
+        with self._lock:
+            if pedido_id in self._pedidos:
+                self._pedidos[pedido_id] = ("PRODUCAO", self._pedidos[pedido_id][1])
+
+    def fechar(self, pedido_id):
+        with self._lock:
+            self._pedidos.pop(pedido_id, None)
+
+    def atualizar_medidores(self):
+        agora = time.time()
+        contagem, mais_antigo = {}, {}
+        with self._lock:
+            for status, criado_em in self._pedidos.values():
+                contagem[(status,)] = contagem.get((status,), 0) + 1
+                mais_antigo[(status,)] = max(mais_antigo.get((status,), 0), agora - criado_em)
+        for status in ("PENDENTE", "PRODUCAO"):
+            contagem.setdefault((status,), 0)
+            mais_antigo.setdefault((status,), 0)
+        pedidos_abertos.definir(contagem)
+        pedido_mais_antigo.definir({k: round(v, 1) for k, v in mais_antigo.items()})
+
+
+abertos = _PedidosAbertos()
+
+
+def _timestamp(valor):
+    data = parse_datetime(valor) if isinstance(valor, str) else None
+    return data.timestamp() if data else time.time()
+
+
+def _ao_evento(evento):
+    tipo, dados = evento["tipo"], evento["dados"]
+
+    if tipo == "pedido_criado":
+        pedidos_criados.inc(tipo=dados.get("tipo"))
+        for prato_id, quantidade in (dados.get("itens") or {}).items():
+            fila_pendente.inc(quantidade, prato_id=prato_id)
+        abertos.abrir(dados["pedido_id"], _timestamp(dados.get("criado_em")))
+
+    elif tipo == "pedido_liberado":
+        pedidos_liberados.inc(tipo=dados.get("tipo"))
+        abertos.liberar(dados["pedido_id"])
+
+    elif tipo == "item_iniciado":
+        itens_iniciados.inc(prato_id=dados["prato_id"])
+        fila_pendente.dec(prato_id=dados["prato_id"])
+        itens_em_producao.inc(prato_id=dados["prato_id"])
+
+    elif tipo == "item_finalizado":
+        itens_finalizados.inc(prato_id=dados["prato_id"])
+        if dados.get("status_anterior") == "EM_PRODUCAO":
+            itens_em_producao.dec(prato_id=dados["prato_id"])
+        else:
+            fila_pendente.dec(prato_id=dados["prato_id"])
+        if dados.get("pedido_finalizado"):
+            abertos.fechar(dados["pedido_id"])
+
+    elif tipo == "pedido_retirado":
+        pedidos_retirados.inc()
+        abertos.fechar(dados["pedido_id"])
+
+
+bus.assinar(_ao_evento)
+
+
+def observar_request(rota, status, total_seg, db_seg):
+    """Chamado pelo InstrumentacaoSQLMiddleware ao fim de cada request."""
+    http_duracao.observar(total_seg, rota=rota, status=status)
+    http_db.observar(db_seg, rota=rota)
+
+
+# -------------------------
+# EXPOSIÇÃO
+# -------------------------
+
+def _carregar_estado_inicial():
+    """
+    Uma única vez por processo (primeiro scrape): o que já estava em aberto
+    antes de o servidor subir. Daí em diante só os eventos mexem nos medidores.
+    """
+    from django.db.models import Count
+
+    from .models import FilaPrato, Pedido
+
+    em_aberto = FilaPrato.objects.filter(
+        status__in=[FilaPrato.Status.PENDENTE, FilaPrato.Status.EM_PRODUCAO]
+    ).values_list("prato_id", "status").annotate(n=Count("id")).order_by()
+
+    pendentes, producao = {}, {}
+    for prato_id, status, n in em_aberto:
+        destino = pendentes if status == FilaPrato.Status.PENDENTE else producao
+        destino[(str(prato_id),)] = n
+    fila_pendente.definir(pendentes)
+    itens_em_producao.definir(producao)
+
+    abertos.carregar({
+        str(pedido_id): (status, criado_em.timestamp())
+        for pedido_id, status, criado_em in Pedido.objects.filter(
+            status__in=[Pedido.Status.PENDENTE, Pedido.Status.PRODUCAO]
+        ).values_list("id", "status", "created_at")
+    })
+
+
+def exportar():
+    from .models import Prato
+
+    if not abertos.carregado:
+        _carregar_estado_inicial()
+    abertos.atualizar_medidores()
+    prato_info.definir({(str(i), nome): 1 for i, nome in Prato.objects.values_list("id", "nome")})
+
+    linhas = []
+    for metrica in REGISTRO:
+        linhas.extend(metrica.exportar())
+    return "\n".join(linhas) + "\n"
@@ -1,7 +1,15 @@
 import datetime
+import time
+from contextlib import ExitStack
 from django.conf import settings
+from django.db import connections
 from django.http import JsonResponse
 from django.core.exceptions import PermissionDenied
+from django.urls import Resolver404, resolve
+
+from .instrumentacao import MedicaoSQL, agregador, requisicao_da_lan
+from .metricas import observar_request
+from .perfilamento import MODOS, perfilar
 
 class LicensingMiddleware:
     """
@@ -45,3 +53,85 @@ class LicensingMiddleware:
             return False
 
         return True
+
+
+class InstrumentacaoSQLMiddleware:
+    """
+    Conta as consultas SQL, o tempo de banco e a consulta mais lenta de cada
+    request. Devolve no cabeçalho Server-Timing (visível no DevTools) e
+    acumula por rota em core.instrumentacao.agregador. Mutações executadas
+    pelo escritor único (WRITE_QUEUE_ENABLED) rodam em outra thread e não
+    entram na conta do request.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'INSTRUMENTACAO_SQL', True):
+            return self.get_response(request)
+
+        medicao = MedicaoSQL()
+        inicio = time.perf_counter()
+
+        # Todas as conexões (default e leitura) desta thread passam pelo medidor
+        with ExitStack() as pilha:
+            for alias in connections:
+                pilha.enter_context(connections[alias].execute_wrapper(medicao))
+            response = self.get_response(request)
+
+        total = time.perf_counter() - inicio
+
+        metricas = [
+            f'sql;dur={medicao.db_seg * 1000:.2f};desc="{medicao.consultas} consultas"',
+            f'app;dur={total * 1000:.2f}',
+        ]
+        if medicao.mais_lenta:
+            metricas.insert(1, f'sql-max;dur={medicao.mais_lenta[0] * 1000:.2f}')
+        if response.has_header('Server-Timing'):
+            metricas.insert(0, response['Server-Timing'])
+        response['Server-Timing'] = ', '.join(metricas)
+
+        # Agrega pelo padrão da rota (sem IDs), ex.: "POST /api/v1/fila/finalizar/<uuid:id>/"
+        match = getattr(request, 'resolver_match', None)
+        rota = f"{request.method} /{match.route}" if match else f"{request.method} sem-rota"
+        agregador.registrar(rota, medicao, total, response.status_code)
+        observar_request(rota, response.status_code, total, medicao.db_seg)
+
+        return response
+
+
+class PerfilamentoMiddleware:
+    """
+    Perfila UM request sob demanda: cabeçalho "X-Inline-Perfil: cprofile"
+    (ou "amostragem") ou ?_perfil=cprofile. Com PERFILAMENTO_ATIVO, só atende
+    usuário staff (ou a rede local, se PERFILAMENTO_LAN); fora disso o pedido
+    de perfil é ignorado. O nome do perfil gravado volta no cabeçalho
+    X-Inline-Perfil (manage.py perfis para listar).
+    """
+    CABECALHO = 'HTTP_X_INLINE_PERFIL'
+    PARAMETRO = '_perfil'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        modo = request.META.get(self.CABECALHO) or request.GET.get(self.PARAMETRO)
+
+        if not modo or not getattr(settings, 'PERFILAMENTO_ATIVO', False):
+            return self.get_response(request)
+
+        # cProfile pesa no processo inteiro: qualquer celular na rede do evento não pode ligar
+        usuario = getattr(request, 'user', None)
+        lan_liberada = getattr(settings, 'PERFILAMENTO_LAN', False) and requisicao_da_lan(request)
+        if not (lan_liberada or getattr(usuario, 'is_staff', False)):
+            return self.get_response(request)
+
+        modo = modo if modo in MODOS else 'cprofile'
+        try:
+            rota = f"{request.method} /{resolve(request.path_info).route}"
+        except Resolver404:
+            rota = f"{request.method} {request.path_info}"
+
+        response, nome = perfilar(modo, rota, lambda: self.get_response(request))
+        response['X-Inline-Perfil'] = nome or 'ocupado'  # Outro perfil em andamento
+        return response
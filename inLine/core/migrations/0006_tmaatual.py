@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def preencher_tma_atual(apps, schema_editor):
+    # Materializa o último (e o penúltimo) TMA já calculado de cada prato
+    TMA = apps.get_model("core", "TMA")
+    TMAAtual = apps.get_model("core", "TMAAtual")
+
+    ultimos = {}
+    for prato_id, valor in TMA.objects.order_by(
+        "prato_id", "-calculado_em"
+    ).values_list("prato_id", "valor_tma_seg"):
+        ultimos.setdefault(prato_id, []).append(valor)
+
+    TMAAtual.objects.bulk_create(
+        [
+            TMAAtual(
+                prato_id=prato_id,
+                valor_tma_seg=valores[0],
+                valor_anterior_seg=valores[1] if len(valores) > 1 else None,
+            )
+            for prato_id, valores in ultimos.items()
+        ]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0005_filaprato_delivered_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TMAAtual",
+            fields=[
+                (
+                    "prato",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="tma_atual",
+                        serialize=False,
+                        to="core.prato",
+                    ),
+                ),
+                ("valor_tma_seg", models.FloatField()),
+                ("valor_anterior_seg", models.FloatField(blank=True, null=True)),
+                ("atualizado_em", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "TMA Atual",
+            },
+        ),
+        migrations.RunPython(preencher_tma_atual, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0006_tmaatual"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="pedido",
+            index=models.Index(
+                fields=["status", "created_at"], name="idx_pedido_status_criacao"
+            ),
+        ),
+    ]
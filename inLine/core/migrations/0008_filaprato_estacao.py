@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0007_pedido_idx_status_criacao"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="filaprato",
+            name="estacao",
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+    ]
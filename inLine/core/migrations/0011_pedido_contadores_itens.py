@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:19
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def preencher_contadores(apps, schema_editor):
+    # Um UPDATE só: conta as filas de cada pedido com subqueries correlacionadas
+    Pedido = apps.get_model("core", "Pedido")
+    FilaPrato = apps.get_model("core", "FilaPrato")
+
+    def contagem(filtro=Q()):
+        return Coalesce(
+            Subquery(
+                FilaPrato.objects.filter(filtro, pedido_id=OuterRef("pk"))
+                .values("pedido_id")
+                .annotate(n=Count("id"))
+                .values("n")
+            ),
+            Value(0),
+        )
+
+    Pedido.objects.update(
+        itens_total=contagem(),
+        itens_prontos=contagem(Q(status__in=["FINALIZADO", "RETIRADO"])),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0010_created_at_preserva_horario"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="pedido",
+            name="itens_prontos",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="pedido",
+            name="itens_total",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(preencher_contadores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:21
+
+import core.models
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def numerar_pedidos_existentes(apps, schema_editor):
+    # Numera o que já existe na ordem de criação, no evento de cada pedido
+    Pedido = apps.get_model("core", "Pedido")
+
+    ultimas = {}
+    pedidos = list(Pedido.objects.order_by("created_at").only("id", "created_at"))
+    for pedido in pedidos:
+        pedido.evento = settings.EVENTO or timezone.localdate(pedido.created_at).isoformat()
+        ultimas[pedido.evento] = ultimas.get(pedido.evento, 0) + 1
+        pedido.senha = ultimas[pedido.evento]
+
+    Pedido.objects.bulk_update(pedidos, ["evento", "senha"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0011_pedido_contadores_itens"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="pedido",
+            name="evento",
+            field=models.CharField(default=core.models.evento_atual, max_length=30),
+        ),
+        migrations.AddField(
+            model_name="pedido",
+            name="senha",
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.RunPython(numerar_pedidos_existentes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="pedido",
+            constraint=models.UniqueConstraint(
+                fields=("evento", "senha"), name="uniq_pedido_evento_senha"
+            ),
+        ),
+    ]
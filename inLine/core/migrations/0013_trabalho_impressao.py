@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:30
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0012_pedido_senha_sequencial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TrabalhoImpressao",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "tipo",
+                    models.CharField(
+                        choices=[("SENHA", "Senha"), ("COMANDA", "Comanda")],
+                        max_length=10,
+                    ),
+                ),
+                ("impressora", models.CharField(max_length=50)),
+                ("pedido_id", models.UUIDField(db_index=True, null=True)),
+                ("dados", models.JSONField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("PENDENTE", "Pendente"),
+                            ("IMPRIMINDO", "Imprimindo"),
+                            ("IMPRESSO", "Impresso"),
+                            ("FALHOU", "Falhou"),
+                        ],
+                        default="PENDENTE",
+                        max_length=10,
+                    ),
+                ),
+                ("tentativas", models.PositiveIntegerField(default=0)),
+                (
+                    "proxima_tentativa",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                ("ultimo_erro", models.TextField(blank=True, default="")),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("impresso_em", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "verbose_name": "Trabalho de impressão",
+                "indexes": [
+                    models.Index(
+                        fields=["status", "proxima_tentativa"],
+                        name="idx_impressao_fila",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:32
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def preencher_prioridade(apps, schema_editor):
+    # Pedido: 0 para preferencial; as filas copiam só de pedidos já liberados
+    Pedido = apps.get_model("core", "Pedido")
+    FilaPrato = apps.get_model("core", "FilaPrato")
+
+    Pedido.objects.filter(tipo="PREFERENCIAL").update(prioridade=0)
+    FilaPrato.objects.exclude(pedido__status="PENDENTE").update(
+        prioridade=Subquery(
+            Pedido.objects.filter(pk=OuterRef("pedido_id")).values("prioridade")
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0013_trabalho_impressao"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="filaprato",
+            name="core_filapr_prato_i_84c208_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="filaprato",
+            name="idx_fila_prioridade",
+        ),
+        migrations.RemoveIndex(
+            model_name="pedido",
+            name="core_pedido_status_761608_idx",
+        ),
+        migrations.AddField(
+            model_name="filaprato",
+            name="prioridade",
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="pedido",
+            name="prioridade",
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+        migrations.RunPython(preencher_prioridade, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="filaprato",
+            index=models.Index(
+                fields=["prato", "status", "prioridade", "created_at"],
+                name="idx_fila_prato_prioridade",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="filaprato",
+            index=models.Index(
+                fields=["status", "prioridade", "created_at"],
+                name="idx_fila_status_prioridade",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="pedido",
+            index=models.Index(
+                fields=["status", "prioridade", "created_at"], name="idx_pedido_fila"
+            ),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0014_prioridade_gravada"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="filaprato",
+            name="idx_fila_prato_prioridade",
+        ),
+        migrations.RemoveIndex(
+            model_name="filaprato",
+            name="idx_fila_status_prioridade",
+        ),
+        migrations.AddIndex(
+            model_name="filaprato",
+            index=models.Index(
+                fields=["prato", "status", "prioridade", "created_at", "id"],
+                name="idx_fila_prato_prioridade",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="filaprato",
+            index=models.Index(
+                fields=["status", "prioridade", "created_at", "id"],
+                name="idx_fila_status_prioridade",
+            ),
+        ),
+    ]
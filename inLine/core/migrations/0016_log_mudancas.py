@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:42
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0015_indice_cursor_painel"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RegistroMudanca",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("tipo", models.CharField(max_length=30)),
+                ("dados", models.JSONField()),
+                (
+                    "criado_em",
+                    models.DateTimeField(
+                        db_index=True, default=django.utils.timezone.now
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Registro de mudança",
+            },
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:54
+
+import sqlite3
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def iniciar_contadores(apps, schema_editor):
+    # Parte do maior número já entregue em cada evento, no banco vivo E no
+    # arquivo (pedidos retirados que o fechamento do dia já moveu)
+    Pedido = apps.get_model("core", "Pedido")
+    ContadorSenha = apps.get_model("core", "ContadorSenha")
+
+    ultimas = dict(
+        Pedido.objects.exclude(senha=None)
+        .values("evento")
+        .annotate(m=models.Max("senha"))
+        .values_list("evento", "m")
+    )
+
+    if settings.ARQUIVO_DB_PATH.exists():
+        arquivo = sqlite3.connect(f"file:{settings.ARQUIVO_DB_PATH}?mode=ro", uri=True)
+        try:
+            linhas = arquivo.execute(
+                f'SELECT evento, MAX(senha) FROM "{Pedido._meta.db_table}" '
+                "WHERE senha IS NOT NULL GROUP BY evento"
+            ).fetchall()
+        except sqlite3.OperationalError:
+            linhas = []  # Arquivo sem pedidos (ou anterior às senhas)
+        finally:
+            arquivo.close()
+        for evento, maximo in linhas:
+            ultimas[evento] = max(ultimas.get(evento, 0), maximo)
+
+    ContadorSenha.objects.bulk_create(
+        [ContadorSenha(evento=evento, ultima=ultima) for evento, ultima in ultimas.items()]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0016_log_mudancas"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ContadorSenha",
+            fields=[
+                (
+                    "evento",
+                    models.CharField(max_length=30, primary_key=True, serialize=False),
+                ),
+                ("ultima", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(iniciar_contadores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0017_contador_senha"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chaveidempotencia",
+            name="assinatura",
+            field=models.CharField(blank=True, default="", max_length=64),
+        ),
+    ]
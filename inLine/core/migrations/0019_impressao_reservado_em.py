@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0018_chave_assinatura"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="trabalhoimpressao",
+            name="reservado_em",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
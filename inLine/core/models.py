@@ -1,5 +1,7 @@
 import uuid
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
 
 
 
@@ -7,6 +9,10 @@ from django.db import models
 # PEDIDO (CAIXA)
 # =========================
 
+def evento_atual():
+    # Numeração das senhas: settings.EVENTO fixo ou, por padrão, um "evento" por dia
+    return settings.EVENTO or timezone.localdate().isoformat()
+
 class Pedido(models.Model):
 
     class Tipo(models.TextChoices):
@@ -23,13 +29,63 @@ class Pedido(models.Model):
     tipo = models.CharField(max_length=20, choices=Tipo.choices, db_index=True)
     status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDENTE, db_index=True)
     total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
-    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    # Não é auto_now_add: pedidos sincronizados do caixa offline mantêm o horário original
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    # Progresso desnormalizado: mantido pelo service layer (create_order /
+    # finalize), evita contar as filas do pedido a cada finalização/retirada
+    itens_total = models.PositiveIntegerField(default=0)
+    itens_prontos = models.PositiveIntegerField(default=0)
+
+    # Senha do cliente: sequencial dentro do evento (alocada no create_order)
+    evento = models.CharField(max_length=30, default=evento_atual)
+    senha = models.PositiveIntegerField(null=True)
+
+    # Ordem da fila gravada (0 = preferencial, 1 = normal): o ORDER BY usa o
+    # índice em vez de ordenar um CASE sobre todos os pendentes
+    prioridade = models.PositiveSmallIntegerField(default=1)
 
     class Meta:
         indexes = [
-            models.Index(fields=["status", "tipo", "created_at"]),
+            models.Index(fields=["status", "prioridade", "created_at"], name="idx_pedido_fila"),
+            models.Index(fields=["status", "created_at"], name="idx_pedido_status_criacao"),
+        ]
+        constraints = [
+            # Também é o índice da busca no balcão por senha
+            models.UniqueConstraint(fields=["evento", "senha"], name="uniq_pedido_evento_senha"),
         ]
 
+    @classmethod
+    def prioridade_do_tipo(cls, tipo):
+        return 0 if tipo == cls.Tipo.PREFERENCIAL else 1
+
+    @staticmethod
+    def formatar_senha(senha, pedido_id):
+        # Pedidos anteriores à numeração sequencial mantêm o prefixo do UUID
+        if senha is None:
+            return str(pedido_id)[:4].upper()
+        return f"{senha:03d}"
+
+    @property
+    def senha_exibicao(self):
+        return self.formatar_senha(self.senha, self.id)
+
+class ContadorSenha(models.Model):
+    # Última senha entregue por evento. Não dá para usar MAX(senha) dos pedidos:
+    # o arquivamento apaga os retirados e os números voltariam a sair
+    evento = models.CharField(max_length=30, primary_key=True)
+    ultima = models.PositiveIntegerField(default=0)
+
+
+class ChaveIdempotencia(models.Model):
+    # Chave enviada pelo caixa: a repetição do mesmo envio devolve o pedido original
+    chave = models.CharField(max_length=64, unique=True)
+    pedido = models.ForeignKey(Pedido, on_delete=models.CASCADE, related_name="chaves_idempotencia")
+    # Resumo do corpo (tipo + itens): a mesma chave com outro pedido é recusada.
+    # Vazio nas chaves gravadas antes deste campo (não há com o que comparar)
+    assinatura = models.CharField(max_length=64, blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+
 # =========================
 # PRATO (CATÁLOGO)
 # =========================
@@ -66,15 +122,20 @@ class FilaPrato(models.Model):
     started_at = models.DateTimeField(null=True, blank=True, db_index=True )
     finished_at = models.DateTimeField(null=True, blank=True, db_index=True)
     usado_em_metrica = models.BooleanField(default=False, db_index=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
     delivered_at = models.DateTimeField(null=True, blank=True)
+    estacao = models.CharField(max_length=50, null=True, blank=True)  # Estação que pegou o item
+    # Cópia da prioridade do pedido, gravada quando o atendimento o libera:
+    # NULL = pedido ainda não liberado. Painel e estação não precisam do JOIN
+    prioridade = models.PositiveSmallIntegerField(null=True, blank=True)
 
     class Meta:
         indexes = [
-            models.Index(fields=["prato", "status", "created_at"]),
+            # O id fecha a ordem do painel (desempate do cursor) dentro do índice
+            models.Index(fields=["prato", "status", "prioridade", "created_at", "id"], name="idx_fila_prato_prioridade"),
             models.Index(fields=["status"]),
-            models.Index(fields=["status", "created_at"], name="idx_fila_prioridade"),
+            models.Index(fields=["status", "prioridade", "created_at", "id"], name="idx_fila_status_prioridade"),
             models.Index(fields=["created_at"]),
             models.Index(fields=["usado_em_metrica", "status", "finished_at"]),
         ]
@@ -97,3 +158,92 @@ class TMA(models.Model):
         verbose_name = "Métrica TMA"
         ordering = ['-calculado_em']
 
+
+
+class TMAAtual(models.Model):
+    # Uma linha por prato: o último TMA calculado e o anterior (tendência)
+    # Mantida pelo service junto com cada novo registro de TMA.
+
+    class Tendencia(models.TextChoices):
+        SUBINDO = "SUBINDO"
+        CAINDO = "CAINDO"
+        ESTAVEL = "ESTAVEL"
+
+    # Variação mínima (fração) para considerar que o TMA mudou de patamar
+    TOLERANCIA_TENDENCIA = 0.05
+
+    prato = models.OneToOneField(Prato, on_delete=models.CASCADE, primary_key=True, related_name="tma_atual")
+    valor_tma_seg = models.FloatField()
+    valor_anterior_seg = models.FloatField(null=True, blank=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "TMA Atual"
+
+    @classmethod
+    def calcular_tendencia(cls, atual, anterior):
+        if not anterior or atual is None:
+            return cls.Tendencia.ESTAVEL
+        variacao = (atual - anterior) / anterior
+        if variacao > cls.TOLERANCIA_TENDENCIA:
+            return cls.Tendencia.SUBINDO
+        if variacao < -cls.TOLERANCIA_TENDENCIA:
+            return cls.Tendencia.CAINDO
+        return cls.Tendencia.ESTAVEL
+
+    @property
+    def tendencia(self):
+        return self.calcular_tendencia(self.valor_tma_seg, self.valor_anterior_seg)
+
+
+# =========================
+# IMPRESSÃO (SPOOLER)
+# =========================
+
+class TrabalhoImpressao(models.Model):
+    # Fila persistente do spooler: sobrevive a restart e a impressora travada
+
+    class Tipo(models.TextChoices):
+        SENHA = "SENHA"        # Cupom do cliente
+        COMANDA = "COMANDA"    # Via da cozinha, uma por prato
+
+    class Status(models.TextChoices):
+        PENDENTE = "PENDENTE"
+        IMPRIMINDO = "IMPRIMINDO"
+        IMPRESSO = "IMPRESSO"
+        FALHOU = "FALHOU"      # Esgotou as tentativas: só volta com reenvio manual
+
+    tipo = models.CharField(max_length=10, choices=Tipo.choices)
+    impressora = models.CharField(max_length=50)
+    # Sem FK: o arquivamento apaga pedidos retirados com SQL direto
+    pedido_id = models.UUIDField(null=True, db_index=True)
+    dados = models.JSONField()
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDENTE)
+    tentativas = models.PositiveIntegerField(default=0)
+    proxima_tentativa = models.DateTimeField(default=timezone.now)
+    # Quando passou a IMPRIMINDO: só reserva velha (processo que caiu) volta para a fila
+    reservado_em = models.DateTimeField(null=True, blank=True)
+    ultimo_erro = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    impresso_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Trabalho de impressão"
+        indexes = [
+            models.Index(fields=["status", "proxima_tentativa"], name="idx_impressao_fila"),
+        ]
+
+
+# =========================
+# LOG DE MUDANÇAS
+# =========================
+
+class RegistroMudanca(models.Model):
+    # Só cresce: o id (AUTOINCREMENT no SQLite) é o número de sequência do log
+    id = models.BigAutoField(primary_key=True)
+    tipo = models.CharField(max_length=30)
+    dados = models.JSONField()
+    criado_em = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        verbose_name = "Registro de mudança"
@@ -0,0 +1,72 @@
+from django.db import connections, transaction
+
+from .cache_versoes import versoes
+from .events import bus
+from .models import RegistroMudanca
+
+
+# =========================
+# LOG DE MUDANÇAS (APPEND-ONLY)
+# =========================
+# Cada mutação dos services grava suas mudanças aqui, na MESMA transação:
+# ou o pedido muda e o log registra, ou nenhum dos dois. O id é a sequência
+# do log; com um único escritor no SQLite (serializar_escrita + lock do
+# banco) a ordem de commit é a ordem dos ids, então quem leu até N nunca
+# vê depois um N-1 aparecer.
+
+
+def registrar_mudancas(mudancas):
+    """
+    Grava [(tipo, dados), ...] num único INSERT e agenda para depois do
+    COMMIT a publicação no barramento (com o `seq` de cada registro nos
+    dados) e a nova versão da fila para o cache de respostas.
+    """
+    if not mudancas:
+        return []
+
+    registros = RegistroMudanca.objects.bulk_create(
+        [RegistroMudanca(tipo=tipo, dados=dados) for tipo, dados in mudancas]
+    )
+
+    def publicar():
+        for registro in registros:
+            bus.publicar(registro.tipo, seq=registro.id, **registro.dados)
+        # Depois dos ouvintes (fila em memória já atualizada): caches da fila vencem
+        versoes.incrementar("fila")
+
+    transaction.on_commit(publicar)
+    return registros
+
+
+def registrar_mudanca(tipo, /, **dados):
+    """Atalho para uma mudança só (mesma assinatura de publicar_apos_commit)."""
+    return registrar_mudancas([(tipo, dados)])[0]
+
+
+def ultima_sequencia(using="default"):
+    """
+    Último seq já atribuído. Vem do sqlite_sequence (AUTOINCREMENT), que não
+    volta atrás quando a compactação apaga as linhas mais novas que sobraram.
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "SELECT seq FROM sqlite_sequence WHERE name = %s", [RegistroMudanca._meta.db_table]
+        )
+        linha = cursor.fetchone()
+    return linha[0] if linha else 0
+
+
+def listar_mudancas(desde, limite):
+    """
+    Até `limite` registros com seq > desde, em ordem (busca pela chave
+    primária). Retorna (registros, atual) ou None se registros posteriores a
+    `desde` já foram compactados: o cliente precisa recarregar o estado inteiro.
+    """
+    atual = ultima_sequencia(RegistroMudanca.objects.db)
+    registros = list(RegistroMudanca.objects.filter(id__gt=desde).order_by("id")[:limite])
+
+    # O primeiro registro disponível tem que ser exatamente o seguinte ao do cliente
+    primeiro = registros[0].id if registros else atual + 1
+    if desde > atual or primeiro > desde + 1:
+        return None  # Compactado (ou seq de outro banco, ex.: base recriada)
+    return registros, atual
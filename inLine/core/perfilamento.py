@@ -0,0 +1,141 @@
+import cProfile
+import glob
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+
+
+# =========================
+# PERFILAMENTO SOB DEMANDA
+# =========================
+
+MODOS = ("cprofile", "amostragem")
+
+# Um perfil por vez: o cProfile é global ao interpretador
+_em_uso = threading.Lock()
+
+
+def pasta_perfis():
+    return Path(getattr(settings, "PERFIS_DIR", settings.BASE_DIR / "perfis"))
+
+
+class Amostrador:
+    """
+    Amostrador de pilha de UMA thread (a do request): a cada intervalo lê o
+    frame atual via sys._current_frames() e conta a pilha no formato
+    "collapsed" (raiz;...;folha N), pronto para flamegraph.pl / speedscope.
+    """
+
+    def __init__(self, thread_id, intervalo):
+        self.thread_id = thread_id
+        self.intervalo = intervalo
+        self.pilhas = Counter()
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="perfil-amostrador", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._parar.set()
+        self._thread.join()
+
+    def _loop(self):
+        while not self._parar.wait(self.intervalo):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            pilha = []
+            while frame is not None:
+                codigo = frame.f_code
+                if codigo is Amostrador.__exit__.__code__:
+                    break  # O request já terminou: amostra do próprio encerramento
+                pilha.append(f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})")
+                frame = frame.f_back
+            else:
+                self.pilhas[";".join(reversed(pilha))] += 1
+
+    def collapsed(self):
+        return "".join(f"{pilha} {n}\n" for pilha, n in self.pilhas.most_common())
+
+
+def _slug(rota):
+    return re.sub(r"[^A-Za-z0-9]+", "-", rota).strip("-")[:80] or "raiz"
+
+
+def perfilar(modo, rota, executar):
+    """
+    Executa `executar()` sob o perfilador e grava em pasta_perfis():
+    <data>_<rota>.prof (pstats, só no modo cprofile), .folded (pilhas
+    amostradas) e .json (metadados). Retorna (resultado, nome) — nome é None
+    se outro perfil estava em andamento (o request roda sem perfilar).
+    """
+    if not _em_uso.acquire(blocking=False):
+        return executar(), None
+
+    try:
+        intervalo = getattr(settings, "PERFIL_INTERVALO_AMOSTRAGEM", 0.005)
+        perfil = cProfile.Profile() if modo == "cprofile" else None
+        inicio = time.perf_counter()
+
+        with Amostrador(threading.get_ident(), intervalo) as amostrador:
+            if perfil:
+                perfil.enable()
+            try:
+                resultado = executar()
+            finally:
+                if perfil:
+                    perfil.disable()
+
+        duracao = time.perf_counter() - inicio
+        nome = f"{datetime.now():%Y%m%d-%H%M%S-%f}_{_slug(rota)}"
+        pasta = pasta_perfis()
+        pasta.mkdir(parents=True, exist_ok=True)
+
+        if perfil:
+            perfil.dump_stats(pasta / f"{nome}.prof")
+        (pasta / f"{nome}.folded").write_text(amostrador.collapsed(), encoding="utf-8")
+        (pasta / f"{nome}.json").write_text(json.dumps({
+            "rota": rota,
+            "modo": modo,
+            "duracao_ms": round(duracao * 1000, 2),
+            "amostras": sum(amostrador.pilhas.values()),
+            "criado_em": datetime.now().isoformat(timespec="seconds"),
+        }, ensure_ascii=False), encoding="utf-8")
+        _podar(pasta, getattr(settings, "PERFIS_MAX", 50))
+
+        return resultado, nome
+    finally:
+        _em_uso.release()
+
+
+def _podar(pasta, maximo):
+    # Os nomes começam pela data: em ordem alfabética, os primeiros são os mais antigos
+    nomes = sorted({arquivo.stem for arquivo in pasta.iterdir() if arquivo.is_file()})
+    for nome in nomes[:max(len(nomes) - maximo, 0)]:
+        for arquivo in pasta.glob(f"{glob.escape(nome)}.*"):
+            arquivo.unlink(missing_ok=True)
+
+
+def listar_perfis():
+    """Metadados dos perfis gravados, do mais recente para o mais antigo."""
+    pasta = pasta_perfis()
+    if not pasta.exists():
+        return []
+
+    perfis = []
+    for meta in sorted(pasta.glob("*.json"), reverse=True):
+        dados = json.loads(meta.read_text(encoding="utf-8"))
+        dados["nome"] = meta.stem
+        dados["prof"] = (pasta / f"{meta.stem}.prof").exists()
+        perfis.append(dados)
+    return perfis
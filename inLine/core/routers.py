@@ -0,0 +1,50 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+# =========================
+# ROTEAMENTO DE LEITURA (DASHBOARDS / MONITORES)
+# =========================
+
+LEITURA_ALIAS = "leitura"
+
+_somente_leitura = ContextVar("inline_somente_leitura", default=False)
+
+
+@contextmanager
+def usar_leitura():
+    """Dentro do bloco, as consultas do ORM vão para a conexão só de leitura."""
+    token = _somente_leitura.set(True)
+    try:
+        yield
+    finally:
+        _somente_leitura.reset(token)
+
+
+class LeituraMixin:
+    """Views de consulta pesada: todo o request lê pelo alias 'leitura'."""
+
+    def dispatch(self, request, *args, **kwargs):
+        with usar_leitura():
+            return super().dispatch(request, *args, **kwargs)
+
+
+class LeituraRouter:
+    def db_for_read(self, model, **hints):
+        # Com uma transação de escrita aberta nesta thread, lê do próprio
+        # default para enxergar o que ainda não foi commitado (inclui testes)
+        if _somente_leitura.get() and not connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return LEITURA_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Os dois aliases apontam para o mesmo arquivo
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != LEITURA_ALIAS
@@ -0,0 +1,70 @@
+from datetime import datetime, timezone as dt_timezone
+from uuid import UUID
+
+from django.db import connection
+
+from .models import Pedido, FilaPrato
+
+
+# =========================
+# FILAS ORDENADAS (LEITURA)
+# =========================
+# Ordem da fila: prioridade gravada (0 = preferencial), horário e id como
+# desempate. Cada consulta tem um índice com exatamente esse ORDER BY, então
+# o SQLite percorre o índice e para no LIMIT, sem ordenar os pendentes (ver
+# os testes de plano de consulta em tests.py).
+
+ORDEM_PAINEL = ("prioridade", "created_at", "id")
+
+
+def pedidos_na_fila():
+    """Pedidos aguardando o atendimento, na ordem de chamada (idx_pedido_fila)."""
+    return Pedido.objects.filter(status=Pedido.Status.PENDENTE).order_by("prioridade", "created_at")
+
+
+def unidades_no_painel(prato_id=None, apos=None):
+    """
+    Unidades PENDENTES de pedidos já liberados (prioridade preenchida), sem
+    JOIN para filtrar/ordenar: idx_fila_prato_prioridade com prato,
+    idx_fila_status_prioridade sem. `apos` (ler_cursor) continua a listagem
+    depois daquela unidade (keyset: nada de OFFSET).
+    """
+    unidades = FilaPrato.objects.filter(status=FilaPrato.Status.PENDENTE, prioridade__isnull=False)
+    if prato_id:
+        unidades = unidades.filter(prato_id=prato_id)
+    if apos:
+        prioridade, criado_em, fila_id = apos
+        tabela = FilaPrato._meta.db_table
+        # Comparação de linha do SQLite: vira uma busca no mesmo índice do ORDER BY
+        unidades = unidades.extra(
+            where=[f"({tabela}.prioridade, {tabela}.created_at, {tabela}.id) > (%s, %s, %s)"],
+            params=[
+                prioridade,
+                connection.ops.adapt_datetimefield_value(criado_em),
+                FilaPrato._meta.pk.get_db_prep_value(fila_id, connection),
+            ],
+        )
+    return unidades.order_by(*ORDEM_PAINEL)
+
+
+# -------------------------
+# CURSOR DO PAINEL
+# -------------------------
+
+def cursor_da_unidade(prioridade, criado_em, fila_id):
+    """Posição de uma unidade na fila, em texto: 'prioridade.AAAAMMDDhhmmssffffff.id'."""
+    criado_em = criado_em.astimezone(dt_timezone.utc)
+    return f"{prioridade}.{criado_em:%Y%m%d%H%M%S%f}.{UUID(str(fila_id)).hex}"
+
+
+def ler_cursor(texto):
+    """(prioridade, criado_em, fila_id) de um cursor; ValueError se inválido."""
+    try:
+        prioridade, criado_em, fila_id = texto.split(".")
+        return (
+            int(prioridade),
+            datetime.strptime(criado_em, "%Y%m%d%H%M%S%f").replace(tzinfo=dt_timezone.utc),
+            UUID(fila_id),
+        )
+    except (AttributeError, TypeError, ValueError):
+        raise ValueError("Cursor inválido")
@@ -1,73 +1,381 @@
+import hashlib
+import json
+from collections import Counter
 from decimal import Decimal
-from django.db import transaction, models
+from django.db import IntegrityError, connection, transaction
 from django.core.exceptions import ValidationError
+from django.db.models.functions import Coalesce
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from uuid import UUID
-from .models import Pedido, FilaPrato, TMA, Prato
+from .models import Pedido, FilaPrato, TMA, TMAAtual, Prato, ChaveIdempotencia, ContadorSenha, evento_atual
+from .cache_versoes import invalidar
+from .fila_memoria import fila_memoria
+from .logic_printing import enfileirar_pedido_liberado
+from .mudancas import registrar_mudanca, registrar_mudancas
+from .selectors import pedidos_na_fila
+from .tma_worker import tma_worker
+from .write_queue import serializar_escrita
 
 
 # =========================
 # CAIXA
 # =========================
 
+@serializar_escrita
 def create_order(tipo, itens):
     if not itens:
         raise ValueError("É necessário informar ao menos um item")
 
     with transaction.atomic():
-        # 1. Criar pedido inicial
+        # 1. Criar pedido inicial (com a próxima senha do evento)
+        evento = evento_atual()
         pedido = Pedido.objects.create(
             tipo=tipo,
+            prioridade=Pedido.prioridade_do_tipo(tipo),
             total=Decimal("0.00"),
+            evento=evento,
+            senha=_proxima_senha(evento),
         )
 
         # 2. Preparar dados e buscar pratos de uma vez só (Otimização)
-        try:
-            prato_ids = [UUID(str(i["prato_id"])) for i in itens]
-        except (ValueError, KeyError):
-            raise ValueError("Formato de ID de prato inválido")
+        prato_ids = _ids_de_pratos(itens)
 
         # Busca todos os pratos necessários em uma única query
         pratos_db = {p.id: p for p in Prato.objects.filter(id__in=prato_ids)}
-        
-        filas_para_criar = []
-        total_acumulado = Decimal("0.00")
 
         # 3. Processar itens
-        for item in itens:
-            p_id = UUID(str(item["prato_id"]))
-            prato = pratos_db.get(p_id)
-            
-            if not prato:
-                raise ValueError(f"Prato {p_id} não encontrado")
-
-            quantidade = int(item.get("quantidade", 1))
-            preco_no_momento = prato.preco # Assume que seu model Prato tem o campo 'preco'
-
-            # Criar objetos FilaPrato na memória
-            for _ in range(quantidade):
-                filas_para_criar.append(
-                    FilaPrato(
-                        pedido=pedido,
-                        prato=prato,
-                        preco_unitario=preco_no_momento,
-                        status=FilaPrato.Status.PENDENTE
-                    )
-                )
-            
-            total_acumulado += (preco_no_momento * quantidade)
+        filas_para_criar, total_acumulado = _explodir_itens(pedido, itens, pratos_db)
 
         # 4. Persistir no banco em massa
         FilaPrato.objects.bulk_create(filas_para_criar)
 
-        # 5. Atualizar o total do pedido
+        # 5. Atualizar o total e o contador de unidades do pedido
         pedido.total = total_acumulado
-        pedido.save(update_fields=["total"])
+        pedido.itens_total = len(filas_para_criar)
+        pedido.save(update_fields=["total", "itens_total"])
+
+        registrar_mudanca(
+            "pedido_criado",
+            pedido_id=str(pedido.id),
+            tipo=pedido.tipo,
+            senha=pedido.senha_exibicao,
+            criado_em=pedido.created_at.isoformat(),
+            itens=_itens_por_prato(filas_para_criar),
+        )
 
         return pedido
 
+
+def _itens_por_prato(filas):
+    # Unidades por prato do pedido (vai no evento: métricas de fila sem consultar o banco)
+    itens = {}
+    for fila in filas:
+        prato_id = str(fila.prato_id)
+        itens[prato_id] = itens.get(prato_id, 0) + 1
+    return itens
+
+
+def _proxima_senha(evento, quantidade=1):
+    """
+    Reserva `quantidade` senhas seguidas do evento e devolve a primeira.
+
+    Um único upsert no ContadorSenha do evento: a transação já segura o lock
+    de escrita desde o BEGIN (IMMEDIATE), então dois caixas nunca recebem o
+    mesmo número. Na primeira senha do evento o contador parte do MAX(senha)
+    dos pedidos vivos (bases anteriores ao contador).
+    """
+    contador = ContadorSenha._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {contador} (evento, ultima)
+            VALUES (%s, (SELECT COALESCE(MAX(senha), 0) FROM {Pedido._meta.db_table} WHERE evento = %s) + %s)
+            ON CONFLICT (evento) DO UPDATE SET ultima = {contador}.ultima + %s
+            RETURNING ultima
+            """,
+            [evento, evento, quantidade, quantidade],
+        )
+        ultima = cursor.fetchone()[0]
+    return ultima - quantidade + 1
+
+
+def _ids_de_pratos(itens):
+    try:
+        return [UUID(str(i["prato_id"])) for i in itens]
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Formato de ID de prato inválido")
+
+
+def _explodir_itens(pedido, itens, pratos_db):
+    """Explode os itens do pedido em unidades de FilaPrato (em memória) e soma o total."""
+    filas_para_criar = []
+    total_acumulado = Decimal("0.00")
+
+    for item in itens:
+        p_id = UUID(str(item["prato_id"]))
+        prato = pratos_db.get(p_id)
+        
+        if not prato:
+            raise ValueError(f"Prato {p_id} não encontrado")
+
+        quantidade = int(item.get("quantidade", 1))
+        preco_no_momento = prato.preco # Assume que seu model Prato tem o campo 'preco'
+
+        # Criar objetos FilaPrato na memória (mesmo horário do pedido: ordem da fila)
+        for _ in range(quantidade):
+            filas_para_criar.append(
+                FilaPrato(
+                    pedido=pedido,
+                    prato=prato,
+                    preco_unitario=preco_no_momento,
+                    status=FilaPrato.Status.PENDENTE,
+                    created_at=pedido.created_at,
+                )
+            )
+        
+        total_acumulado += (preco_no_momento * quantidade)
+
+    return filas_para_criar, total_acumulado
+
+
+class ChaveReutilizada(ValueError):
+    """A chave de idempotência já foi usada com outro pedido."""
+
+
+def _assinatura_pedido(tipo, itens):
+    """
+    Resumo estável de tipo + itens: a ordem dos itens e a forma de escrever
+    o id do prato não contam, a quantidade conta.
+    """
+    try:
+        normalizados = sorted(
+            (str(UUID(str(i["prato_id"]))), int(i.get("quantidade", 1))) for i in itens
+        )
+    except (ValueError, KeyError, TypeError, AttributeError):
+        normalizados = repr(itens)  # Corpo inválido: create_order recusa de qualquer jeito
+    corpo = json.dumps([tipo, normalizados], sort_keys=True, default=str)
+    return hashlib.sha256(corpo.encode()).hexdigest()
+
+
+def _conferir_chave(registro, assinatura):
+    # Chaves antigas (sem assinatura) continuam valendo como antes
+    if registro.assinatura and registro.assinatura != assinatura:
+        raise ChaveReutilizada(
+            f"Chave de idempotência {registro.chave} já usada com outro pedido"
+        )
+    return registro.pedido
+
+
+def _pedido_da_chave(chave, assinatura):
+    """Pedido já criado com a chave (None se ela é nova); ChaveReutilizada se o corpo mudou."""
+    registro = ChaveIdempotencia.objects.select_related("pedido").filter(chave=chave).first()
+    return _conferir_chave(registro, assinatura) if registro else None
+
+
+@serializar_escrita
+def create_order_idempotente(chave, tipo, itens):
+    """
+    Cria o pedido uma única vez por chave de idempotência.
+    Retorna (pedido, criado): em uma repetição da mesma chave, devolve o
+    pedido original sem executar a transação de novo. A mesma chave com
+    outro tipo/itens levanta ChaveReutilizada (o caixa gerou chave repetida).
+    """
+    assinatura = _assinatura_pedido(tipo, itens)
+    existente = _pedido_da_chave(chave, assinatura)
+    if existente:
+        return existente, False
+
+    try:
+        with transaction.atomic():
+            pedido = create_order(tipo, itens)
+            ChaveIdempotencia.objects.create(chave=chave, pedido=pedido, assinatura=assinatura)
+    except IntegrityError:
+        # Duas tentativas simultâneas com a mesma chave: a outra venceu (índice único)
+        existente = _pedido_da_chave(chave, assinatura)
+        if existente is None:
+            raise  # Não foi a chave: erro de integridade de verdade
+        return existente, False
+
+    return pedido, True
+
+
+# =========================
+# SINCRONIZAÇÃO DO CAIXA OFFLINE (LOTE)
+# =========================
+
+@serializar_escrita
+def sincronizar_pedidos(pedidos):
+    """
+    Recebe a fila local (outbox) de um caixa que ficou sem rede e grava
+    N pedidos em UMA transação, com bulk_create de Pedido e FilaPrato.
+
+    Cada pedido traz idempotency_key (obrigatória), tipo, itens e criado_em
+    (horário original do caixa, que define a posição na fila). Pedidos já
+    sincronizados voltam como DUPLICADO; pedidos inválidos voltam como ERRO
+    sem impedir os demais (o caixa não pode travar a outbox por um item ruim).
+    """
+    try:
+        return _sincronizar_pedidos(pedidos)
+    except IntegrityError:
+        # Outro envio da mesma outbox gravou alguma chave antes: refaz, agora como duplicados
+        return _sincronizar_pedidos(pedidos)
+
+
+def _sincronizar_pedidos(pedidos):
+    agora = timezone.now()
+    resultados = {}
+    chaves = list(dict.fromkeys(str(p.get("idempotency_key") or "") for p in pedidos))
+
+    with transaction.atomic():
+        # 1. Chaves já conhecidas (reenvio da outbox após resposta perdida)
+        ja_sincronizados = {
+            c.chave: c
+            for c in ChaveIdempotencia.objects.select_related("pedido").filter(chave__in=chaves)
+        }
+
+        # 2. Todos os pratos do lote em uma única query
+        prato_ids = set()
+        for dados in pedidos:
+            try:
+                prato_ids.update(_ids_de_pratos(dados.get("itens") or []))
+            except ValueError:
+                pass
+        pratos_db = {p.id: p for p in Prato.objects.filter(id__in=prato_ids)}
+
+        novos_pedidos, novas_filas, novas_chaves = [], [], []
+        itens_por_pedido = {}
+
+        for dados in pedidos:
+            chave = str(dados.get("idempotency_key") or "")
+            if chave in resultados:
+                continue
+            assinatura = _assinatura_pedido(dados.get("tipo"), dados.get("itens") or [])
+            if chave in ja_sincronizados:
+                try:
+                    pedido = _conferir_chave(ja_sincronizados[chave], assinatura)
+                except ChaveReutilizada as e:
+                    resultados[chave] = {"resultado": "ERRO", "erro": str(e)}
+                else:
+                    resultados[chave] = {"resultado": "DUPLICADO", "pedido": pedido}
+                continue
+
+            try:
+                if not chave or len(chave) > ChaveIdempotencia._meta.get_field("chave").max_length:
+                    raise ValueError("Chave de idempotência inválida")
+                if dados.get("tipo") not in Pedido.Tipo.values:
+                    raise ValueError("Tipo de pedido inválido")
+                if not dados.get("itens"):
+                    raise ValueError("É necessário informar ao menos um item")
+                _ids_de_pratos(dados["itens"])
+
+                pedido = Pedido(
+                    tipo=dados["tipo"],
+                    prioridade=Pedido.prioridade_do_tipo(dados["tipo"]),
+                    created_at=_horario_do_caixa(dados.get("criado_em"), agora),
+                )
+                filas, total = _explodir_itens(pedido, dados["itens"], pratos_db)
+                pedido.total = total
+                pedido.itens_total = len(filas)
+            except (ValueError, KeyError, TypeError) as e:
+                resultados[chave] = {"resultado": "ERRO", "erro": str(e)}
+                continue
+
+            novos_pedidos.append(pedido)
+            novas_filas.extend(filas)
+            itens_por_pedido[pedido.id] = _itens_por_prato(filas)
+            novas_chaves.append(ChaveIdempotencia(chave=chave, pedido=pedido, assinatura=assinatura))
+            resultados[chave] = {"resultado": "CRIADO", "pedido": pedido}
+
+        # 3. Senhas em sequência, na ordem em que as vendas aconteceram no caixa
+        novos_pedidos.sort(key=lambda p: p.created_at)
+        if novos_pedidos:
+            evento = evento_atual()
+            primeira = _proxima_senha(evento, len(novos_pedidos))
+            for n, pedido in enumerate(novos_pedidos):
+                pedido.evento, pedido.senha = evento, primeira + n
+
+        # 4. Persistência em massa: 3 INSERTs para o lote inteiro
+        Pedido.objects.bulk_create(novos_pedidos)
+        FilaPrato.objects.bulk_create(novas_filas)
+        ChaveIdempotencia.objects.bulk_create(novas_chaves)
+
+        registrar_mudancas([
+            ("pedido_criado", {
+                "pedido_id": str(pedido.id),
+                "tipo": pedido.tipo,
+                "senha": pedido.senha_exibicao,
+                "criado_em": pedido.created_at.isoformat(),
+                "itens": itens_por_pedido[pedido.id],
+            })
+            for pedido in novos_pedidos
+        ])
+
+    return [{"idempotency_key": chave, **resultado} for chave, resultado in resultados.items()]
+
+
+def _horario_do_caixa(valor, padrao):
+    # Horário em que a venda aconteceu no caixa; nunca no futuro
+    criado_em = parse_datetime(valor) if isinstance(valor, str) else None
+    if criado_em is None:
+        return padrao
+    if timezone.is_naive(criado_em):
+        criado_em = timezone.make_aware(criado_em)
+    return min(criado_em, padrao)
+
+
 # core/views.py ou services.py
 
+# =========================
+# ATENDIMENTO: LIBERAR PRÓXIMO PEDIDO
+# =========================
+
+@serializar_escrita
+def chamar_proximo_pedido():
+    """
+    Libera para a cozinha o próximo pedido PENDENTE (preferencial primeiro,
+    depois o mais antigo). Retorna (pedido, itens) ou None com a fila vazia.
+    """
+    with transaction.atomic():
+        pedido = pedidos_na_fila().select_for_update().first()
+
+        if not pedido:
+            return None
+
+        # Unidades do pedido (para a fila em memória) e itens agrupados por prato para o cupom/chamada
+        unidades = [
+            [str(fila_id), str(prato_id), nome]
+            for fila_id, prato_id, nome in FilaPrato.objects.filter(pedido=pedido).values_list(
+                'id', 'prato_id', 'prato__nome'
+            )
+        ]
+        quantidades = Counter(nome for _, _, nome in unidades)
+        itens_formatados = [
+            {"nome": nome, "quantidade": qtd}
+            for nome, qtd in sorted(quantidades.items(), key=lambda item: item[0] or "")
+        ]
+
+        pedido.status = Pedido.Status.PRODUCAO
+        pedido.save(update_fields=['status'])
+
+        # Libera as unidades para painel/estações: prioridade preenchida = liberada
+        FilaPrato.objects.filter(pedido=pedido).update(prioridade=pedido.prioridade)
+
+        # Cupom + comandas gravados na mesma transação; o spooler imprime depois do commit
+        enfileirar_pedido_liberado(pedido, itens_formatados)
+
+        registrar_mudanca(
+            "pedido_liberado",
+            pedido_id=str(pedido.id),
+            tipo=pedido.tipo,
+            senha=pedido.senha_exibicao,
+            prioridade=pedido.prioridade,
+            criado_em=pedido.created_at.isoformat(),
+            unidades=unidades,
+        )
+
+        return pedido, itens_formatados
+
 # =========================
 # INICIAR PRATO
 # =========================
@@ -80,22 +388,138 @@ def iniciar_producao_item(fila_id):
         item.save(update_fields=['started_at', 'status'])
     return item
 
+# =========================
+# PEGAR PRÓXIMO ITEM (ESTAÇÃO)
+# =========================
+
+def _sql_claim_next(prato_id, station_id):
+    """
+    UPDATE ... RETURNING do claim_next. A escolha é uma busca no índice
+    (prato, status, prioridade, created_at, id) da própria fila: sem JOIN com o
+    pedido e sem ordenar os pendentes (prioridade NULL = ainda não liberado).
+    """
+    fila = FilaPrato._meta.db_table
+    agora = connection.ops.adapt_datetimefield_value(timezone.now())
+    prato_db = FilaPrato._meta.get_field("prato").target_field.get_db_prep_value(prato_id, connection)
+
+    sql = f"""
+        UPDATE {fila}
+        SET status = %s, started_at = %s, updated_at = %s, estacao = %s
+        WHERE id = (
+            SELECT id FROM {fila}
+            WHERE prato_id = %s AND status = %s AND prioridade IS NOT NULL
+            ORDER BY prioridade, created_at, id
+            LIMIT 1
+        )
+        AND status = %s
+        RETURNING id
+    """
+    params = [
+        FilaPrato.Status.EM_PRODUCAO, agora, agora, station_id,
+        prato_db, FilaPrato.Status.PENDENTE,
+        FilaPrato.Status.PENDENTE,
+    ]
+    return sql, params
+
+
+def _claim_pela_memoria(prato_id, station_id):
+    """
+    Candidato do heap do prato (fila_memoria): o UPDATE vai direto pela PK.
+    Se o item já não está PENDENTE (memória atrasada), tenta o próximo; com o
+    heap vazio retorna None e o claim_next cai na busca pelo índice.
+    """
+    if not fila_memoria.disponivel():
+        return None
+
+    fila = FilaPrato._meta.db_table
+    agora = connection.ops.adapt_datetimefield_value(timezone.now())
+
+    while True:
+        candidato = fila_memoria.reservar(prato_id)
+        if candidato is None:
+            return None
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE {fila}
+                SET status = %s, started_at = %s, updated_at = %s, estacao = %s
+                WHERE id = %s AND status = %s AND prioridade IS NOT NULL
+                RETURNING id
+                """,
+                [
+                    FilaPrato.Status.EM_PRODUCAO, agora, agora, station_id,
+                    FilaPrato._meta.pk.get_db_prep_value(UUID(candidato["fila_id"]), connection),
+                    FilaPrato.Status.PENDENTE,
+                ],
+            )
+            row = cursor.fetchone()
+
+        if row:
+            return row
+        fila_memoria.descartar(candidato["fila_id"])  # Memória atrasada: já não estava PENDENTE
+
+
+@serializar_escrita
+def claim_next(prato_id, station_id):
+    """
+    Escolhe e inicia o próximo item PENDENTE do prato para a estação,
+    em um único UPDATE condicional (sem ler-e-depois-gravar).
+
+    O SQLite executa cada escrita de forma serializada, então duas estações
+    nunca pegam o mesmo item e nenhuma precisa de retry: quem chega depois
+    já enxerga o item anterior como EM_PRODUCAO e recebe o seguinte.
+    """
+    row = None
+    try:
+        with transaction.atomic():
+            row = _claim_pela_memoria(prato_id, station_id)
+
+            if not row:
+                sql, params = _sql_claim_next(prato_id, station_id)
+                with connection.cursor() as cursor:
+                    cursor.execute(sql, params)
+                    row = cursor.fetchone()
+
+            if not row:
+                return None
+
+            item = FilaPrato.objects.select_related("pedido", "prato").get(id=UUID(str(row[0])))
+
+            registrar_mudanca(
+                "item_iniciado",
+                fila_id=str(item.id),
+                pedido_id=str(item.pedido_id),
+                prato_id=str(item.prato_id),
+                estacao=station_id,
+            )
+
+            return item
+    except BaseException:
+        # O UPDATE voltou junto: a unidade reservada no heap volta para a fila
+        if row:
+            fila_memoria.devolver(str(UUID(str(row[0]))))
+        raise
+
 # =========================
 # FINALIZAÇÃO DE PRATO
 # =========================
 
 
 
+@serializar_escrita
 def finalize_prato(fila_id):
     try:
         with transaction.atomic():
             # 1. Busca o item com lock para evitar concorrência
             item = FilaPrato.objects.select_for_update().filter(id=fila_id).first()
 
-            if not item or item.status == FilaPrato.Status.FINALIZADO:
+            # Já pronto (ou já entregue): toque repetido na estação não conta de novo
+            if not item or item.status in (FilaPrato.Status.FINALIZADO, FilaPrato.Status.RETIRADO):
                 return None
 
             agora = timezone.now()
+            status_anterior = item.status
 
             # 2. GRAVAÇÃO DOS TEMPOS (O CORAÇÃO DO TMA)
             # Se o item não tiver hora de início (pulou a etapa 'em produção'), 
@@ -110,15 +534,21 @@ def finalize_prato(fila_id):
             # Adicionamos os campos de tempo no update_fields
             item.save(update_fields=['status', 'finished_at', 'started_at', 'updated_at'])
 
-            # 4. Atualização do Pedido (se todos os itens do pedido acabaram)
-            pedido = item.pedido
-            itens_abertos = FilaPrato.objects.filter(pedido=pedido).exclude(
-                status__in=[FilaPrato.Status.FINALIZADO, FilaPrato.Status.RETIRADO]
-            ).exists()
+            # 4. Atualização do Pedido: contador + status em um único UPDATE
+            pedido_finalizado = _marcar_itens_prontos(item.pedido_id, 1)
 
-            if not itens_abertos:
-                pedido.status = Pedido.Status.FINALIZADO
-                pedido.save(update_fields=['status'])
+            # 5. Métricas fora do request: o worker recalcula o TMA deste prato
+            prato_id = item.prato_id
+            transaction.on_commit(lambda: tma_worker.enqueue(prato_id))
+
+            registrar_mudanca(
+                "item_finalizado",
+                fila_id=str(item.id),
+                pedido_id=str(item.pedido_id),
+                prato_id=str(item.prato_id),
+                pedido_finalizado=pedido_finalizado,
+                status_anterior=status_anterior,
+            )
             
             return item
     except Exception as e:
@@ -126,14 +556,124 @@ def finalize_prato(fila_id):
         raise e
 
 
+@serializar_escrita
+def finalize_pratos_lote(fila_ids):
+    """
+    Finaliza vários itens de uma vez (ex.: 6 pastéis que saíram juntos da fritadeira).
+
+    Tudo em uma transação: um UPDATE para os itens, uma checagem por lote dos
+    pedidos afetados e um aviso ao worker de TMA por prato. Retorna o resultado
+    de cada fila_id: FINALIZADO, JA_FINALIZADO ou NAO_ENCONTRADO.
+    """
+    ids = list(dict.fromkeys(fila_ids))  # Remove repetidos preservando a ordem
+    agora = timezone.now()
+    concluidos = (FilaPrato.Status.FINALIZADO, FilaPrato.Status.RETIRADO)
+
+    with transaction.atomic():
+        # 0. Status de antes (vai nos eventos: pendente x em produção para as métricas)
+        anteriores = dict(
+            FilaPrato.objects.filter(id__in=ids).exclude(status__in=concluidos).values_list("id", "status")
+        )
+
+        # 1. O UPDATE condicional só pega itens ainda abertos.
+        # Sem hora de início (pulou 'em produção'), usamos a criação, como no finalize_prato.
+        FilaPrato.objects.filter(id__in=ids).exclude(status__in=concluidos).update(
+            status=FilaPrato.Status.FINALIZADO,
+            started_at=Coalesce("started_at", "created_at"),
+            finished_at=agora,
+            updated_at=agora,
+        )
+
+        # 2. Quem foi finalizado AGORA (por este lote): estava aberto no passo 0
+        # e agora está FINALIZADO. O resto já estava pronto antes do lote.
+        existentes = {
+            i["id"]: i
+            for i in FilaPrato.objects.filter(id__in=ids).values("id", "pedido_id", "prato_id", "status")
+        }
+        finalizados = [
+            existentes[fila_id]
+            for fila_id in anteriores
+            if fila_id in existentes and existentes[fila_id]["status"] == FilaPrato.Status.FINALIZADO
+        ]
+        ids_finalizados = {i["id"] for i in finalizados}
+
+        # 3. Atualização dos Pedidos afetados, um UPDATE condicional por pedido
+        por_pedido = {}
+        for i in finalizados:
+            por_pedido[i["pedido_id"]] = por_pedido.get(i["pedido_id"], 0) + 1
+        pedidos_prontos = {
+            pedido_id
+            for pedido_id, quantidade in por_pedido.items()
+            if _marcar_itens_prontos(pedido_id, quantidade)
+        }
+
+        # 4. Métricas e avisos às telas só depois do COMMIT
+        for prato_id in {i["prato_id"] for i in finalizados}:
+            transaction.on_commit(lambda prato_id=prato_id: tma_worker.enqueue(prato_id))
+
+        registrar_mudancas([
+            ("item_finalizado", {
+                "fila_id": str(i["id"]),
+                "pedido_id": str(i["pedido_id"]),
+                "prato_id": str(i["prato_id"]),
+                "pedido_finalizado": i["pedido_id"] in pedidos_prontos,
+                "status_anterior": anteriores.get(i["id"]),
+            })
+            for i in finalizados
+        ])
+
+    resultados = []
+    for fila_id in ids:
+        item = existentes.get(fila_id)
+        if not item:
+            resultado = "NAO_ENCONTRADO"
+        elif fila_id in ids_finalizados:
+            resultado = "FINALIZADO"
+        else:
+            resultado = "JA_FINALIZADO"
+        resultados.append({"fila_id": str(fila_id), "resultado": resultado})
+
+    return resultados
+
+
+def _marcar_itens_prontos(pedido_id, quantidade):
+    """
+    Soma `quantidade` em itens_prontos e, se o pedido completou, passa para
+    FINALIZADO no mesmo UPDATE (o SET enxerga os valores antigos da linha).
+    Retorna True quando este UPDATE finalizou o pedido.
+
+    Pedido já entregue, ou contagem que passaria do total, não é tocado:
+    o contador nunca desfaz uma retirada nem fica acima de itens_total.
+    """
+    sql = f"""
+        UPDATE {Pedido._meta.db_table}
+        SET itens_prontos = itens_prontos + %s,
+            status = CASE WHEN itens_prontos + %s >= itens_total THEN %s ELSE status END
+        WHERE id = %s
+          AND status <> %s
+          AND itens_prontos + %s <= itens_total
+        RETURNING status
+    """
+    pedido_db = Pedido._meta.pk.get_db_prep_value(pedido_id, connection)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [
+            quantidade, quantidade, Pedido.Status.FINALIZADO,
+            pedido_db, Pedido.Status.RETIRADO, quantidade,
+        ])
+        row = cursor.fetchone()
+
+    return bool(row) and row[0] == Pedido.Status.FINALIZADO
+
+
 # =========================
 # MÉTRICA TMA (janela fixa)
 # =========================
 
 def calculate_tma_per_prato():
     """
-    Calcula o TMA focado na performance recente (Janela de até 10 unidades).
-    Se houver < 10, calcula com o que houver. Se > 10, pega o lote mais recente.
+    Varredura completa: processa todos os pratos com itens finalizados
+    aguardando cálculo. O dia a dia usa o worker (calculate_tma_for_prato por prato).
     """
     # 1. Identifica pratos que possuem itens finalizados aguardando cálculo
     pratos_pendentes = FilaPrato.objects.filter(
@@ -141,10 +681,19 @@ def calculate_tma_per_prato():
         usado_em_metrica=False,
         started_at__isnull=False,
         finished_at__isnull=False
-    ).values('prato').annotate(total=models.Count('id'))
+    ).values_list('prato', flat=True).distinct()
 
-    for p in pratos_pendentes:
-        prato_id = p['prato']
+    for prato_id in pratos_pendentes:
+        calculate_tma_for_prato(prato_id)
+
+
+def calculate_tma_for_prato(prato_id, janela=10):
+    """
+    Calcula o TMA focado na performance recente (Janela de até 10 unidades).
+    Se houver < 10, calcula com o que houver. Se > 10, processa lote a lote,
+    do mais antigo para o mais recente, cada um na sua transação curta.
+    """
+    while True:
         try:
             with transaction.atomic():
                 # 2. Busca o lote (até 10 itens) - selecionamos para update para evitar concorrência
@@ -155,12 +704,12 @@ def calculate_tma_per_prato():
                         usado_em_metrica=False
                     )
                     .select_for_update()
-                    .order_by('finished_at')[:10]
+                    .order_by('finished_at')[:janela]
                 )
 
                 qtd = len(itens)
                 if qtd == 0:
-                    continue
+                    return
 
                 # 3. Cálculo da média do lote atual
                 # Soma a diferença de tempo de cada item individualmente (preparo real)
@@ -171,12 +720,8 @@ def calculate_tma_per_prato():
                 
                 media = soma_segundos / qtd
 
-                # 4. Grava a nova métrica na tabela TMA
-                TMA.objects.create(
-                    prato_id=prato_id,
-                    valor_tma_seg=media,
-                    ultimo_prato_id=itens[-1].id # Referência para auditoria
-                )
+                # 4. Grava a nova métrica (histórico + TMA atual do prato)
+                registrar_tma(prato_id, media, ultimo_prato_id=itens[-1].id)
 
                 # 5. Marca esses itens como processados
                 FilaPrato.objects.filter(
@@ -185,38 +730,63 @@ def calculate_tma_per_prato():
 
         except Exception as e:
             print(f"Erro ao calcular TMA para prato {prato_id}: {e}")
+            return
+
+        if qtd < janela:
+            return
+
+def registrar_tma(prato_id, valor_tma_seg, ultimo_prato_id=None):
+    """
+    Único ponto de escrita de TMA: grava o histórico e mantém a linha
+    materializada do prato (atual + anterior) na mesma transação.
+    """
+    with transaction.atomic():
+        tma = TMA.objects.create(
+            prato_id=prato_id,
+            valor_tma_seg=valor_tma_seg,
+            ultimo_prato_id=ultimo_prato_id # Referência para auditoria
+        )
+
+        atual = TMAAtual.objects.select_for_update().filter(prato_id=prato_id).first()
+        if atual:
+            atual.valor_anterior_seg = atual.valor_tma_seg
+            atual.valor_tma_seg = valor_tma_seg
+            atual.save(update_fields=["valor_tma_seg", "valor_anterior_seg", "atualizado_em"])
+        else:
+            TMAAtual.objects.create(prato_id=prato_id, valor_tma_seg=valor_tma_seg)
+
+        invalidar("metricas")
+        return tma
 
 # =========================
 # RETIRADA DE PEDIDO (janela fixa)
 # =========================
 
+@serializar_escrita
 def registrar_retirada_total_pedido(pedido_id):
     try:
         with transaction.atomic():
             # 1. Busca o pedido e trava a linha no banco
             pedido = Pedido.objects.select_for_update().get(id=pedido_id)
-            
-            # 2. Conta quantos itens o pedido tem no total
-            total_itens = pedido.filas.count()
-            
-            # 3. Conta quantos desses itens já estão FINALIZADOS
-            total_finalizados = pedido.filas.filter(status=Pedido.Status.FINALIZADO).count()
 
-            # REGRA DE OURO: Só passa se o total for igual ao finalizado
-            if total_itens != total_finalizados:
+            # 2. REGRA DE OURO: Só passa se o total for igual ao finalizado
+            # (contadores mantidos pelo finalize: nenhuma contagem das filas)
+            if pedido.status != Pedido.Status.FINALIZADO or pedido.itens_prontos != pedido.itens_total:
                 raise ValidationError(
-                    f"Impossível retirar: O pedido tem {total_itens} itens, mas apenas {total_finalizados} estão prontos."
+                    f"Impossível retirar: O pedido tem {pedido.itens_total} itens, mas apenas {pedido.itens_prontos} estão prontos."
                 )
 
-            # 4. Se chegou aqui, todos estão prontos. Então damos baixa em tudo:
+            # 3. Se chegou aqui, todos estão prontos. Então damos baixa em tudo:
             pedido.filas.all().update(
                 status=Pedido.Status.RETIRADO, 
                 delivered_at=timezone.now()
             )
             
-            # 5. Atualiza o status do Pedido pai
+            # 4. Atualiza o status do Pedido pai
             pedido.status = Pedido.Status.RETIRADO
             pedido.save(update_fields=['status'])
+
+            registrar_mudanca("pedido_retirado", pedido_id=str(pedido.id))
             
             return pedido
             
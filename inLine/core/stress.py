@@ -0,0 +1,274 @@
+import multiprocessing
+import random
+import threading
+import time
+from collections import Counter
+
+from django.core.exceptions import ValidationError
+from django.db import OperationalError, connection, connections
+from django.db.models import Count, F, Q, Sum
+
+from .medicao import resumir
+from .models import Pedido, FilaPrato, Prato
+
+
+# =========================
+# STRESS DO SERVICE LAYER (SQLITE)
+# =========================
+
+MAX_TENTATIVAS = 5
+
+
+class _Medidor:
+    """
+    Latências, SQLITE_BUSY e novas tentativas de um processo. A espera pelo
+    lock dentro do busy timeout aparece na cauda da latência; o BUSY só
+    chega aqui quando o timeout estoura.
+    """
+
+    def __init__(self):
+        self.latencias = {}
+        self.bloqueios = Counter()
+        self.tentativas = Counter()
+        self.erros = Counter()
+        self._lock = threading.Lock()
+
+    def executar(self, operacao, funcao, *args):
+        for tentativa in range(MAX_TENTATIVAS + 1):
+            inicio = time.perf_counter()
+            try:
+                return funcao(*args)
+            except OperationalError as e:
+                if "locked" not in str(e) or tentativa == MAX_TENTATIVAS:
+                    with self._lock:
+                        self.erros[operacao] += 1
+                    raise
+                with self._lock:
+                    self.bloqueios[operacao] += 1
+                    self.tentativas[operacao] += 1
+                time.sleep(0.01 * (2 ** tentativa))
+            finally:
+                with self._lock:
+                    self.latencias.setdefault(operacao, []).append(time.perf_counter() - inicio)
+
+    def exportar(self):
+        return {
+            "latencias": self.latencias,
+            "bloqueios": dict(self.bloqueios),
+            "tentativas": dict(self.tentativas),
+            "erros": dict(self.erros),
+        }
+
+
+def _inicializar(nome_banco):
+    # Processo filho (fork ou spawn): garante o Django e aponta para o banco do stress
+    import django
+    from django.conf import settings
+
+    if not settings.configured or not django.apps.apps.ready:
+        django.setup()
+    from .routers import LEITURA_ALIAS
+
+    connections.close_all()
+    # O alias de leitura é o mesmo arquivo: sem isso, a fila em memória leria o banco do evento
+    for alias in (connection.alias, LEITURA_ALIAS):
+        connections[alias].settings_dict["NAME"] = nome_banco
+
+
+def _em_threads(threads, alvo, fatias):
+    medidor = _Medidor()
+    resultados = []
+
+    def rodar(fatia):
+        try:
+            resultados.extend(alvo(medidor, fatia))
+        finally:
+            connection.close()
+
+    trabalhadores = [threading.Thread(target=rodar, args=(f,)) for f in fatias[:threads]]
+    for t in trabalhadores:
+        t.start()
+    for t in trabalhadores:
+        t.join()
+
+    return {"medicao": medidor.exportar(), "resultados": resultados}
+
+
+# -------------------------
+# TAREFAS DE CADA PROCESSO
+# -------------------------
+
+def _tarefa_criar(args):
+    from .services import create_order
+
+    pedidos, prato_ids, threads, semente = args
+    aleatorio = random.Random(semente)
+
+    def criar(medidor, quantidade):
+        criados = []
+        for _ in range(quantidade):
+            itens = [
+                {"prato_id": p, "quantidade": aleatorio.randint(1, 3)}
+                for p in aleatorio.sample(prato_ids, aleatorio.randint(1, min(3, len(prato_ids))))
+            ]
+            tipo = Pedido.Tipo.PREFERENCIAL if aleatorio.random() < 0.2 else Pedido.Tipo.NORMAL
+            pedido = medidor.executar("create_order", create_order, tipo, itens)
+            criados.append(str(pedido.id))
+        return criados
+
+    cotas = [pedidos // threads + (1 if i < pedidos % threads else 0) for i in range(threads)]
+    return _em_threads(threads, criar, cotas)
+
+
+def _tarefa_finalizar(args):
+    from .services import finalize_prato
+
+    fila_ids, threads, semente = args
+
+    def finalizar(medidor, fatia):
+        # Todas as threads de todos os processos disputam TODOS os itens,
+        # cada uma em outra ordem: só uma pode finalizar cada item
+        ids, semente_thread = fatia
+        ids = list(ids)
+        random.Random(semente_thread).shuffle(ids)
+        return [i for i in ids if medidor.executar("finalize_prato", finalize_prato, i)]
+
+    return _em_threads(threads, finalizar, [(fila_ids, semente * 1000 + k) for k in range(threads)])
+
+
+def _tarefa_retirar(args):
+    from .services import registrar_retirada_total_pedido
+
+    pedido_ids, threads, semente = args
+
+    def retirar(medidor, fatia):
+        ids, semente_thread = fatia
+        ids = list(ids)
+        random.Random(semente_thread).shuffle(ids)
+        retirados = []
+        for i in ids:
+            try:
+                if medidor.executar("registrar_retirada", registrar_retirada_total_pedido, i):
+                    retirados.append(i)
+            except ValidationError:
+                pass  # Outro balcão já entregou
+        return retirados
+
+    return _em_threads(threads, retirar, [(pedido_ids, semente * 1000 + k) for k in range(threads)])
+
+
+# -------------------------
+# ORQUESTRAÇÃO
+# -------------------------
+
+def executar_stress(processos=4, threads=4, pedidos=200, pratos=4, semente=0):
+    """
+    Roda create_order, finalize_prato e registrar_retirada_total_pedido a partir
+    de `processos` processos com `threads` threads cada, contra o banco (em
+    arquivo) da conexão default, e confere as invariantes ao final.
+
+    Fases: (1) os processos criam os pedidos; (2) todos tentam finalizar todos
+    os itens; (3) todos tentam retirar todos os pedidos. Retorna o relatório
+    com latências por operação, esperas por lock, novas tentativas e a lista
+    de violações (vazia quando tudo está consistente).
+    """
+    nome_banco = str(connection.settings_dict["NAME"])
+    prato_ids = [
+        str(Prato.objects.create(nome=f"Stress {i + 1}", preco=f"{10 + i}.50").id) for i in range(pratos)
+    ]
+    connections.close_all()  # Nada de conexão herdada pelos filhos
+
+    fases = {}
+    contexto = multiprocessing.get_context()
+    with contexto.Pool(processos, initializer=_inicializar, initargs=(nome_banco,)) as pool:
+        inicio = time.perf_counter()
+        cotas = [pedidos // processos + (1 if i < pedidos % processos else 0) for i in range(processos)]
+        fases["criar"] = pool.map(
+            _tarefa_criar, [(cota, prato_ids, threads, semente + i) for i, cota in enumerate(cotas)]
+        )
+
+        fila_ids = [str(i) for i in FilaPrato.objects.values_list("id", flat=True)]
+        connections.close_all()
+        fases["finalizar"] = pool.map(
+            _tarefa_finalizar, [(fila_ids, threads, semente + i) for i in range(processos)]
+        )
+
+        pedido_ids = [r for p in fases["criar"] for r in p["resultados"]]
+        fases["retirar"] = pool.map(
+            _tarefa_retirar, [(pedido_ids, threads, semente + i) for i in range(processos)]
+        )
+        duracao = time.perf_counter() - inicio
+
+    relatorio = {
+        "processos": processos,
+        "threads": threads,
+        "pedidos": pedidos,
+        "duracao_s": round(duracao, 2),
+        "operacoes": _consolidar(fases),
+        "violacoes": _verificar(fases, pedido_ids, fila_ids),
+    }
+    connections.close_all()
+    return relatorio
+
+
+def _consolidar(fases):
+    latencias, bloqueios, tentativas, erros = {}, Counter(), Counter(), Counter()
+    for resultados in fases.values():
+        for r in resultados:
+            m = r["medicao"]
+            for operacao, valores in m["latencias"].items():
+                latencias.setdefault(operacao, []).extend(valores)
+            bloqueios.update(m["bloqueios"])
+            tentativas.update(m["tentativas"])
+            erros.update(m["erros"])
+
+    return {
+        operacao: {
+            **resumir(valores, erros[operacao]),
+            "sqlite_busy": bloqueios[operacao],
+            "tentativas": tentativas[operacao],
+        }
+        for operacao, valores in sorted(latencias.items())
+    }
+
+
+def _verificar(fases, pedido_ids, fila_ids):
+    violacoes = []
+
+    # 1. Nenhum item finalizado duas vezes (nem esquecido)
+    finalizacoes = Counter(i for r in fases["finalizar"] for i in r["resultados"])
+    duplicados = [i for i, n in finalizacoes.items() if n > 1]
+    if duplicados:
+        violacoes.append(f"{len(duplicados)} itens finalizados mais de uma vez")
+    if len(finalizacoes) != len(fila_ids):
+        violacoes.append(f"{len(fila_ids) - len(finalizacoes)} itens nunca finalizados")
+
+    # 2. Nenhum pedido entregue duas vezes
+    retiradas = Counter(i for r in fases["retirar"] for i in r["resultados"])
+    if any(n > 1 for n in retiradas.values()) or len(retiradas) != len(pedido_ids):
+        violacoes.append(f"retiradas inconsistentes: {len(retiradas)} de {len(pedido_ids)} pedidos")
+
+    # 3. Status e contadores do pedido batem com as suas unidades; total = soma dos itens
+    inconsistentes = Pedido.objects.annotate(
+        n_filas=Count("filas"),
+        n_retirados=Count("filas", filter=Q(filas__status=FilaPrato.Status.RETIRADO)),
+        soma=Sum("filas__preco_unitario"),
+    ).exclude(
+        status=Pedido.Status.RETIRADO,
+        n_retirados=F("n_filas"),
+        itens_total=F("n_filas"),
+        itens_prontos=F("n_filas"),
+        total=F("soma"),
+    )
+    for pedido in inconsistentes[:20]:
+        violacoes.append(
+            f"pedido {pedido.senha_exibicao}: status={pedido.status} filas={pedido.n_filas} "
+            f"retirados={pedido.n_retirados} contadores={pedido.itens_prontos}/{pedido.itens_total} "
+            f"total={pedido.total} soma={pedido.soma}"
+        )
+
+    if FilaPrato.objects.filter(Q(finished_at__isnull=True) | Q(started_at__isnull=True)).exists():
+        violacoes.append("itens sem horário de início/fim")
+
+    return violacoes
+
@@ -1,3 +1,1509 @@
-from django.test import TestCase
+import asyncio
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import OperationalError, connection, connections, router, transaction
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .arquivo import _copiar, anexar, arquivar_retirados, arquivar_tma, compactar_mudancas, desanexar, historico
+from .cache_versoes import respostas
+from .events import EventBus, bus, publicar_apos_commit, sse_application
+from .fila_memoria import FilaMemoria
+from .instrumentacao import agregador
+from .logic_printing import Spooler, devolver_interrompidos
+from .models import ChaveIdempotencia, Pedido, FilaPrato, Prato, RegistroMudanca, TMA, TMAAtual, TrabalhoImpressao
+from . import metricas, services
+from .services import (
+    chamar_proximo_pedido,
+    create_order,
+    create_order_idempotente,
+    claim_next,
+    finalize_prato,
+    finalize_pratos_lote,
+    registrar_retirada_total_pedido,
+    calculate_tma_for_prato,
+    registrar_tma,
+    _sql_claim_next,
+)
+from .routers import LEITURA_ALIAS, usar_leitura
+from .selectors import cursor_da_unidade, ler_cursor, pedidos_na_fila, unidades_no_painel
+from .stress import executar_stress
+from .tma_worker import TMAWorker
+from .views import FinalizarLoteView
+from .write_queue import EscritaExpirada, WriteQueue
+
+
+def criar_pedido_liberado(prato, quantidade, tipo=Pedido.Tipo.NORMAL):
+    pedido = create_order(tipo, [{"prato_id": prato.id, "quantidade": quantidade}])
+    Pedido.objects.filter(id=pedido.id).update(status=Pedido.Status.PRODUCAO)
+    FilaPrato.objects.filter(pedido=pedido).update(prioridade=pedido.prioridade)
+    return pedido
+
+
+# =========================
+# PEGAR PRÓXIMO ITEM (ESTAÇÃO)
+# =========================
+
+class ClaimNextTests(TestCase):
+    def setUp(self):
+        self.prato = Prato.objects.create(nome="Pastel", preco="10.00")
+
+    def test_preferencial_antes_do_normal(self):
+        normal = criar_pedido_liberado(self.prato, 1)
+        preferencial = criar_pedido_liberado(self.prato, 1, tipo=Pedido.Tipo.PREFERENCIAL)
+
+        self.assertEqual(claim_next(self.prato.id, "E1").pedido_id, preferencial.id)
+        self.assertEqual(claim_next(self.prato.id, "E1").pedido_id, normal.id)
+        self.assertIsNone(claim_next(self.prato.id, "E1"))
+
+    def test_ignora_pedido_nao_liberado(self):
+        create_order(Pedido.Tipo.NORMAL, [{"prato_id": self.prato.id}])
+
+        self.assertIsNone(claim_next(self.prato.id, "E1"))
+
+    def test_marca_item_com_estacao_e_inicio(self):
+        criar_pedido_liberado(self.prato, 1)
+
+        item = claim_next(self.prato.id, "E7")
+
+        item.refresh_from_db()
+        self.assertEqual(item.status, FilaPrato.Status.EM_PRODUCAO)
+        self.assertEqual(item.estacao, "E7")
+        self.assertIsNotNone(item.started_at)
+
+    def test_endpoint_sem_itens_retorna_204(self):
+        url = f"/api/v1/fila/iniciar/{self.prato.id}/"
+
+        self.assertEqual(self.client.post(url, {"estacao": "E1"}).status_code, 204)
+        self.assertEqual(self.client.post(url, {}).status_code, 400)
+
+
+class ClaimNextConcorrenciaTests(TransactionTestCase):
+    ESTACOES = 8
+
+    def test_nenhum_item_pego_duas_vezes(self):
+        prato = Prato.objects.create(nome="Pastel", preco="10.00")
+        for _ in range(5):
+            criar_pedido_liberado(prato, 10)
+
+        pegos = []
+        erros = []
+        largada = threading.Barrier(self.ESTACOES)
+
+        def estacao(nome):
+            try:
+                largada.wait()
+                while True:
+                    item = claim_next(prato.id, nome)
+                    if item is None:
+                        break
+                    pegos.append((item.id, nome))
+            except Exception as e:
+                erros.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=estacao, args=(f"E{i}",)) for i in range(self.ESTACOES)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(erros, [])
+        ids = [fila_id for fila_id, _ in pegos]
+        self.assertEqual(len(ids), 50)
+        self.assertEqual(len(set(ids)), 50)
+
+        # O que está no banco bate com quem pegou cada item
+        for fila_id, nome in pegos:
+            self.assertEqual(FilaPrato.objects.get(id=fila_id).estacao, nome)
+        self.assertFalse(FilaPrato.objects.filter(status=FilaPrato.Status.PENDENTE).exists())
+
+
+# =========================
+# CONTADORES DE PROGRESSO DO PEDIDO
+# =========================
+
+class ContadoresPedidoTests(TestCase):
+    def setUp(self):
+        self.prato = Prato.objects.create(nome="Pastel", preco="10.00")
+        self.pedido = criar_pedido_liberado(self.prato, 3)
+        self.filas = list(self.pedido.filas.values_list("id", flat=True))
+
+    def test_create_order_define_total_de_itens(self):
+        self.pedido.refresh_from_db()
+        self.assertEqual((self.pedido.itens_total, self.pedido.itens_prontos), (3, 0))
+
+    def test_finalize_conta_e_fecha_o_pedido_no_ultimo_item(self):
+        finalize_prato(self.filas[0])
+        finalize_prato(self.filas[0])  # Repetido: não conta de novo
+        self.pedido.refresh_from_db()
+        self.assertEqual(self.pedido.itens_prontos, 1)
+        self.assertEqual(self.pedido.status, Pedido.Status.PRODUCAO)
+
+        finalize_pratos_lote(self.filas[1:])
+        self.pedido.refresh_from_db()
+        self.assertEqual(self.pedido.itens_prontos, 3)
+        self.assertEqual(self.pedido.status, Pedido.Status.FINALIZADO)
+
+    def test_lote_com_itens_ja_finalizados_no_mesmo_instante(self):
+        # Relógio parado: o item finalizado antes tem o mesmo finished_at que o lote
+        instante = timezone.now()
+        with mock.patch("django.utils.timezone.now", return_value=instante):
+            finalize_prato(self.filas[0])
+            resultados = finalize_pratos_lote(self.filas)
+
+        self.assertEqual(
+            [r["resultado"] for r in resultados], ["JA_FINALIZADO", "FINALIZADO", "FINALIZADO"]
+        )
+        self.pedido.refresh_from_db()
+        self.assertEqual((self.pedido.itens_prontos, self.pedido.status), (3, Pedido.Status.FINALIZADO))
+        eventos = RegistroMudanca.objects.filter(tipo="item_finalizado")
+        self.assertEqual(sorted(e.dados["fila_id"] for e in eventos), sorted(str(i) for i in self.filas))
+
+    def test_finalizar_item_ja_retirado_nao_reabre_o_pedido(self):
+        pedido = criar_pedido_liberado(self.prato, 1)
+        fila_id = pedido.filas.get().id
+        finalize_prato(fila_id)
+        registrar_retirada_total_pedido(pedido.id)
+
+        # Toque repetido na estação depois da entrega (unidade antiga)
+        self.assertIsNone(finalize_prato(fila_id))
+        self.assertEqual(finalize_pratos_lote([fila_id])[0]["resultado"], "JA_FINALIZADO")
+
+        pedido.refresh_from_db()
+        self.assertEqual((pedido.status, pedido.itens_prontos, pedido.itens_total), (Pedido.Status.RETIRADO, 1, 1))
+        self.assertEqual(pedido.filas.get().status, FilaPrato.Status.RETIRADO)
+
+    def test_retirada_exige_todos_prontos(self):
+        finalize_prato(self.filas[0])
+        with self.assertRaises(ValidationError):
+            registrar_retirada_total_pedido(self.pedido.id)
+
+        finalize_pratos_lote(self.filas)
+        self.assertEqual(registrar_retirada_total_pedido(self.pedido.id).status, Pedido.Status.RETIRADO)
+
+
+class FinalizarLoteViewTests(TestCase):
+    URL = "/api/v1/fila/finalizar/lote/"
+
+    def setUp(self):
+        self.prato = Prato.objects.create(nome="Pastel", preco="10.00")
+        self.filas = [str(i) for i in criar_pedido_liberado(self.prato, 3).filas.values_list("id", flat=True)]
+
+    def finalizar(self, corpo):
+        return self.client.post(self.URL, corpo, content_type="application/json")
+
+    def test_lista_ausente_ou_vazia(self):
+        for corpo in ({}, {"fila_ids": []}, {"fila_ids": self.filas[0]}):
+            self.assertEqual(self.finalizar(corpo).status_code, 400, corpo)
+
+    def test_acima_do_limite(self):
+        with mock.patch.object(FinalizarLoteView, "MAX_ITENS", 2):
+            resposta = self.finalizar({"fila_ids": self.filas})
+
+        self.assertEqual(resposta.status_code, 400)
+        self.assertFalse(FilaPrato.objects.filter(status=FilaPrato.Status.FINALIZADO).exists())
+
+    def test_id_que_nao_e_uuid(self):
+        resposta = self.finalizar({"fila_ids": [self.filas[0], "abc"]})
+
+        self.assertEqual(resposta.status_code, 400)
+        self.assertFalse(FilaPrato.objects.filter(status=FilaPrato.Status.FINALIZADO).exists())
+
+    def test_lote_misto(self):
+        finalize_prato(self.filas[0])
+        inexistente = str(uuid.uuid4())
+
+        resposta = self.finalizar({"fila_ids": [self.filas[0], self.filas[1], inexistente, self.filas[2]]})
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json()["finalizados"], 2)
+        self.assertEqual(
+            [(r["fila_id"], r["resultado"]) for r in resposta.json()["resultados"]],
+            [
+                (self.filas[0], "JA_FINALIZADO"),
+                (self.filas[1], "FINALIZADO"),
+                (inexistente, "NAO_ENCONTRADO"),
+                (self.filas[2], "FINALIZADO"),
+            ],
+        )
+        self.assertFalse(FilaPrato.objects.exclude(status=FilaPrato.Status.FINALIZADO).exists())
+
+
+# =========================
+# CRIAÇÃO IDEMPOTENTE
+# =========================
+
+class CriarPedidoIdempotenteTests(TestCase):
+    def setUp(self):
+        self.prato = Prato.objects.create(nome="Pastel", preco="10.00")
+        self.corpo = {"tipo": "NORMAL", "itens": [{"prato_id": str(self.prato.id), "quantidade": 2}]}
+
+    def criar(self, corpo, chave="caixa-1"):
+        return self.client.post(
+            "/api/v1/pedidos/criar/", corpo, content_type="application/json", HTTP_IDEMPOTENCY_KEY=chave
+        )
+
+    def test_repeticao_da_chave_devolve_o_pedido_original(self):
+        primeira = self.criar(self.corpo)
+        repeticao = self.criar(self.corpo)
+
+        self.assertEqual(primeira.status_code, 201)
+        self.assertEqual(repeticao.status_code, 201)
+        self.assertNotIn("Idempotent-Replayed", primeira)
+        self.assertEqual(repeticao["Idempotent-Replayed"], "true")
+        self.assertEqual(repeticao.json()["id"], primeira.json()["id"])
+        self.assertEqual(repeticao.json()["senha"], primeira.json()["senha"])
+        self.assertEqual(Pedido.objects.count(), 1)
+        self.assertEqual(FilaPrato.objects.count(), 2)
+
+    def test_mesma_chave_com_outro_corpo_e_recusada(self):
+        self.criar(self.corpo)
+        outro = {"tipo": "NORMAL", "itens": [{"prato_id": str(self.prato.id), "quantidade": 3}]}
+
+        resposta = self.criar(outro)
+
+        self.assertEqual(resposta.status_code, 422)
+        self.assertEqual(Pedido.objects.count(), 1)
+        self.assertEqual(FilaPrato.objects.count(), 2)
+
+    def test_ordem_dos_itens_nao_muda_a_assinatura(self):
+        outro_prato = Prato.objects.create(nome="Caldo", preco="8.00")
+        itens = [{"prato_id": str(self.prato.id)}, {"prato_id": str(outro_prato.id).upper(), "quantidade": 1}]
+        self.criar({"tipo": "NORMAL", "itens": itens})
+
+        resposta = self.criar({"tipo": "NORMAL", "itens": list(reversed(itens))})
+
+        self.assertEqual(resposta["Idempotent-Replayed"], "true")
+        self.assertEqual(Pedido.objects.count(), 1)
+
+    def test_corrida_na_chave_devolve_o_pedido_de_quem_gravou_primeiro(self):
+        vencedor, _ = create_order_idempotente("caixa-1", **self.corpo)
+        consultar = services._pedido_da_chave
+        consultas = []
+
+        def chave_ainda_nao_commitada(*args):
+            # A consulta inicial não vê a chave (a outra requisição ainda não tinha commitado);
+            # o INSERT esbarra no índice único e a releitura acha o pedido do vencedor
+            consultas.append(args)
+            return None if len(consultas) == 1 else consultar(*args)
+
+        with mock.patch.object(services, "_pedido_da_chave", side_effect=chave_ainda_nao_commitada):
+            pedido, criado = create_order_idempotente("caixa-1", **self.corpo)
+
+        self.assertEqual(len(consultas), 2)
+        self.assertFalse(criado)
+        self.assertEqual(pedido.id, vencedor.id)
+        self.assertEqual(Pedido.objects.count(), 1)
+        self.assertEqual(ChaveIdempotencia.objects.count(), 1)
+
+    def test_chave_que_nao_e_texto_e_recusada(self):
+        for chave in (5, ["caixa-1"], ""):
+            resposta = self.client.post(
+                "/api/v1/pedidos/criar/", {**self.corpo, "idempotency_key": chave}, content_type="application/json"
+            )
+            self.assertEqual(resposta.status_code, 400, chave)
+
+        self.assertEqual(Pedido.objects.count(), 0)
+
+
+# =========================
+# SINCRONIZAÇÃO DO CAIXA OFFLINE
+# =========================
+
+class SincronizarPedidosTests(TestCase):
+    def setUp(self):
+        self.prato = Prato.objects.create(nome="Pastel", preco="10.00")
+
+    def sincronizar(self, pedidos):
+        resposta = self.client.post("/api/v1/pedidos/sincronizar/", {"pedidos": pedidos}, content_type="application/json")
+        self.assertEqual(resposta.status_code, 200)
+        return {r["idempotency_key"]: r for r in resposta.json()["resultados"]}
+
+    def test_reenvio_do_lote_volta_duplicado_com_a_mesma_senha(self):
+        lote = [
+            {"idempotency_key": "off-1", "tipo": "NORMAL", "itens": [{"prato_id": str(self.prato.id)}]},
+            {"idempotency_key": "off-2", "tipo": "NORMAL", "itens": [{"prato_id": str(self.prato.id), "quantidade": 2}]},
+        ]
+        primeiro = self.sincronizar(lote)
+        reenvio = self.sincronizar(lote)
+
+        self.assertEqual({r["resultado"] for r in primeiro.values()}, {"CRIADO"})
+        self.assertEqual({r["resultado"] for r in reenvio.values()}, {"DUPLICADO"})
+        self.assertEqual(reenvio["off-2"]["senha"], primeiro["off-2"]["senha"])
+        self.assertEqual(Pedido.objects.count(), 2)
+        self.assertEqual(FilaPrato.objects.count(), 3)
+
+    def test_chave_repetida_com_outro_pedido_volta_erro(self):
+        self.sincronizar([{"idempotency_key": "off-1", "tipo": "NORMAL", "itens": [{"prato_id": str(self.prato.id)}]}])
+
+        resultados = self.sincronizar([
+            {"idempotency_key": "off-1", "tipo": "PREFERENCIAL", "itens": [{"prato_id": str(self.prato.id)}]},
+        ])
+
+        self.assertEqual(resultados["off-1"]["resultado"], "ERRO")
+        self.assertEqual(Pedido.objects.count(), 1)
+
+    def test_itens_invalidos_voltam_erro_sem_travar_o_lote(self):
+        resultados = self.sincronizar([
+            {"idempotency_key": "ok", "tipo": "NORMAL", "itens": [{"prato_id": str(self.prato.id)}]},
+            {"idempotency_key": "sem-itens", "tipo": "NORMAL", "itens": []},
+            {"idempotency_key": "tipo", "tipo": "VIP", "itens": [{"prato_id": str(self.prato.id)}]},
+            {"idempotency_key": "prato", "tipo": "NORMAL", "itens": [{"prato_id": "x"}]},
+            {"tipo": "NORMAL", "itens": [{"prato_id": str(self.prato.id)}]},
+        ])
+
+        self.assertEqual(resultados["ok"]["resultado"], "CRIADO")
+        for chave in ("sem-itens", "tipo", "prato", ""):
+            self.assertEqual(resultados[chave]["resultado"], "ERRO")
+        self.assertEqual(Pedido.objects.count(), 1)
+
+    def test_horario_do_caixa_define_a_ordem(self):
+        agora = timezone.now()
+        antes = agora - timedelta(minutes=30)
+        resultados = self.sincronizar([
+            {"idempotency_key": "depois", "tipo": "NORMAL", "itens": [{"prato_id": str(self.prato.id)}],
+             "criado_em": (antes + timedelta(minutes=5)).isoformat()},
+            {"idempotency_key": "antes", "tipo": "NORMAL", "itens": [{"prato_id": str(self.prato.id)}],
+             "criado_em": antes.isoformat()},
+            {"idempotency_key": "futuro", "tipo": "NORMAL", "itens": [{"prato_id": str(self.prato.id)}],
+             "criado_em": (agora + timedelta(hours=1)).isoformat()},
+        ])
+
+        pedido = Pedido.objects.get(id=resultados["antes"]["pedido_id"])
+        self.assertEqual(pedido.created_at, antes)
+        self.assertTrue(FilaPrato.objects.filter(pedido=pedido, created_at=antes).exists())
+        self.assertLessEqual(Pedido.objects.get(id=resultados["futuro"]["pedido_id"]).created_at, timezone.now())
+        # Senhas na ordem em que as vendas aconteceram no caixa
+        self.assertLess(resultados["antes"]["senha"], resultados["depois"]["senha"])
+
+
+# =========================
+# SENHA SEQUENCIAL
+# =========================
+
+class SenhaSequencialTests(TestCase):
+    def setUp(self):
+        self.prato = Prato.objects.create(nome="Pastel", preco="10.00")
+
+    def test_senhas_seguidas_no_evento(self):
+        senhas = [create_order(Pedido.Tipo.NORMAL, [{"prato_id": self.prato.id}]).senha for _ in range(3)]
+        self.assertEqual(senhas, [1, 2, 3])
+
+    def test_busca_no_balcao_por_senha(self):
+        pedido = create_order(Pedido.Tipo.NORMAL, [{"prato_id": self.prato.id, "quantidade": 2}])
+
+        resposta = self.client.get(f"/api/v1/pedidos/senha/{pedido.senha}/")
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json()["pedido_id"], str(pedido.id))
+        self.assertEqual(resposta.json()["itens"], [{"nome": "Pastel", "quantidade": 2}])
+
+        self.assertEqual(self.client.get("/api/v1/pedidos/senha/999/").status_code, 404)
+
+
+class SenhaDepoisDoArquivoTests(TransactionTestCase):
+    # ATTACH do arquivo só fora de transação: precisa de commits de verdade
+    def test_senha_nao_repete_depois_de_arquivar(self):
+        pasta = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, pasta, ignore_errors=True)
+        prato = Prato.objects.create(nome="Pastel", preco="10.00")
+
+        with override_settings(EVENTO="festa2026", ARQUIVO_DB_PATH=pasta / "arquivo.sqlite3"):
+            for _ in range(3):
+                create_order(Pedido.Tipo.NORMAL, [{"prato_id": prato.id}])
+            Pedido.objects.update(status=Pedido.Status.RETIRADO)
+            self.assertEqual(arquivar_retirados(timezone.now())["pedidos"], 3)
+
+            pedido = create_order(Pedido.Tipo.NORMAL, [{"prato_id": prato.id}])
+
+        self.assertEqual(pedido.senha, 4)
+
+
+# =========================
+# ARQUIVO (FECHAMENTO DO DIA)
+# =========================
+
+class ArquivoTests(TransactionTestCase):
+    def setUp(self):
+        pasta = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, pasta, ignore_errors=True)
+        self.configuracao = override_settings(ARQUIVO_DB_PATH=pasta / "arquivo.sqlite3")
+        self.configuracao.enable()
+        self.addCleanup(self.configuracao.disable)
+        self.prato = Prato.objects.create(nome="Pastel", preco="10.00")
+
+    def contar_no_historico(self, visao):
+        with historico() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {visao}")
+            return cursor.fetchone()[0]
+
+    def test_move_retirados_e_le_pelo_historico(self):
+        retirado = create_order(Pedido.Tipo.NORMAL, [{"prato_id": self.prato.id, "quantidade": 2}])
+        create_order(Pedido.Tipo.NORMAL, [{"prato_id": self.prato.id}])
+        Pedido.objects.filter(id=retirado.id).update(status=Pedido.Status.RETIRADO)
+
+        self.assertEqual(arquivar_retirados(timezone.now()), {"pedidos": 1, "itens": 2})
+
+        self.assertFalse(Pedido.objects.filter(id=retirado.id).exists())
+        self.assertEqual(FilaPrato.objects.count(), 1)
+        self.assertEqual(self.contar_no_historico("historico_pedido"), 2)
+        self.assertEqual(self.contar_no_historico("historico_filaprato"), 3)
+        self.assertEqual(arquivar_retirados(timezone.now()), {"pedidos": 0, "itens": 0})
+
+    def test_reexecucao_depois_de_cair_entre_copia_e_remocao(self):
+        pedido = create_order(Pedido.Tipo.NORMAL, [{"prato_id": self.prato.id}])
+        Pedido.objects.update(status=Pedido.Status.RETIRADO)
+
+        # Só a primeira transação (cópia) chegou ao arquivo
+        valores = [Pedido._meta.pk.get_db_prep_value(pedido.id, connection)]
+        with connection.cursor() as cursor:
+            anexar(cursor)
+            with transaction.atomic():
+                _copiar(cursor, Pedido, "id", valores)
+            desanexar(cursor)
+        self.assertEqual(self.contar_no_historico("historico_pedido"), 2)  # Nos dois bancos
+
+        self.assertEqual(arquivar_retirados(timezone.now()), {"pedidos": 1, "itens": 1})
+        self.assertEqual(Pedido.objects.count(), 0)
+        self.assertEqual(self.contar_no_historico("historico_pedido"), 1)  # Sem duplicar
+
+    def test_tma_e_log_de_mudancas(self):
+        create_order(Pedido.Tipo.NORMAL, [{"prato_id": self.prato.id}])
+        TMA.objects.create(prato=self.prato, valor_tma_seg=300)
+        TMA.objects.create(prato=self.prato, valor_tma_seg=240)
+        corte = timezone.now()
+        RegistroMudanca.objects.create(tipo="teste", dados={})
+
+        self.assertEqual(arquivar_tma(corte), 2)
+        self.assertEqual(compactar_mudancas(corte), 1)
+
+        self.assertEqual(TMA.objects.count(), 0)
+        self.assertEqual(list(RegistroMudanca.objects.values_list("tipo", flat=True)), ["teste"])
+        self.assertEqual(self.contar_no_historico("historico_tma"), 2)
+        self.assertEqual(self.contar_no_historico("historico_mudanca"), 2)
+
+
+# =========================
+# PLANOS DE CONSULTA DA FILA
+# =========================
+
+class PlanoConsultaFilaTests(TestCase):
+    """A ordem da fila tem que sair de um índice: nada de ordenar os pendentes."""
+
+    def setUp(self):
+        prato = Prato.objects.create(nome="Pastel", preco="10.00")
+        self.prato_id = prato.id
+        for i in range(20):
+            tipo = Pedido.Tipo.PREFERENCIAL if i % 3 == 0 else Pedido.Tipo.NORMAL
+            if i % 2:
+                criar_pedido_liberado(prato, 2, tipo=tipo)
+            else:
+                create_order(tipo, [{"prato_id": prato.id}])
+
+    def assertUsaIndice(self, plano, indice):
+        self.assertRegex(plano, rf"USING (COVERING )?INDEX {indice}\b")
+        self.assertNotIn("TEMP B-TREE", plano)
+
+    def test_proximo_pedido(self):
+        self.assertUsaIndice(pedidos_na_fila()[:10].explain(), "idx_pedido_fila")
+
+    def test_painel_por_prato_e_geral(self):
+        self.assertUsaIndice(unidades_no_painel(self.prato_id).explain(), "idx_fila_prato_prioridade")
+        self.assertUsaIndice(unidades_no_painel().explain(), "idx_fila_status_prioridade")
+
+    def test_pagina_seguinte_pelo_cursor(self):
+        primeira = unidades_no_painel(self.prato_id).values("id", "prioridade", "created_at")[:5]
+        ultima = list(primeira)[-1]
+        apos = ler_cursor(cursor_da_unidade(ultima["prioridade"], ultima["created_at"], ultima["id"]))
+
+        self.assertUsaIndice(unidades_no_painel(self.prato_id, apos)[:5].explain(), "idx_fila_prato_prioridade")
+
+    def test_claim_next_sem_join(self):
+        sql, params = _sql_claim_next(self.prato_id, "E1")
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            plano = "\n".join(str(linha[-1]) for linha in cursor.fetchall())
+
+        self.assertUsaIndice(plano, "idx_fila_prato_prioridade")
+        self.assertNotIn(Pedido._meta.db_table, plano)
+
+    def test_ordem_preferencial_depois_horario(self):
+        prioridades = list(unidades_no_painel().values_list("prioridade", "created_at"))
+        self.assertEqual(prioridades, sorted(prioridades))
+        self.assertEqual(prioridades[0][0], 0)
+
+
+# =========================
+# FILA EM MEMÓRIA
+# =========================
+
+class FilaMemoriaTests(TestCase):
+    def setUp(self):
+        self.pastel = Prato.objects.create(nome="Pastel", preco="10.00")
+        self.caldo = Prato.objects.create(nome="Caldo", preco="8.00")
+        self.memoria = FilaMemoria()
+        self.memoria.carregar()
+        bus.assinar(self.memoria.ao_evento)
+        self.addCleanup(bus.desassinar, self.memoria.ao_evento)
+
+    def assertIgualAoBanco(self):
+        self.assertEqual(
+            [p["pedido_id"] for p in self.memoria.pedidos_pendentes()],
+            [str(i) for i in pedidos_na_fila().values_list("id", flat=True)],
+        )
+        # Unidades do mesmo pedido empatam na ordem: basta a sequência de pedidos
+        unidades, _ = self.memoria.painel()
+        no_banco = list(unidades_no_painel().values_list("id", "pedido_id"))
+        self.assertEqual([u["pedido_id"] for u in unidades], [str(p) for _, p in no_banco])
+        self.assertEqual({u["fila_id"] for u in unidades}, {str(i) for i, _ in no_banco})
+
+    def test_write_through_segue_a_ordem_do_banco(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            normal = create_order(Pedido.Tipo.NORMAL, [{"prato_id": self.pastel.id, "quantidade": 2}])
+            preferencial = create_order(
+                Pedido.Tipo.PREFERENCIAL,
+                [{"prato_id": self.pastel.id}, {"prato_id": self.caldo.id}],
+            )
+
+        self.assertEqual(
+            [p["pedido_id"] for p in self.memoria.pedidos_pendentes()], [str(preferencial.id), str(normal.id)]
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            chamar_proximo_pedido()
+            chamar_proximo_pedido()
+
+        self.assertIgualAoBanco()
+        pasteis, _ = self.memoria.painel(self.pastel.id)
+        self.assertEqual([u["pedido_id"] for u in pasteis], [str(preferencial.id), str(normal.id), str(normal.id)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            finalize_prato(pasteis[0]["fila_id"])
+        self.assertIgualAoBanco()
+        self.assertEqual(len(self.memoria.painel(self.pastel.id)[0]), 2)
+
+    def test_delta_da_janela_desde_a_versao(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(3):
+                create_order(Pedido.Tipo.NORMAL, [{"prato_id": self.pastel.id}])
+                chamar_proximo_pedido()
+        janela, versao = self.memoria.painel(self.pastel.id, limite=2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            finalize_prato(janela[0]["fila_id"])  # Sai da janela: a 3ª unidade subiria...
+            create_order(Pedido.Tipo.PREFERENCIAL, [{"prato_id": self.pastel.id}])
+            chamar_proximo_pedido()  # ...mas a preferencial entra no topo antes dela
+
+        inseridas, removidas, nova_versao = self.memoria.mudancas_desde(versao, self.pastel.id, limite=2)
+        atual, _ = self.memoria.painel(self.pastel.id, limite=2)
+
+        self.assertEqual(removidas, [janela[0]["fila_id"]])
+        self.assertEqual([u["fila_id"] for u in inseridas], [atual[0]["fila_id"]])
+        self.assertEqual(atual[1]["fila_id"], janela[1]["fila_id"])
+        self.assertEqual(self.memoria.mudancas_desde(nova_versao, self.pastel.id, limite=2), ([], [], nova_versao))
+        self.assertIsNone(self.memoria.mudancas_desde("outroprocesso.1", self.pastel.id))
+
+    def test_escritas_de_outro_processo_chegam_pelo_log(self):
+        # Sem executar os on_commit: como se outro worker tivesse gravado
+        create_order(Pedido.Tipo.NORMAL, [{"prato_id": self.pastel.id, "quantidade": 2}])
+        chamar_proximo_pedido()
+        self.assertEqual(self.memoria.painel()[0], [])
+
+        self.memoria.acompanhar()
+        self.assertIgualAoBanco()
+        self.assertEqual(len(self.memoria.painel(self.pastel.id)[0]), 2)
+
+        # O evento do próprio processo que já veio pelo log não é reaplicado
+        with self.captureOnCommitCallbacks(execute=True):
+            pedido = create_order(Pedido.Tipo.NORMAL, [{"prato_id": self.caldo.id}])
+        self.assertEqual([p["pedido_id"] for p in self.memoria.pedidos_pendentes()], [str(pedido.id)])
+
+    def test_troca_de_unidade_com_mesma_contagem_e_detectada(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            pedido = create_order(Pedido.Tipo.NORMAL, [{"prato_id": self.pastel.id}])
+            chamar_proximo_pedido()
+        unidade = FilaPrato.objects.get(pedido=pedido)
+        FilaPrato.objects.filter(id=unidade.id).update(status=FilaPrato.Status.FINALIZADO)
+        FilaPrato.objects.create(
+            pedido=pedido, prato=self.pastel, preco_unitario=unidade.preco_unitario, prioridade=unidade.prioridade
+        )
+
+        self.assertFalse(self.memoria.verificar())
+        self.assertTrue(self.memoria.verificar())
+        self.assertIgualAoBanco()
+
+    def usar_no_claim(self):
+        # claim_next consulta a fila global (desligada nos testes); aqui, a deste teste
+        for patcher in (
+            mock.patch("core.services.fila_memoria", self.memoria),
+            mock.patch.object(self.memoria, "disponivel", return_value=True),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_claim_desfeito_devolve_a_unidade_ao_heap(self):
+        self.usar_no_claim()
+        with self.captureOnCommitCallbacks(execute=True):
+            preferencial = criar_pedido_liberado(self.pastel, 1, tipo=Pedido.Tipo.PREFERENCIAL)
+            criar_pedido_liberado(self.pastel, 1)
+        self.memoria.carregar()
+        primeira = str(preferencial.filas.get().id)
+
+        with mock.patch("core.services.registrar_mudanca", side_effect=RuntimeError("log indisponível")):
+            with self.assertRaises(RuntimeError):
+                claim_next(self.pastel.id, "chapa")
+
+        self.assertEqual(self.memoria.painel(self.pastel.id)[0][0]["fila_id"], primeira)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(str(claim_next(self.pastel.id, "chapa").id), primeira)
+        self.assertEqual(self.memoria._reservas, {})
+        self.assertIgualAoBanco()
+
+    def test_reserva_sem_commit_volta_depois_do_prazo(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            criar_pedido_liberado(self.pastel, 2)
+        self.memoria.carregar()
+        reservada = self.memoria.reservar(self.pastel.id)
+        self.assertEqual(len(self.memoria.painel(self.pastel.id)[0]), 1)
+
+        self.assertEqual(self.memoria.devolver_vencidas(60), [])  # Ainda no prazo
+        self.assertEqual(self.memoria.devolver_vencidas(0), [reservada["fila_id"]])
+        self.assertIgualAoBanco()
+
+    def test_buraco_no_seq_nao_consulta_o_banco_na_thread_do_request(self):
+        # Escrita de "outro processo" (sem on_commit) abre um buraco no seq
+        create_order(Pedido.Tipo.NORMAL, [{"prato_id": self.caldo.id}])
+        with self.captureOnCommitCallbacks() as callbacks:
+            pedido = create_order(Pedido.Tipo.NORMAL, [{"prato_id": self.pastel.id}])
+
+        with self.assertNumQueries(0):
+            for callback in callbacks:
+                callback()
+        self.assertEqual(self.memoria.pedidos_pendentes(), [])
+
+        self.memoria.acompanhar()  # O que a thread _vigiar faz a cada meio segundo
+        self.assertIn(str(pedido.id), [p["pedido_id"] for p in self.memoria.pedidos_pendentes()])
+        self.assertIgualAoBanco()
+
+    def test_divergencia_recarrega_do_banco(self):
+        # Sem executar os on_commit: o banco muda e a memória não fica sabendo
+        criar_pedido_liberado(self.pastel, 2)
+
+        self.assertFalse(self.memoria.verificar())  # Pode ser só um evento a caminho
+        self.assertTrue(self.memoria.verificar())
+        self.assertIgualAoBanco()
+
+
+class PainelPaginadoTests(TestCase):
+    def test_cursor_percorre_a_fila_sem_repetir(self):
+        prato = Prato.objects.create(nome="Pastel", preco="10.00")
+        criar_pedido_liberado(prato, 3)
+        criar_pedido_liberado(prato, 2, tipo=Pedido.Tipo.PREFERENCIAL)
+
+        with override_settings(FILA_MEMORIA_ATIVA=False):
+            completo = self.client.get("/api/v1/fila/painel/").json()["pendentes"]
+            paginas, cursor = [], ""
+            while cursor is not None:
+                resposta = self.client.get("/api/v1/fila/painel/", {"limit": 2, "cursor": cursor}).json()
+                paginas += resposta["pendentes"]
+                cursor = resposta["proximo_cursor"]
+
+            self.assertEqual(self.client.get("/api/v1/fila/painel/", {"cursor": "x"}).status_code, 400)
+
+        self.assertEqual(len(completo), 5)
+        self.assertEqual([u["fila_id"] for u in paginas], [u["fila_id"] for u in completo])
+        self.assertEqual(completo[0]["tipo"], Pedido.Tipo.PREFERENCIAL)
+
+
+# =========================
+# LOG DE MUDANÇAS
+# =========================
+
+class LogMudancasTests(TestCase):
+    def setUp(self):
+        self.prato = Prato.objects.create(nome="Pastel", preco="10.00")
+
+    def test_services_gravam_o_log_e_publicam_o_seq(self):
+        publicados = []
+        bus.assinar(publicados.append)
+        self.addCleanup(bus.desassinar, publicados.append)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            pedido = create_order(Pedido.Tipo.NORMAL, [{"prato_id": self.prato.id, "quantidade": 2}])
+        with self.captureOnCommitCallbacks(execute=True):
+            chamar_proximo_pedido()
+        with self.captureOnCommitCallbacks(execute=True):
+            finalize_pratos_lote([claim_next(self.prato.id, "chapa").id, claim_next(self.prato.id, "chapa").id])
+
+        registros = list(RegistroMudanca.objects.order_by("id"))
+        self.assertEqual(
+            [r.tipo for r in registros],
+            ["pedido_criado", "pedido_liberado", "item_iniciado", "item_iniciado", "item_finalizado", "item_finalizado"],
+        )
+        self.assertEqual(registros[0].dados["pedido_id"], str(pedido.id))
+        # O aviso do barramento carrega o seq do registro gravado
+        self.assertEqual(
+            [e["dados"]["seq"] for e in publicados if "seq" in e["dados"]], [r.id for r in registros]
+        )
+
+    def test_api_pagina_pelo_since_e_responde_410_depois_da_compactacao(self):
+        for _ in range(3):
+            create_order(Pedido.Tipo.NORMAL, [{"prato_id": self.prato.id}])
+        seqs = list(RegistroMudanca.objects.order_by("id").values_list("id", flat=True))
+        inicio = seqs[0] - 1
+
+        pagina = self.client.get("/api/v1/changes/", {"since": inicio, "limit": 2}).json()
+        self.assertEqual([m["seq"] for m in pagina["mudancas"]], seqs[:2])
+        self.assertTrue(pagina["mais"])
+
+        resto = self.client.get("/api/v1/changes/", {"since": pagina["ultimo"]}).json()
+        self.assertEqual([m["seq"] for m in resto["mudancas"]], seqs[2:])
+        self.assertFalse(resto["mais"])
+        self.assertEqual(resto["atual"], seqs[-1])
+
+        RegistroMudanca.objects.filter(id__lte=seqs[1]).delete()
+        self.assertEqual(self.client.get("/api/v1/changes/", {"since": inicio}).status_code, 410)
+        self.assertEqual(self.client.get("/api/v1/changes/", {"since": seqs[1]}).status_code, 200)
+        self.assertEqual(self.client.get("/api/v1/changes/", {"since": "x"}).status_code, 400)
+
+
+# =========================
+# PRAGMAS DO SQLITE
+# =========================
+
+class PragmasConexaoTests(TestCase):
+    databases = {"default", "leitura"}
+    # Valor de PRAGMA synchronous por nome
+    SYNCHRONOUS = {"OFF": 0, "NORMAL": 1, "FULL": 2, "EXTRA": 3}
+
+    def pragmas(self, alias):
+        # Conexão nova com as OPTIONS de produção do alias, apontando para o banco de teste
+        config = {**connections.settings[alias], "NAME": connection.settings_dict["NAME"]}
+        conexao = DatabaseWrapper(config, alias)
+        self.addCleanup(conexao.close)
+        with conexao.cursor() as cursor:
+            return {
+                nome: cursor.execute(f"PRAGMA {nome}").fetchone()[0]
+                for nome in ("journal_mode", "synchronous", "query_only")
+            }
+
+    def test_conexao_nova_aplica_o_perfil_ativo(self):
+        for alias in ("default", LEITURA_ALIAS):
+            pragmas = self.pragmas(alias)
+            self.assertEqual(pragmas["journal_mode"].upper(), settings.SQLITE_PRAGMAS["journal_mode"], alias)
+            self.assertEqual(
+                pragmas["synchronous"], self.SYNCHRONOUS[settings.SQLITE_PRAGMAS["synchronous"]], alias
+            )
+
+    def test_so_a_leitura_e_query_only(self):
+        self.assertEqual(self.pragmas("default")["query_only"], 0)
+        self.assertEqual(self.pragmas(LEITURA_ALIAS)["query_only"], 1)
+
+
+# =========================
+# CONEXÃO SÓ DE LEITURA
+# =========================
+
+class ConexaoLeituraTests(TransactionTestCase):
+    databases = {"default", "leitura"}
+
+    def setUp(self):
+        # Nos testes "leitura" é espelho do default (sem o query_only); aqui a
+        # conexão é aberta com as OPTIONS de produção, apontando para o banco de teste
+        config = {**connections.settings[LEITURA_ALIAS], "NAME": connection.settings_dict["NAME"]}
+        espelho = connections[LEITURA_ALIAS]
+        connections[LEITURA_ALIAS] = DatabaseWrapper(config, LEITURA_ALIAS)
+        self.addCleanup(connections.__setitem__, LEITURA_ALIAS, espelho)
+        self.addCleanup(connections[LEITURA_ALIAS].close)
+        self.prato = Prato.objects.create(nome="Pastel", preco="10.00")
+
+    def test_escrita_pela_conexao_de_leitura_e_recusada(self):
+        with usar_leitura():
+            alias = router.db_for_read(Prato)
+            self.assertEqual(alias, LEITURA_ALIAS)
+            self.assertEqual(Prato.objects.count(), 1)  # Leitura normal pelo alias
+
+            with self.assertRaisesMessage(OperationalError, "readonly"):
+                Prato.objects.using(alias).create(nome="Caldo", preco="8.00")
+            with self.assertRaisesMessage(OperationalError, "readonly"):
+                Prato.objects.using(alias).filter(id=self.prato.id).update(nome="Outro")
+
+            # Pelo ORM, a escrita continua indo para o default
+            Prato.objects.create(nome="Caldo", preco="8.00")
+
+        self.assertEqual(sorted(Prato.objects.values_list("nome", flat=True)), ["Caldo", "Pastel"])
+
+
+# =========================
+# MONITOR DO CLIENTE
+# =========================
+
+class MonitorPedidosTests(TestCase):
+    databases = {"default", "leitura"}
+
+    def setUp(self):
+        self.pastel = Prato.objects.create(nome="Pastel", preco="10.00")
+        self.caldo = Prato.objects.create(nome="Caldo", preco="8.00")
+
+    def criar(self, quantidade, status):
+        pedidos = [
+            create_order(Pedido.Tipo.NORMAL, [{"prato_id": self.pastel.id, "quantidade": 2}, {"prato_id": self.caldo.id}])
+            for _ in range(quantidade)
+        ]
+        Pedido.objects.filter(id__in=[p.id for p in pedidos]).update(status=status)
+        return pedidos
+
+    @override_settings(MONITOR_LIMITES={"pendentes": 2, "preparando": 2, "prontos": 3})
+    def test_colunas_respeitam_o_limite_e_consultas_nao_crescem(self):
+        self.criar(4, Pedido.Status.PENDENTE)
+        prontos = self.criar(5, Pedido.Status.FINALIZADO)
+
+        # Uma consulta por coluna + uma para os itens de todos os prontos
+        with self.assertNumQueries(4):
+            dados = self.client.get("/api/v1/monitor/pedidos/").json()
+
+        self.assertEqual((len(dados["pendentes"]), len(dados["preparando"]), len(dados["prontos"])), (2, 0, 3))
+        # Os mais recentes primeiro
+        self.assertEqual([p["senha"] for p in dados["prontos"]], [p.senha_exibicao for p in prontos[::-1][:3]])
+        self.assertEqual(
+            sorted((i["nome"], i["quantidade"]) for i in dados["prontos"][0]["itens"]), [("Caldo", 1), ("Pastel", 2)]
+        )
+
+        self.criar(20, Pedido.Status.FINALIZADO)
+        with self.assertNumQueries(4):
+            dados = self.client.get("/api/v1/monitor/pedidos/").json()
+        self.assertEqual(len(dados["prontos"]), 3)
+
+
+# =========================
+# CACHE DE RESPOSTAS (ETAG)
+# =========================
+
+class CacheRespostasTests(TransactionTestCase):
+    # Transações de verdade: a versão só muda no COMMIT
+    databases = {"default", "leitura"}
+
+    def setUp(self):
+        respostas.limpar()
+        self.addCleanup(respostas.limpar)
+
+    def test_etag_responde_304_sem_consultar_o_banco(self):
+        self.client.post("/api/v1/pratos/criar/", {"nome": "Pastel", "preco": "10.00"})
+        primeira = self.client.get("/api/v1/pratos/")
+        etag = primeira["ETag"]
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get("/api/v1/pratos/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            repetida = self.client.get("/api/v1/pratos/")
+        self.assertEqual(repetida.json(), primeira.json())
+        self.assertEqual(repetida["ETag"], etag)
+
+        self.client.post("/api/v1/pratos/criar/", {"nome": "Caldo", "preco": "8.00"})
+        nova = self.client.get("/api/v1/pratos/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(nova.status_code, 200)
+        self.assertEqual(len(nova.json()), 2)
+        self.assertNotEqual(nova["ETag"], etag)
+
+    def test_mutacao_da_fila_invalida_o_monitor(self):
+        prato = Prato.objects.create(nome="Pastel", preco="10.00")
+        etag = self.client.get("/api/v1/monitor/pedidos/")["ETag"]
+
+        create_order(Pedido.Tipo.NORMAL, [{"prato_id": prato.id}])
+
+        resposta = self.client.get("/api/v1/monitor/pedidos/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(len(resposta.json()["pendentes"]), 1)
+
+
+# =========================
+# SPOOLER DE IMPRESSÃO
+# =========================
+
+class ImpressaoTests(TestCase):
+    def setUp(self):
+        self.pasta = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.pasta, ignore_errors=True)
+        self.prato = Prato.objects.create(nome="Pastel", preco="10.00")
+        self.configuracao = override_settings(
+            IMPRESSAO_ATIVA=True,
+            IMPRESSAO_ASYNC=False,
+            IMPRESSORAS={
+                "balcao": f"arquivo:{self.pasta / 'balcao.bin'}",
+                "cozinha": f"arquivo:{self.pasta / 'cozinha.bin'}",
+            },
+        )
+        self.configuracao.enable()
+        self.addCleanup(self.configuracao.disable)
+
+    def liberar(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post("/api/v1/fila/proximo/")
+
+    def test_liberar_pedido_imprime_senha_e_comanda(self):
+        pedido = create_order(Pedido.Tipo.NORMAL, [{"prato_id": self.prato.id, "quantidade": 2}])
+
+        self.assertEqual(self.liberar().status_code, 200)
+
+        self.assertEqual(
+            set(TrabalhoImpressao.objects.values_list("tipo", "status")),
+            {("SENHA", "IMPRESSO"), ("COMANDA", "IMPRESSO")},
+        )
+        cupom = (self.pasta / "balcao.bin").read_bytes()
+        self.assertTrue(cupom.startswith(b"\x1b@"))
+        self.assertIn(pedido.senha_exibicao.encode(), cupom)
+        self.assertIn(b"2x Pastel", cupom)
+        self.assertIn(b"Pastel", (self.pasta / "cozinha.bin").read_bytes())
+
+    def reservado(self, ha_segundos):
+        trabalho = TrabalhoImpressao.objects.create(
+            tipo=TrabalhoImpressao.Tipo.SENHA,
+            impressora="balcao",
+            dados={},
+            status=TrabalhoImpressao.Status.IMPRIMINDO,
+            reservado_em=timezone.now() - timedelta(seconds=ha_segundos),
+        )
+        return trabalho.id
+
+    @override_settings(IMPRESSAO_RESERVA_SEG=60)
+    def test_so_reserva_vencida_volta_para_a_fila(self):
+        # Outro processo imprimindo agora x processo que caiu há minutos
+        em_andamento = self.reservado(5)
+        abandonado = self.reservado(300)
+
+        self.assertEqual(devolver_interrompidos(), 1)
+
+        status = dict(TrabalhoImpressao.objects.values_list("id", "status"))
+        self.assertEqual(status[em_andamento], TrabalhoImpressao.Status.IMPRIMINDO)
+        self.assertEqual(status[abandonado], TrabalhoImpressao.Status.PENDENTE)
+
+    def test_erro_fora_da_impressao_devolve_a_reserva(self):
+        trabalho_id = self.reservado(0)
+
+        with mock.patch("core.logic_printing.imprimir_trabalho", side_effect=OperationalError("database is locked")), \
+                mock.patch("core.logic_printing.close_old_connections"):
+            Spooler()._imprimir(trabalho_id, "balcao")
+
+        trabalho = TrabalhoImpressao.objects.get(id=trabalho_id)
+        self.assertEqual(trabalho.status, TrabalhoImpressao.Status.PENDENTE)
+        self.assertEqual(trabalho.ultimo_erro, "database is locked")
+        self.assertGreater(trabalho.proxima_tentativa, timezone.now())
+
+    def test_impressora_fora_do_ar_fica_na_fila_com_backoff(self):
+        create_order(Pedido.Tipo.NORMAL, [{"prato_id": self.prato.id}])
+
+        with override_settings(IMPRESSORAS={"balcao": "tcp://127.0.0.1:1", "cozinha": "tcp://127.0.0.1:1"}):
+            self.liberar()
+
+        trabalhos = TrabalhoImpressao.objects.all()
+        self.assertEqual(len(trabalhos), 2)
+        for trabalho in trabalhos:
+            self.assertEqual(trabalho.status, TrabalhoImpressao.Status.PENDENTE)
+            self.assertEqual(trabalho.tentativas, 1)
+            self.assertNotEqual(trabalho.ultimo_erro, "")
+
+
+# =========================
+# TMA (WORKER + TMA ATUAL)
+# =========================
+
+@mock.patch.object(TMAWorker, "_garantir_thread")  # Sem thread: o teste roda o lote na hora
+class TMAWorkerTests(TransactionTestCase):
+    def setUp(self):
+        self.worker = TMAWorker()
+        patcher = mock.patch("core.services.tma_worker", self.worker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pastel = Prato.objects.create(nome="Pastel", preco="10.00")
+        self.caldo = Prato.objects.create(nome="Caldo", preco="8.00")
+
+    def test_rajada_de_avisos_vira_um_calculo_por_prato(self, _):
+        for fila_id in criar_pedido_liberado(self.pastel, 3).filas.values_list("id", flat=True):
+            finalize_prato(fila_id)
+        finalize_pratos_lote(list(criar_pedido_liberado(self.caldo, 2).filas.values_list("id", flat=True)))
+        self.assertEqual(self.worker._pendentes, {self.pastel.id, self.caldo.id})
+
+        with mock.patch("core.services.calculate_tma_for_prato", wraps=calculate_tma_for_prato) as calcular:
+            lote = self.worker.processar_pendentes()
+
+        self.assertEqual(lote, {self.pastel.id, self.caldo.id})
+        self.assertEqual(sorted(c.args[0] for c in calcular.call_args_list), sorted(lote))
+        self.assertEqual(TMA.objects.filter(prato=self.pastel).count(), 1)
+        self.assertEqual(set(TMAAtual.objects.values_list("prato_id", flat=True)), lote)
+        self.assertEqual(self.worker.processar_pendentes(), set())
+
+    def test_mais_de_uma_janela_registra_um_tma_por_lote(self, _):
+        agora = timezone.now()
+        pedido = criar_pedido_liberado(self.pastel, 12)
+        for n, fila_id in enumerate(pedido.filas.order_by("id").values_list("id", flat=True)):
+            # 10 primeiros em 60s; os 2 últimos bem mais lentos (120s)
+            fim = agora + timedelta(seconds=n)
+            FilaPrato.objects.filter(id=fila_id).update(
+                status=FilaPrato.Status.FINALIZADO,
+                started_at=fim - timedelta(seconds=60 if n < 10 else 120),
+                finished_at=fim,
+            )
+        self.worker.enqueue(self.pastel.id)
+
+        self.worker.processar_pendentes()
+
+        self.assertEqual(list(TMA.objects.order_by("id").values_list("valor_tma_seg", flat=True)), [60, 120])
+        self.assertFalse(FilaPrato.objects.filter(usado_em_metrica=False).exists())
+        atual = TMAAtual.objects.get(prato=self.pastel)
+        self.assertEqual((atual.valor_tma_seg, atual.valor_anterior_seg), (120, 60))
+        self.assertEqual(atual.tendencia, TMAAtual.Tendencia.SUBINDO)
+
+
+class TMAAtualTests(TestCase):
+    def setUp(self):
+        self.prato = Prato.objects.create(nome="Pastel", preco="10.00")
+
+    def registrar(self, valor):
+        registrar_tma(self.prato.id, valor)
+        return TMAAtual.objects.get(prato=self.prato)
+
+    def test_tendencia_acompanha_cada_registro(self):
+        primeiro = self.registrar(100)
+        self.assertEqual((primeiro.valor_anterior_seg, primeiro.tendencia), (None, TMAAtual.Tendencia.ESTAVEL))
+
+        self.assertEqual(self.registrar(130).tendencia, TMAAtual.Tendencia.SUBINDO)
+        # Dentro da tolerância (5%): mesmo patamar
+        self.assertEqual(self.registrar(133).tendencia, TMAAtual.Tendencia.ESTAVEL)
+        caindo = self.registrar(90)
+        self.assertEqual((caindo.valor_tma_seg, caindo.valor_anterior_seg), (90, 133))
+        self.assertEqual(caindo.tendencia, TMAAtual.Tendencia.CAINDO)
+
+        # Histórico completo no TMA; uma linha só no TMAAtual
+        self.assertEqual(list(TMA.objects.order_by("id").values_list("valor_tma_seg", flat=True)), [100, 130, 133, 90])
+        self.assertEqual(TMAAtual.objects.count(), 1)
+
+
+# =========================
+# BARRAMENTO DE EVENTOS / SSE
+# =========================
+
+class EventBusTests(TestCase):
+    def setUp(self):
+        self.recebidos = []
+        bus.assinar(self.recebidos.append)
+        self.addCleanup(bus.desassinar, self.recebidos.append)
+
+    def test_publica_so_depois_do_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            publicar_apos_commit("pedido_criado", pedido_id="p1")
+            self.assertEqual(self.recebidos, [])
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual([(e["tipo"], e["dados"]) for e in self.recebidos], [("pedido_criado", {"pedido_id": "p1"})])
+
+    def test_rollback_nao_publica(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(ValueError), transaction.atomic():
+                publicar_apos_commit("pedido_criado", pedido_id="p1")
+                raise ValueError("desfaz")
+
+        self.assertEqual(self.recebidos, [])
+
+    def test_ouvinte_com_erro_nao_impede_os_outros(self):
+        def quebrado(evento):
+            raise RuntimeError("ouvinte quebrado")
+
+        barramento = EventBus()
+        barramento.assinar(quebrado)
+        barramento.assinar(self.recebidos.append)
+
+        barramento.publicar("item_finalizado", fila_id="f1")
+
+        self.assertEqual([e["tipo"] for e in self.recebidos], ["item_finalizado"])
+
+    def test_assinante_assincrono_recebe_evento_de_outra_thread(self):
+        barramento = EventBus()
+
+        async def receber():
+            fila = barramento.conectar()
+            # Os services publicam da thread do request, fora do event loop
+            threading.Thread(target=barramento.publicar, args=("pedido_liberado",), kwargs={"senha": "007"}).start()
+            return await asyncio.wait_for(fila.get(), 2)
+
+        evento = asyncio.run(receber())
+
+        self.assertEqual((evento["tipo"], evento["dados"]), ("pedido_liberado", {"senha": "007"}))
+
+    def test_tela_lenta_perde_os_avisos_mais_antigos(self):
+        barramento = EventBus()
+        barramento.TAMANHO_FILA_ASSINANTE = 2
+
+        async def encher():
+            fila = barramento.conectar()
+            for n in range(4):
+                barramento.publicar("item_iniciado", n=n)
+            await asyncio.sleep(0)  # Entregas agendadas com call_soon_threadsafe
+            return [fila.get_nowait()["dados"]["n"] for _ in range(fila.qsize())]
+
+        self.assertEqual(asyncio.run(encher()), [2, 3])
+
+    def test_assinante_de_loop_encerrado_e_removido(self):
+        barramento = EventBus()
+
+        async def conectar():
+            barramento.conectar()
+
+        asyncio.run(conectar())  # O loop fecha sem desconectar (processo de tela caiu)
+        barramento.publicar("pedido_criado")
+
+        self.assertEqual(barramento._assinantes, set())
+
+    def test_sse_entrega_evento_e_desconecta_do_barramento(self):
+        barramento = EventBus()
+        enviados = []
+
+        async def sessao():
+            desconectou = asyncio.Event()
+
+            async def receive():
+                await desconectou.wait()
+                return {"type": "http.disconnect"}
+
+            async def send(mensagem):
+                enviados.append(mensagem)
+                if b"event:" in mensagem.get("body", b""):
+                    desconectou.set()  # Cliente fecha a aba depois do primeiro evento
+
+            with mock.patch("core.events.bus", barramento):
+                tarefa = asyncio.ensure_future(sse_application({"type": "http"}, receive, send))
+                while not barramento._assinantes:
+                    await asyncio.sleep(0.001)
+                barramento.publicar("pedido_criado", senha="001")
+                await asyncio.wait_for(tarefa, 2)
+
+        asyncio.run(sessao())
+
+        self.assertEqual(enviados[0]["status"], 200)
+        corpo = b"".join(m.get("body", b"") for m in enviados[1:])
+        self.assertIn(b"event: pedido_criado\ndata: {\"senha\": \"001\"}\n\n", corpo)
+        self.assertEqual(barramento._assinantes, set())
+
+
+# =========================
+# INSTRUMENTAÇÃO SQL POR ROTA
+# =========================
+
+class InstrumentacaoSQLTests(TestCase):
+    databases = {"default", "leitura"}
+    URL = "/api/v1/diagnostico/consultas/"
+
+    def setUp(self):
+        agregador.limpar()
+        self.addCleanup(agregador.limpar)
+        Prato.objects.create(nome="Pastel", preco="10.00")
+
+    def rotas(self):
+        return {r["rota"]: r for r in self.client.get(self.URL).json()["rotas"]}
+
+    def test_server_timing_traz_consultas_e_a_mais_lenta(self):
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.get("/api/v1/pratos/")
+
+        timing = resposta["Server-Timing"]
+        self.assertGreater(len(consultas), 0)
+        self.assertRegex(timing, rf'^sql;dur=\d+\.\d\d;desc="{len(consultas)} consultas", sql-max;dur=\d+\.\d\d, app;dur=')
+
+    def test_agrega_pelo_padrao_da_rota(self):
+        for senha in (1, 2, 3):
+            self.client.get(f"/api/v1/pedidos/senha/{senha}/")
+        self.client.get("/caminho-inexistente/")
+
+        rotas = self.rotas()
+        senha = rotas["GET /api/v1/pedidos/senha/<int:senha>/"]
+        self.assertEqual(senha["requisicoes"], 3)
+        self.assertGreaterEqual(senha["consultas_max"], 1)
+        self.assertIn("core_pedido", senha["consulta_mais_lenta"]["sql"])
+        self.assertEqual(rotas["GET sem-rota"]["requisicoes"], 1)
+        self.assertFalse(any("/1/" in rota for rota in rotas))
+
+    def test_fora_da_maquina_do_servidor_e_proibido(self):
+        self.assertEqual(self.client.get(self.URL, REMOTE_ADDR="192.168.0.20").status_code, 403)
+        self.assertEqual(self.client.delete(self.URL, REMOTE_ADDR="192.168.0.20").status_code, 403)
+
+    def test_delete_zera_os_agregados(self):
+        self.client.get("/api/v1/pratos/")
+        self.assertIn("GET /api/v1/pratos/", self.rotas())
+
+        self.assertEqual(self.client.delete(self.URL).status_code, 204)
+
+        # Só o próprio DELETE, registrado depois da resposta
+        self.assertEqual(list(self.rotas()), ["DELETE /api/v1/diagnostico/consultas/"])
+
+
+# =========================
+# MÉTRICAS (PROMETHEUS)
+# =========================
+
+class MetricasTests(TestCase):
+    databases = {"default", "leitura"}
+
+    def setUp(self):
+        # Cada teste começa como o primeiro scrape do processo
+        patcher = mock.patch.object(metricas.abertos, "carregado", False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.prato = Prato.objects.create(nome="Pastel", preco="10.00")
+
+    def valores(self):
+        resposta = self.client.get("/metrics")
+        self.assertEqual(resposta.status_code, 200)
+        linhas = resposta.content.decode().splitlines()
+        return dict(l.rsplit(" ", 1) for l in linhas if not l.startswith("#"))
+
+    def medidor(self, valores, nome):
+        return float(valores[f'{nome}{{prato_id="{self.prato.id}"}}'])
+
+    def test_formato_do_histograma(self):
+        h = metricas.Histograma("teste_segundos", "Duração de teste.", ["rota"], buckets=(0.1, 1))
+        for valor in (0.05, 0.5, 0.7, 5):
+            h.observar(valor, rota="GET /x/")
+
+        self.assertEqual(h.exportar(), [
+            "# HELP teste_segundos Duração de teste.",
+            "# TYPE teste_segundos histogram",
+            'teste_segundos_bucket{rota="GET /x/",le="0.1"} 1',
+            'teste_segundos_bucket{rota="GET /x/",le="1"} 3',
+            'teste_segundos_bucket{rota="GET /x/",le="+Inf"} 4',
+            'teste_segundos_sum{rota="GET /x/"} 6.250000',
+            'teste_segundos_count{rota="GET /x/"} 4',
+        ])
+
+    def test_exposicao_inclui_cabecalhos_e_requests(self):
+        self.client.get("/api/v1/pratos/")
+        texto = self.client.get("/metrics").content.decode()
+
+        for metrica in metricas.REGISTRO:
+            self.assertIn(f"# HELP {metrica.nome} ", texto)
+            self.assertIn(f"# TYPE {metrica.nome} {metrica.tipo}", texto)
+
+        valores = self.valores()
+        serie = 'rota="GET /api/v1/pratos/",status="200"'
+        self.assertEqual(
+            valores[f'inline_http_request_duracao_segundos_bucket{{{serie},le="+Inf"}}'],
+            valores[f"inline_http_request_duracao_segundos_count{{{serie}}}"],
+        )
+
+    def test_primeiro_scrape_carrega_do_banco(self):
+        criar_pedido_liberado(self.prato, 2)
+        item = claim_next(str(self.prato.id), "E1")
+        self.assertIsNotNone(item)
+        create_order(Pedido.Tipo.NORMAL, [{"prato_id": str(self.prato.id), "quantidade": 3}])
+
+        valores = self.valores()
+
+        self.assertEqual(self.medidor(valores, "inline_fila_pendente"), 4)
+        self.assertEqual(self.medidor(valores, "inline_itens_em_producao"), 1)
+        self.assertEqual(valores['inline_pedidos_abertos{status="PENDENTE"}'], "1")
+        self.assertEqual(valores['inline_pedidos_abertos{status="PRODUCAO"}'], "1")
+
+    def test_medidores_seguem_os_eventos(self):
+        self.valores()  # Carga inicial: nada em aberto
+        antes = metricas.itens_finalizados._valores.get((str(self.prato.id),), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            create_order(Pedido.Tipo.NORMAL, [{"prato_id": str(self.prato.id), "quantidade": 2}])
+        valores = self.valores()
+        self.assertEqual(self.medidor(valores, "inline_fila_pendente"), 2)
+        self.assertEqual(valores['inline_pedidos_abertos{status="PENDENTE"}'], "1")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            chamar_proximo_pedido()
+            item = claim_next(str(self.prato.id), "E1")
+        valores = self.valores()
+        self.assertEqual(self.medidor(valores, "inline_fila_pendente"), 1)
+        self.assertEqual(self.medidor(valores, "inline_itens_em_producao"), 1)
+        self.assertEqual(valores['inline_pedidos_abertos{status="PRODUCAO"}'], "1")
+
+        # EM_PRODUCAO sai de "em produção"; PENDENTE sai direto da fila
+        with self.captureOnCommitCallbacks(execute=True):
+            finalize_prato(item.id)
+        self.assertEqual(self.medidor(self.valores(), "inline_itens_em_producao"), 0)
+
+        pendente = FilaPrato.objects.get(status=FilaPrato.Status.PENDENTE)
+        with self.captureOnCommitCallbacks(execute=True):
+            finalize_prato(pendente.id)
+        valores = self.valores()
+        self.assertEqual(self.medidor(valores, "inline_fila_pendente"), 0)
+        self.assertEqual(self.medidor(valores, "inline_itens_em_producao"), 0)
+        self.assertEqual(self.medidor(valores, "inline_itens_finalizados_total"), antes + 2)
+        self.assertEqual(valores['inline_pedidos_abertos{status="PRODUCAO"}'], "0")
+
+    def test_fora_da_lan_e_proibido(self):
+        self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="8.8.8.8").status_code, 403)
+
+
+# =========================
+# PERFIL SOB DEMANDA
+# =========================
+
+@override_settings(PERFILAMENTO_ATIVO=True, PERFIS_MAX=2)
+class PerfilamentoTests(TestCase):
+    databases = {"default", "leitura"}
+
+    def setUp(self):
+        self.pasta = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.pasta, ignore_errors=True)
+        configuracao = override_settings(PERFIS_DIR=self.pasta)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        self.staff = User.objects.create_user("gerente", password="x", is_staff=True)
+
+    def perfilar(self):
+        return self.client.get("/api/v1/monitor/pedidos/", HTTP_X_INLINE_PERFIL="amostragem")
+
+    def test_rede_local_sem_login_nao_perfila(self):
+        self.assertNotIn("X-Inline-Perfil", self.perfilar())
+        self.assertEqual(list(self.pasta.iterdir()), [])
+
+    def test_desligado_por_padrao(self):
+        self.client.force_login(self.staff)
+        with override_settings(PERFILAMENTO_ATIVO=False):
+            self.assertNotIn("X-Inline-Perfil", self.perfilar())
+
+    def test_staff_perfila_e_so_os_mais_recentes_ficam(self):
+        self.client.force_login(self.staff)
+        nomes = [self.perfilar()["X-Inline-Perfil"] for _ in range(3)]
+
+        guardados = sorted({arquivo.stem for arquivo in self.pasta.iterdir()})
+        self.assertEqual(guardados, sorted(nomes[1:]))
+
+    @override_settings(PERFILAMENTO_LAN=True)
+    def test_rede_local_liberada_por_configuracao(self):
+        self.assertIn("X-Inline-Perfil", self.perfilar())
+
+
+# =========================
+# ESCRITOR ÚNICO (GROUP COMMIT)
+# =========================
+
+class WriteQueueTests(TransactionTestCase):
+    def setUp(self):
+        self.fila = WriteQueue()
+        self.liberar = threading.Event()
+        self.lotes = []
+        executar_lote = self.fila._executar_lote
+        self.fila._executar_lote = lambda lote: (self.lotes.append(len(lote)), executar_lote(lote))
+
+    def tearDown(self):
+        self.liberar.set()
+
+    def em_thread(self, funcao, *args):
+        # Chamador concorrente: guarda o resultado (ou a exceção) da escrita
+        saida = {}
+
+        def chamar():
+            try:
+                saida["resultado"] = self.fila.executar(funcao, *args)
+            except Exception as e:
+                saida["erro"] = e
+
+        thread = threading.Thread(target=chamar)
+        thread.start()
+        return thread, saida
+
+    def ocupar_escritor(self):
+        # Primeira tarefa segura o escritor até liberar: as próximas se acumulam na fila
+        thread, _ = self.em_thread(self.liberar.wait)
+        while not self.lotes:
+            time.sleep(0.005)
+        return thread
+
+    def criar_prato(self, nome, falhar=False):
+        Prato.objects.create(nome=nome, preco="1.00")
+        if falhar:
+            raise ValueError(nome)
+        return nome
+
+    def test_mutacoes_concorrentes_saem_em_um_commit(self):
+        ocupada = self.ocupar_escritor()
+        chamadas = [self.em_thread(self.criar_prato, f"P{i}") for i in range(5)]
+        while self.fila._fila.qsize() < 5:
+            time.sleep(0.005)
+        self.liberar.set()
+        for thread, _ in [(ocupada, None)] + chamadas:
+            thread.join(5)
+
+        self.assertEqual(self.lotes, [1, 5])
+        self.assertEqual([s["resultado"] for _, s in chamadas], [f"P{i}" for i in range(5)])
+        self.assertEqual(Prato.objects.count(), 5)
+
+    def test_falha_de_uma_mutacao_nao_derruba_o_lote(self):
+        ocupada = self.ocupar_escritor()
+        boa = self.em_thread(self.criar_prato, "boa")
+        while self.fila._fila.qsize() < 1:
+            time.sleep(0.005)
+        ruim = self.em_thread(self.criar_prato, "ruim", True)
+        while self.fila._fila.qsize() < 2:
+            time.sleep(0.005)
+        self.liberar.set()
+        for thread in (ocupada, boa[0], ruim[0]):
+            thread.join(5)
+
+        self.assertEqual(self.lotes, [1, 2])
+        self.assertEqual(boa[1]["resultado"], "boa")
+        self.assertIsInstance(ruim[1]["erro"], ValueError)
+        # O savepoint da mutação que falhou voltou; a outra foi commitada
+        self.assertEqual(list(Prato.objects.values_list("nome", flat=True)), ["boa"])
+
+    def test_dentro_de_transacao_executa_direto(self):
+        with transaction.atomic():
+            thread = self.fila.executar(threading.current_thread)
+
+        self.assertIs(thread, threading.current_thread())
+        self.assertIsNone(self.fila._thread)
+
+    def test_erro_fora_do_savepoint_nao_mata_o_escritor(self):
+        with mock.patch(
+            "core.write_queue.close_old_connections", side_effect=OperationalError("database is locked")
+        ):
+            with self.assertRaises(OperationalError):
+                self.fila.executar(self.criar_prato, "bloqueado")
+        escritor = self.fila._thread
+
+        self.assertEqual(self.fila.executar(self.criar_prato, "depois"), "depois")
+        self.assertIs(self.fila._thread, escritor)
+        self.assertTrue(escritor.is_alive())
+        self.assertEqual(list(Prato.objects.values_list("nome", flat=True)), ["depois"])
+
+    @override_settings(WRITE_QUEUE_TIMEOUT_SEG=0.1)
+    def test_espera_tem_limite_e_tarefa_abandonada_nao_roda(self):
+        ocupada = self.ocupar_escritor()
+
+        with self.assertRaises(EscritaExpirada):
+            self.fila.executar(self.criar_prato, "atrasada")
+        self.liberar.set()
+        ocupada.join(5)
+        self.fila.executar(self.criar_prato, "seguinte")
+
+        self.assertEqual(list(Prato.objects.values_list("nome", flat=True)), ["seguinte"])
+
+
+# =========================
+# STRESS (VÁRIOS PROCESSOS NO MESMO SQLITE)
+# =========================
+
+class StressServicosTests(TransactionTestCase):
+    def test_invariantes_sob_disputa(self):
+        relatorio = executar_stress(processos=2, threads=2, pedidos=12, pratos=2)
+
+        self.assertEqual(relatorio["violacoes"], [])
+        self.assertEqual(relatorio["operacoes"]["create_order"]["n"], 12)
+        self.assertEqual(relatorio["operacoes"]["create_order"]["erros"], 0)
@@ -0,0 +1,86 @@
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+
+
+# =========================
+# WORKER DE TMA (EM PROCESSO)
+# =========================
+
+_VARREDURA_COMPLETA = object()
+
+
+class TMAWorker:
+    """
+    Calcula o TMA fora do request de finalização.
+
+    O finalize só avisa "o prato X tem itens novos finalizados"; a thread do
+    worker junta as rajadas (vários avisos do mesmo prato viram um só) e
+    processa as janelas de até 10 itens daquele prato. Sem Celery, sem Redis.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._pendentes = set()
+        self._thread = None
+
+    def enqueue(self, prato_id):
+        if not getattr(settings, "TMA_WORKER_ASYNC", True):
+            # Modo síncrono (testes/diagnóstico): calcula na hora
+            self._processar(prato_id)
+            return
+
+        with self._cond:
+            self._garantir_thread()
+            self._pendentes.add(prato_id)
+            self._cond.notify()
+
+    def _garantir_thread(self):
+        # Só sobe a thread no primeiro uso: comandos de manage.py não criam threads à toa
+        if self._thread and self._thread.is_alive():
+            return
+
+        # Ao (re)iniciar, processa o que ficou pendente de execuções anteriores
+        self._pendentes.add(_VARREDURA_COMPLETA)
+        self._thread = threading.Thread(target=self._loop, name="tma-worker", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        agrupamento = getattr(settings, "TMA_WORKER_AGRUPAMENTO_SEG", 2)
+
+        while True:
+            with self._cond:
+                while not self._pendentes:
+                    self._cond.wait()
+
+            # Espera um pouco para a rajada de finalizações cair no mesmo lote
+            time.sleep(agrupamento)
+            self.processar_pendentes()
+
+    def processar_pendentes(self):
+        """Um cálculo por prato avisado desde o último lote; retorna os pratos processados."""
+        with self._cond:
+            lote, self._pendentes = self._pendentes, set()
+
+        close_old_connections()
+        for prato_id in lote:
+            self._processar(prato_id)
+        close_old_connections()
+        return lote
+
+    def _processar(self, prato_id):
+        # Import tardio: services importa este módulo
+        from .services import calculate_tma_for_prato, calculate_tma_per_prato
+
+        try:
+            if prato_id is _VARREDURA_COMPLETA:
+                calculate_tma_per_prato()
+            else:
+                calculate_tma_for_prato(prato_id)
+        except Exception as e:
+            print(f"Aviso: Falha ao calcular TMA: {e}")
+
+
+tma_worker = TMAWorker()
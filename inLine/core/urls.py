@@ -5,7 +5,9 @@ from .views import (
     NextOrderAPIView, PainelCozinhaPratoView, 
     FinalizarPratoView,CreatePratoAPIView, TMADashboardAPIView,
     AcompanhamentoPedidoView,DashboardView, MonitorPedidosView, MonitorPedidosAPIView,
-    RetirarPedidoView,BaixaEntregaView,
+    RetirarPedidoView,BaixaEntregaView, IniciarProximoItemView, FinalizarLoteView,
+    SincronizarPedidosAPIView, BuscarPedidoPorSenhaView, DiagnosticoConsultasView,
+    MetricsView, MudancasView,
 )
 
 urlpatterns = [
@@ -24,11 +26,20 @@ urlpatterns = [
     path('api/v1/pratos/', ListPratosAPIView.as_view()),
     path('api/v1/pratos/criar/', CreatePratoAPIView.as_view(), name='api_criar_prato'),
     path('api/v1/pedidos/criar/', CreateOrderAPIView.as_view()),
+    path('api/v1/pedidos/sincronizar/', SincronizarPedidosAPIView.as_view(), name='sincronizar-pedidos'),
     path('api/v1/fila/proximo/', NextOrderAPIView.as_view(), name='proximo_pedido'),
     path('api/v1/fila/painel/', PainelCozinhaPratoView.as_view(), name='painel-cozinha'),
+    path('api/v1/fila/iniciar/<uuid:prato_id>/', IniciarProximoItemView.as_view(), name='iniciar-proximo-item'),
+    path('api/v1/fila/finalizar/lote/', FinalizarLoteView.as_view(), name='finalizar-lote'),
     path('api/v1/fila/finalizar/<uuid:id>/', FinalizarPratoView.as_view(), name='finalizar-prato'),
     path('api/v1/metrica/tma-dashboard/', TMADashboardAPIView.as_view(), name='tma'),
     path('api/v1/monitor/pedidos/', MonitorPedidosAPIView.as_view(), name='api-monitor-pedidos'),
     path('api/v1/pedidos/retirar/<uuid:pedido_id>/', RetirarPedidoView.as_view(), name='retirar-pedido'),   
+    path('api/v1/pedidos/senha/<int:senha>/', BuscarPedidoPorSenhaView.as_view(), name='buscar-pedido-senha'),
+    path('api/v1/changes/', MudancasView.as_view(), name='log-mudancas'),
+    path('api/v1/diagnostico/consultas/', DiagnosticoConsultasView.as_view(), name='diagnostico-consultas'),
+
+    # Scraper local (Prometheus ou similar)
+    path('metrics', MetricsView.as_view(), name='metrics'),
      
 ]
\ No newline at end of file
@@ -1,7 +1,9 @@
 
 from django.db.models import Count, Avg, F, ExpressionWrapper, fields, Q
+from django.http import HttpResponse, HttpResponseForbidden
 from django.shortcuts import render, get_object_or_404
 from django.core.exceptions import ValidationError
+from django.utils.decorators import method_decorator
 from django.views import View
 from django.views.generic import TemplateView
 from django.db import transaction, models
@@ -9,13 +11,27 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from django.utils import timezone
+from django.conf import settings
+from uuid import UUID
 from .services import (
+    ChaveReutilizada,
     create_order,
+    create_order_idempotente,
+    sincronizar_pedidos,
     finalize_prato,
-     calculate_tma_per_prato,
+    finalize_pratos_lote,
+    claim_next,
+    chamar_proximo_pedido,
      registrar_retirada_total_pedido,
 )
-from .models import Pedido, FilaPrato, Prato, TMA
+from .cache_versoes import cache_por_versao, invalidar
+from .models import Pedido, FilaPrato, Prato, RegistroMudanca, TMAAtual, evento_atual
+from .mudancas import listar_mudancas, ultima_sequencia
+from .routers import LeituraMixin
+from .selectors import cursor_da_unidade, ler_cursor, pedidos_na_fila, unidades_no_painel
+from .fila_memoria import fila_memoria
+from .instrumentacao import agregador, requisicao_da_lan, requisicao_local
+from . import metricas
 
 class CreatePratoAPIView(APIView):
     def post(self, request):
@@ -31,6 +47,7 @@ class CreatePratoAPIView(APIView):
                 preco=preco,
                 ativo=True
             )
+            invalidar("catalogo")
             return Response({"id": str(prato.id), "status": "salvo"}, status=201)
         except Exception as e:
             return Response({"error": str(e)}, status=500)
@@ -40,39 +57,104 @@ class CreatePratoAPIView(APIView):
 # =========================
 
 class CreateOrderAPIView(APIView):
+    # Cabeçalho (ou campo) com a chave gerada pelo caixa para cada venda
+    IDEMPOTENCY_HEADER = "Idempotency-Key"
+    MAX_CHAVE = 64
+
     def post(self, request):
         # Captura os dados enviados pelo JavaScript
         tipo = request.data.get("tipo")
         itens = request.data.get("itens", [])
+        chave = request.headers.get(self.IDEMPOTENCY_HEADER) or request.data.get("idempotency_key")
+
+        if chave is not None and (not isinstance(chave, str) or not chave):
+            return Response(
+                {"error": "Chave de idempotência deve ser um texto não vazio"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if chave and len(chave) > self.MAX_CHAVE:
+            return Response(
+                {"error": f"Chave de idempotência acima de {self.MAX_CHAVE} caracteres"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
         try:
             # Chama o service que cria o pedido e os itens da fila (FilaPrato)
-            pedido = create_order(tipo=tipo, itens=itens)
-            
-            # Identifica o host (IP local ou URL do Codespaces)
-            host = request.get_host() 
-            status_url = f"http://{host}/acompanhamento/{str(pedido.id)}/"
-            
-            # Retorna o JSON estruturado para o Frontend gerar o Cupom e o QR Code
-            return Response({
-                "id": str(pedido.id),
-                "senha": str(pedido.id)[:4].upper(),
-                "total": float(pedido.total),
-                "tipo": pedido.tipo,
-                "status_url": status_url,
-                "criado_em": pedido.created_at.strftime("%H:%M:%S"),
-                "itens": [
-                    {
-                        "prato": item.prato.nome, 
-                        "preco": float(item.preco_unitario)
-                    } for item in pedido.filas.all()
-                ]
-            }, status=status.HTTP_201_CREATED)
+            if chave:
+                pedido, criado = create_order_idempotente(chave, tipo=tipo, itens=itens)
+            else:
+                pedido, criado = create_order(tipo=tipo, itens=itens), True
+
+            response = Response(self._serializar(request, pedido), status=status.HTTP_201_CREATED)
+            if not criado:
+                # Repetição do mesmo envio: mesma resposta, nada foi produzido de novo
+                response["Idempotent-Replayed"] = "true"
+            return response
+
+        except ChaveReutilizada as e:
+            # Mesma chave, corpo diferente: não é repetição, e também não cria outro pedido
+            return Response({"error": str(e)}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
 
         except Exception as e:
             # Retorna erro amigável se algo falhar no service
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    def _serializar(self, request, pedido):
+        # Identifica o host (IP local ou URL do Codespaces)
+        host = request.get_host() 
+        status_url = f"http://{host}/acompanhamento/{str(pedido.id)}/"
+        
+        # Retorna o JSON estruturado para o Frontend gerar o Cupom e o QR Code
+        return {
+            "id": str(pedido.id),
+            "senha": pedido.senha_exibicao,
+            "total": float(pedido.total),
+            "tipo": pedido.tipo,
+            "status_url": status_url,
+            "criado_em": pedido.created_at.strftime("%H:%M:%S"),
+            "itens": [
+                {
+                    "prato": item.prato.nome, 
+                    "preco": float(item.preco_unitario)
+                } for item in pedido.filas.select_related("prato")
+            ]
+        }
         
+# =========================
+# SINCRONIZAR PEDIDOS DO CAIXA OFFLINE
+# =========================
+
+class SincronizarPedidosAPIView(APIView):
+    MAX_PEDIDOS = 200
+
+    def post(self, request):
+        pedidos = request.data.get("pedidos")
+
+        if not isinstance(pedidos, list) or not pedidos:
+            return Response({"error": "Informe a lista 'pedidos'"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if len(pedidos) > self.MAX_PEDIDOS or not all(isinstance(p, dict) for p in pedidos):
+            return Response(
+                {"error": f"Envie até {self.MAX_PEDIDOS} pedidos por lote"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            resultados = sincronizar_pedidos(pedidos)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        data = []
+        for r in resultados:
+            pedido = r.pop("pedido", None)
+            if pedido:
+                r["pedido_id"] = str(pedido.id)
+                r["senha"] = pedido.senha_exibicao
+            data.append(r)
+
+        return Response({"resultados": data}, status=status.HTTP_200_OK)
+
+
 # =========================
 # PRÓXIMO PEDIDO (CAIXA / FILA LÓGICA)
 # =========================
@@ -82,22 +164,21 @@ class NextOrderAPIView(APIView):
         """Lista pedidos pendentes respeitando a prioridade de festival"""
         try:
             # Ordenação prioritária: Preferencial primeiro, depois os mais antigos
-            pedidos = Pedido.objects.filter(
-                status=Pedido.Status.PENDENTE
-            ).order_by(
-                models.Case(
-                    models.When(tipo=Pedido.Tipo.PREFERENCIAL, then=models.Value(0)),
-                    default=models.Value(1)
-                ),
-                "created_at"
-            )[:10]
+            if fila_memoria.disponivel():
+                pedidos = fila_memoria.pedidos_pendentes(10)
+            else:
+                pedidos = [
+                    {"pedido_id": str(p.id), "senha": p.senha_exibicao, "tipo": p.tipo, "criado_em": p.created_at}
+                    for p in pedidos_na_fila()[:10]
+                ]
 
             data = []
             for p in pedidos:
                 data.append({
-                    "pedido_id": str(p.id), # O JS espera 'pedido_id'
-                    "tipo": p.tipo,
-                    "criado_em": p.created_at.strftime("%H:%M")
+                    "pedido_id": p["pedido_id"], # O JS espera 'pedido_id'
+                    "senha": p["senha"],
+                    "tipo": p["tipo"],
+                    "criado_em": p["criado_em"].strftime("%H:%M")
                 })
             
             if not data:
@@ -107,43 +188,20 @@ class NextOrderAPIView(APIView):
         except Exception as e:
             return Response({"error": str(e)}, status=500)
 
-    @transaction.atomic
     def post(self, request):
-        pedido = Pedido.objects.filter(
-            status=Pedido.Status.PENDENTE
-        ).order_by(
-            models.Case(
-                models.When(tipo=Pedido.Tipo.PREFERENCIAL, then=models.Value(0)),
-                default=models.Value(1)
-            ),
-            "created_at"
-        ).select_for_update().first()
+        liberado = chamar_proximo_pedido()
 
-        if not pedido:
+        if not liberado:
             return Response(status=status.HTTP_204_NO_CONTENT)
 
-        # 1. Geramos a senha a partir dos primeiros 4 dígitos do UUID (em maiúsculo)
-        senha_gerada = str(pedido.id).split('-')[0][:4].upper()
-
-        # 2. Buscamos os itens na FilaPrato
-        itens_qs = FilaPrato.objects.filter(pedido=pedido).values('prato__nome').annotate(
-            qtd=models.Count('id')
-        )
-        
-        itens_formatados = [
-            {"nome": item['prato__nome'], "quantidade": item['qtd']} 
-            for item in itens_qs
-        ]
-
-        pedido.status = Pedido.Status.PRODUCAO
-        pedido.save(update_fields=['status'])
+        pedido, itens_formatados = liberado
 
         return Response({
             "pedido_id": str(pedido.id),
-            "senha": senha_gerada,  # Enviamos a senha pronta para o JS
+            "senha": pedido.senha_exibicao,  # Enviamos a senha pronta para o JS
             "tipo": pedido.tipo,
             "itens": itens_formatados,
-            "total_itens": sum(item['qtd'] for item in itens_qs),
+            "total_itens": sum(item['quantidade'] for item in itens_formatados),
             "hora_impressao": timezone.now().strftime("%H:%M")
         }, status=status.HTTP_200_OK)
     
@@ -152,39 +210,125 @@ class NextOrderAPIView(APIView):
 # =========================
 
 # core/views.py
-class PainelCozinhaPratoView(APIView):
+# tempo_espera em minutos: a mesma resposta vale por no máximo 15s
+@method_decorator(cache_por_versao("fila", validade=15), name="dispatch")
+class PainelCozinhaPratoView(LeituraMixin, APIView):
+    """
+    Unidades liberadas aguardando a cozinha, na ordem da fila.
+
+    ?prato_id=  só um prato
+    ?limit=N    só as N primeiras (com `proximo_cursor` para continuar)
+    ?cursor=    continua depois da unidade com esse cursor (keyset)
+    ?since=     só o que entrou/saiu desde a `versao` de uma resposta anterior
+
+    Sem parâmetros devolve a fila inteira, como antes.
+    """
+
     def get(self, request, prato_id=None):
         try:
-            # A MUDANÇA: Filtramos FilaPrato onde o PEDIDO está em PRODUCAO
-            # E o item em si ainda está PENDENTE na cozinha.
-            queryset = FilaPrato.objects.filter(
-                pedido__status=Pedido.Status.PRODUCAO, # Liberado pelo atendimento
-                status=FilaPrato.Status.PENDENTE       # Ainda não feito pela cozinha
-            ).select_related('pedido', 'prato').order_by(
-                models.Case(
-                    models.When(pedido__tipo='PREFERENCIAL', then=models.Value(0)),
-                    default=models.Value(1)
-                ),
-                'created_at'
-            )
-
+            prato_id = prato_id or request.query_params.get("prato_id")
             if prato_id:
-                queryset = queryset.filter(prato_id=prato_id)
+                prato_id = UUID(str(prato_id))
+            limite = request.query_params.get("limit")
+            limite = min(int(limite), settings.PAINEL_LIMITE_MAX) if limite else None
+            if limite is not None and limite < 1:
+                raise ValueError("limit deve ser positivo")
+            cursor = request.query_params.get("cursor")
+            apos = ler_cursor(cursor) if cursor else None
+            desde = request.query_params.get("since")
+            if apos and desde:
+                raise ValueError("Use cursor ou since, não os dois")
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-            data = []
+        try:
             agora = timezone.now()
-            for fp in queryset:
-                data.append({
-                    "fila_id": str(fp.id),
-                    "pedido_id": str(fp.pedido.id),
-                    "prato_nome": fp.prato.nome,
-                    "tipo": fp.pedido.tipo,
-                    "tempo_espera": int((agora - fp.created_at).total_seconds() / 60)
-                })
-            
-            return Response({"pendentes": data}, status=200)
+            versao = None
+
+            if fila_memoria.disponivel():
+                if desde:
+                    mudancas = fila_memoria.mudancas_desde(desde, prato_id, limite)
+                    if mudancas is not None:
+                        inseridas, removidas, versao = mudancas
+                        return Response({
+                            "versao": versao,
+                            "completo": False,
+                            "inseridos": [self._formatar(u, agora) for u in inseridas],
+                            "removidos": removidas,
+                        }, status=200)
+                # Do heap do prato em memória
+                unidades, versao = fila_memoria.painel(prato_id, limite, apos)
+            else:
+                # Fora do processo dono: do índice da fila, só as colunas exibidas
+                unidades = unidades_no_painel(prato_id, apos).values(
+                    "id", "pedido_id", "pedido__senha", "pedido__tipo", "prato__nome", "prioridade", "created_at"
+                )
+                if limite:
+                    unidades = unidades[:limite]
+                unidades = [
+                    {
+                        "fila_id": str(u["id"]),
+                        "pedido_id": str(u["pedido_id"]),
+                        "senha": Pedido.formatar_senha(u["pedido__senha"], u["pedido_id"]),
+                        "prato_nome": u["prato__nome"],
+                        "tipo": u["pedido__tipo"],
+                        "prioridade": u["prioridade"],
+                        "criado_em": u["created_at"],
+                    }
+                    for u in unidades
+                ]
+
+            data = [self._formatar(u, agora) for u in unidades]
+            return Response({
+                "pendentes": data,
+                "versao": versao,  # None fora do processo dono: sem deltas
+                "completo": True,
+                "proximo_cursor": data[-1]["cursor"] if limite and len(data) == limite else None,
+            }, status=200)
         except Exception as e:
             return Response({"pendentes": [], "error": str(e)}, status=500)
+
+    @staticmethod
+    def _formatar(u, agora):
+        return {
+            "fila_id": u["fila_id"],
+            "pedido_id": u["pedido_id"],
+            "senha": u["senha"],
+            "prato_nome": u["prato_nome"],
+            "tipo": u["tipo"],
+            "tempo_espera": int((agora - u["criado_em"]).total_seconds() / 60),
+            "cursor": cursor_da_unidade(u["prioridade"], u["criado_em"], u["fila_id"]),
+        }
+
+# =========================
+# PEGAR PRÓXIMO ITEM DA ESTAÇÃO
+# =========================
+
+class IniciarProximoItemView(APIView):
+    def post(self, request, prato_id):
+        estacao = request.data.get("estacao")
+
+        if not estacao:
+            return Response({"error": "Estação é obrigatória"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            item = claim_next(prato_id, str(estacao))
+
+            if not item:
+                return Response(status=status.HTTP_204_NO_CONTENT)
+
+            return Response({
+                "fila_id": str(item.id),
+                "pedido_id": str(item.pedido_id),
+                "prato_nome": item.prato.nome,
+                "tipo": item.pedido.tipo,
+                "estacao": item.estacao,
+                "iniciado_em": item.started_at.strftime("%H:%M:%S"),
+            }, status=status.HTTP_200_OK)
+
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 # =========================
 # FINALIZAR ITEM DE PRODUÇÃO
 # =========================
@@ -204,28 +348,57 @@ class FinalizarPratoView(APIView):
                     status=status.HTTP_404_NOT_FOUND
                 )
 
-            # 2. GATILHO DE MÉTRICAS (Solução do Dashboard)
-            # Sempre que finalizamos um item, tentamos processar o TMA pendente.
-            # A função interna já possui a trava de "mínimo 10 itens", 
-            # então ela não pesará no banco se não houver dados suficientes.
-            try:
-                calculate_tma_per_prato()
-            except Exception as tma_err:
-                # Logamos o erro de métrica mas não travamos a resposta do usuário
-                print(f"Aviso: Falha ao calcular TMA: {tma_err}")
+            # 2. As métricas (TMA) são recalculadas pelo worker em segundo plano,
+            # disparado pelo próprio service: o toque do cozinheiro não espera por elas.
 
             return Response({
                 "status": "Finalizado", 
                 "fila_id": str(id),
-                "mensagem": "Métricas atualizadas com sucesso"
+                "mensagem": "Métricas agendadas para atualização"
             }, status=status.HTTP_200_OK)
             
         except Exception as e:
             print(f"ERRO CRÍTICO NO FINALIZAR: {e}")
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+
+
+class FinalizarLoteView(APIView):
+    # Limite por chamada: uma estação não finaliza mais que isso de uma vez
+    MAX_ITENS = 50
+
+    def post(self, request):
+        fila_ids = request.data.get("fila_ids")
+
+        if not isinstance(fila_ids, list) or not fila_ids:
+            return Response({"error": "Informe a lista 'fila_ids'"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if len(fila_ids) > self.MAX_ITENS:
+            return Response(
+                {"error": f"Máximo de {self.MAX_ITENS} itens por lote"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            ids = [UUID(str(i)) for i in fila_ids]
+        except ValueError:
+            return Response({"error": "Formato de ID de fila inválido"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            resultados = finalize_pratos_lote(ids)
+
+            return Response({
+                "finalizados": sum(1 for r in resultados if r["resultado"] == "FINALIZADO"),
+                "resultados": resultados,
+            }, status=status.HTTP_200_OK)
+
+        except Exception as e:
+            print(f"ERRO CRÍTICO NO FINALIZAR LOTE: {e}")
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
     
 # AUXILIAR: Listagem de Pratos para o Terminal de Caixa
+@method_decorator(cache_por_versao("catalogo"), name="dispatch")
 class ListPratosAPIView(APIView):
     def get(self, request):
         pratos = Prato.objects.filter(ativo=True)
@@ -236,25 +409,26 @@ class ListPratosAPIView(APIView):
 
 
 # tempo médio de cada prato
-class TMADashboardAPIView(APIView):
+@method_decorator(cache_por_versao("catalogo", "metricas"), name="dispatch")
+class TMADashboardAPIView(LeituraMixin, APIView):
     def get(self, request):
-        pratos = Prato.objects.filter(ativo=True)
+        # Uma única consulta: pratos ativos + TMA materializado (LEFT JOIN)
+        pratos = Prato.objects.filter(ativo=True).values(
+            "nome", "tma_atual__valor_tma_seg", "tma_atual__valor_anterior_seg"
+        )
         data = []
 
         for prato in pratos:
-            # Pega a métrica mais recente calculada pelo service
-            ultima_metrica = TMA.objects.filter(prato=prato).order_by('-calculado_em').first()
-            
-            # Cálculo seguro: se não houver métrica, tma_minutos é 0
-            if ultima_metrica and ultima_metrica.valor_tma_seg:
-                tma_minutos = round(float(ultima_metrica.valor_tma_seg) / 60, 1)
-            else:
-                tma_minutos = 0.0
+            tma_seg = prato["tma_atual__valor_tma_seg"]
+            anterior_seg = prato["tma_atual__valor_anterior_seg"]
 
             data.append({
-                "prato_nome": prato.nome,
-                "tma_minutos": tma_minutos,
-                "tem_metrica": ultima_metrica is not None
+                "prato_nome": prato["nome"],
+                # Cálculo seguro: se não houver métrica, tma_minutos é 0
+                "tma_minutos": round(tma_seg / 60, 1) if tma_seg else 0.0,
+                "tma_anterior_minutos": round(anterior_seg / 60, 1) if anterior_seg else None,
+                "tendencia": TMAAtual.calcular_tendencia(tma_seg, anterior_seg),
+                "tem_metrica": tma_seg is not None
             })
 
         return Response(data, status=200)
@@ -269,7 +443,9 @@ class AcompanhamentoPedidoView(View):
         return render(request, 'acompanhamento.html', {'pedido': pedido})
 
 # Painel central
-class DashboardView(View):
+# Contagens "de hoje": janela de 60s para a virada do dia
+@method_decorator(cache_por_versao("catalogo", "fila", "metricas", validade=60), name="dispatch")
+class DashboardView(LeituraMixin, View):
     def get(self, request):
         hoje = timezone.now().date()
         total_geral = FilaPrato.objects.filter(created_at__date=hoje).count()
@@ -277,30 +453,25 @@ class DashboardView(View):
         # Busca pratos e anota as contagens básicas
         metricas_pratos = Prato.objects.annotate(
             vendidos_hoje=Count('filas', filter=Q(filas__created_at__date=hoje)),
-            aguardando=Count('filas', filter=Q(filas__status='PENDENTE', filas__pedido__status='PENDENTE'))
+            aguardando=Count('filas', filter=Q(filas__status='PENDENTE', filas__pedido__status='PENDENTE')),
+            # TMA materializado (1 linha por prato) e o fallback do dia, tudo na mesma consulta
+            tma_seg=F('tma_atual__valor_tma_seg'),
+            tma_anterior_seg=F('tma_atual__valor_anterior_seg'),
+            media_hoje=Avg(
+                ExpressionWrapper(F('filas__finished_at') - F('filas__started_at'), output_field=fields.DurationField()),
+                filter=Q(filas__status='FINALIZADO', filas__finished_at__date=hoje, filas__started_at__isnull=False)
+            ),
         ).order_by('-vendidos_hoje')
 
         for p in metricas_pratos:
-            # TENTA BUSCAR NA TABELA TMA (Métrica processada)
-            ultima_m = TMA.objects.filter(prato_id=p.id).order_by('-calculado_em').first()
-            
-            if ultima_m and ultima_m.valor_tma_seg:
-                p.tma_minutos = round(float(ultima_m.valor_tma_seg) / 60, 1)
+            # TMA materializado; sem métrica ainda, usa a média real dos itens de HOJE
+            if p.tma_seg:
+                p.tma_minutos = round(p.tma_seg / 60, 1)
+            elif p.media_hoje:
+                p.tma_minutos = round(p.media_hoje.total_seconds() / 60, 1)
             else:
-                # FALLBACK: Se o banco TMA está vazio, calcula a média real dos itens de HOJE
-                media_hoje = FilaPrato.objects.filter(
-                    prato_id=p.id, 
-                    status='FINALIZADO', 
-                    finished_at__date=hoje,
-                    started_at__isnull=False
-                ).aggregate(
-                    media=Avg(ExpressionWrapper(F('finished_at') - F('started_at'), output_field=fields.DurationField()))
-                )['media']
-                
-                if media_hoje:
-                    p.tma_minutos = round(media_hoje.total_seconds() / 60, 1)
-                else:
-                    p.tma_minutos = 0.0
+                p.tma_minutos = 0.0
+            p.tendencia = TMAAtual.calcular_tendencia(p.tma_seg, p.tma_anterior_seg)
 
         return render(request, 'dashboard.html', {
             'metricas_pratos': metricas_pratos, 
@@ -312,38 +483,46 @@ class MonitorPedidosView(TemplateView):
     template_name = "monitor_cliente.html"
 
 
-class MonitorPedidosAPIView(APIView):
+@method_decorator(cache_por_versao("fila"), name="dispatch")
+class MonitorPedidosAPIView(LeituraMixin, APIView):
+    # Coluna do monitor -> status do pedido exibido nela
+    COLUNAS = (
+        ("pendentes", Pedido.Status.PENDENTE),
+        ("preparando", Pedido.Status.PRODUCAO),
+        ("prontos", Pedido.Status.FINALIZADO),
+    )
+
     def get(self, request):
         try:
-            # Usamos created_at se o updated_at ainda der erro de coluna não encontrada
-            pedidos = Pedido.objects.filter(
-                status__in=[Pedido.Status.PENDENTE, Pedido.Status.PRODUCAO, Pedido.Status.FINALIZADO]
-            ).order_by('-created_at')
-
-            data = {"pendentes": [], "preparando": [], "prontos": []}
-
-            for p in pedidos:
-                senha = str(p.id).split('-')[0][:4].upper() if p.id else "0000"
-                item = {"senha": senha, "tipo": p.tipo}
-                
-                if p.status == Pedido.Status.PENDENTE:
-                    data["pendentes"].append(item)
-                elif p.status == Pedido.Status.PRODUCAO:
-                    data["preparando"].append(item)
-                elif p.status == Pedido.Status.FINALIZADO:
-                    # CORREÇÃO AQUI: 
-                    # Certifique-se que o campo no modelo FilaPrato chama-se 'filas'
-                    itens_agrupados = p.filas.values('prato__nome').annotate(
-                        total=Count('id')
-                    )
-                    
-                    item["itens"] = [
-                        {
-                            "nome": i['prato__nome'],
-                            "quantidade": i['total']
-                        } for i in itens_agrupados
-                    ]
-                    data["prontos"].append(item)
+            limites = settings.MONITOR_LIMITES
+            data = {}
+            prontos = {}
+
+            # 1. Uma consulta limitada por coluna (índice status + created_at):
+            # o custo não cresce com o acúmulo de pedidos prontos não retirados
+            for coluna, status_pedido in self.COLUNAS:
+                pedidos = Pedido.objects.filter(status=status_pedido).order_by(
+                    '-created_at'
+                ).values('id', 'tipo', 'senha')[:limites[coluna]]
+
+                data[coluna] = []
+                for p in pedidos:
+                    item = {"senha": Pedido.formatar_senha(p['senha'], p['id']), "tipo": p['tipo']}
+                    if status_pedido == Pedido.Status.FINALIZADO:
+                        item["itens"] = []
+                        prontos[p['id']] = item
+                    data[coluna].append(item)
+
+            # 2. Itens de todos os prontos exibidos em UMA consulta agrupada
+            itens_agrupados = FilaPrato.objects.filter(
+                pedido_id__in=list(prontos)
+            ).values('pedido_id', 'prato__nome').annotate(total=Count('id')).order_by()
+
+            for i in itens_agrupados:
+                prontos[i['pedido_id']]["itens"].append({
+                    "nome": i['prato__nome'],
+                    "quantidade": i['total']
+                })
 
             return Response(data)
         except Exception as e:
@@ -352,6 +531,34 @@ class MonitorPedidosAPIView(APIView):
             print(f"--- ERRO NA API DO MONITOR: {e} ---")
             return Response({"error": str(e)}, status=500)
 
+# =========================
+# BALCÃO: BUSCA POR SENHA
+# =========================
+
+class BuscarPedidoPorSenhaView(LeituraMixin, APIView):
+    def get(self, request, senha):
+        # Busca pontual no índice único (evento, senha): sem rolar a lista de prontos
+        evento = request.query_params.get("evento") or evento_atual()
+        pedido = Pedido.objects.filter(evento=evento, senha=senha).first()
+
+        if not pedido:
+            return Response({"detail": "Senha não encontrada."}, status=status.HTTP_404_NOT_FOUND)
+
+        itens = pedido.filas.values('prato__nome').annotate(qtd=Count('id')).order_by()
+
+        return Response({
+            "pedido_id": str(pedido.id),
+            "senha": pedido.senha_exibicao,
+            "evento": pedido.evento,
+            "tipo": pedido.tipo,
+            "status": pedido.status,
+            "itens_total": pedido.itens_total,
+            "itens_prontos": pedido.itens_prontos,
+            "criado_em": pedido.created_at.strftime("%H:%M"),
+            "itens": [{"nome": i['prato__nome'], "quantidade": i['qtd']} for i in itens],
+        }, status=status.HTTP_200_OK)
+
+
 class RetirarPedidoView(APIView):
     def post(self, request, pedido_id):
         try:
@@ -369,20 +576,97 @@ class RetirarPedidoView(APIView):
         except Exception as e:
             return Response({"error": str(e)}, status=500)
                 
-class BaixaEntregaView(View):
+class BaixaEntregaView(LeituraMixin, View):
     def get(self, request):
-        # 1. Pegamos os pedidos que não foram retirados ainda
-        # 2. Contamos o total de itens (total_itens)
-        # 3. Contamos apenas os itens que estão FINALIZADOS (total_prontos)
-        pedidos_completos = Pedido.objects.annotate(
-            total_itens=Count('filas'),
-            total_prontos=Count('filas', filter=Q(filas__status=Pedido.Status.FINALIZADO))
-        ).filter(
-            status=Pedido.Status.FINALIZADO, # O status do pedido pai
-            total_itens=models.F('total_prontos'), # Regra: Total == Prontos
-            total_itens__gt=0 # Garante que não pegamos pedidos vazios
+        # Pedidos prontos para retirada: filtro simples no índice (status, created_at).
+        # O finalize só marca FINALIZADO quando itens_prontos chega a itens_total.
+        pedidos_completos = Pedido.objects.filter(
+            status=Pedido.Status.FINALIZADO,
+            itens_total__gt=0,  # Garante que não pegamos pedidos vazios
         ).prefetch_related('filas', 'filas__prato').order_by('created_at')
 
         return render(request, 'baixa_entrega.html', {
             'pedidos_prontos': pedidos_completos
-        })
\ No newline at end of file
+        })
+
+# =========================
+# LOG DE MUDANÇAS
+# =========================
+
+class MudancasView(LeituraMixin, APIView):
+    """
+    Mudanças registradas pelos services, em ordem de sequência, para o
+    cliente manter o estado local incrementalmente.
+
+    ?since=N   só o que veio depois do seq N (padrão 0: desde o início)
+    ?limit=N   tamanho da página (com `mais` indicando que há continuação)
+
+    410 quando o trecho depois de `since` já foi compactado: o cliente
+    recarrega o estado completo e recomeça do `atual` informado.
+    """
+
+    def get(self, request):
+        try:
+            desde = int(request.query_params.get("since", 0))
+            limite = request.query_params.get("limit")
+            limite = min(int(limite), settings.MUDANCAS_LIMITE_MAX) if limite else settings.MUDANCAS_LIMITE_PADRAO
+            if desde < 0 or limite < 1:
+                raise ValueError("since e limit devem ser positivos")
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        resultado = listar_mudancas(desde, limite)
+        if resultado is None:
+            return Response(
+                {
+                    "detail": "Log compactado depois deste ponto: recarregue o estado.",
+                    # Lido antes da recarga: nada que mude durante ela se perde
+                    "atual": ultima_sequencia(RegistroMudanca.objects.db),
+                },
+                status=status.HTTP_410_GONE,
+            )
+
+        registros, atual = resultado
+        ultimo = registros[-1].id if registros else desde
+        return Response({
+            "mudancas": [
+                {"seq": r.id, "tipo": r.tipo, "dados": r.dados, "criado_em": r.criado_em}
+                for r in registros
+            ],
+            "ultimo": ultimo,
+            "atual": max(atual, ultimo),
+            "mais": ultimo < atual,
+        }, status=status.HTTP_200_OK)
+
+
+# =========================
+# DIAGNÓSTICO: SQL POR ROTA
+# =========================
+
+class DiagnosticoConsultasView(APIView):
+    """Agregados do InstrumentacaoSQLMiddleware (só na máquina do servidor)."""
+
+    def get(self, request):
+        if not requisicao_local(request):
+            return Response({"detail": "Disponível apenas localmente."}, status=status.HTTP_403_FORBIDDEN)
+        return Response({"rotas": agregador.exportar()}, status=status.HTTP_200_OK)
+
+    def delete(self, request):
+        # Zera os agregados (ex.: antes de uma rodada de carga)
+        if not requisicao_local(request):
+            return Response({"detail": "Disponível apenas localmente."}, status=status.HTTP_403_FORBIDDEN)
+        agregador.limpar()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+# =========================
+# MÉTRICAS (PROMETHEUS)
+# =========================
+
+class MetricsView(View):
+    """Formato texto do Prometheus; valores mantidos em memória pelos eventos."""
+
+    def get(self, request):
+        if not requisicao_da_lan(request):
+            return HttpResponseForbidden("Disponível apenas na rede local.")
+        return HttpResponse(metricas.exportar(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,164 @@
+import functools
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+
+# =========================
+# ESCRITOR ÚNICO (GROUP COMMIT)
+# =========================
+
+class EscritaExpirada(TimeoutError):
+    """O escritor único não respondeu dentro de WRITE_QUEUE_TIMEOUT_SEG."""
+
+
+class _Tarefa:
+    __slots__ = ("funcao", "args", "kwargs", "resultado", "erro", "pronta", "estado", "_lock")
+
+    # Estados: a tarefa só é abandonada pelo chamador se o escritor ainda não começou
+    AGUARDANDO, EXECUTANDO, ABANDONADA = range(3)
+
+    def __init__(self, funcao, args, kwargs):
+        self.funcao = funcao
+        self.args = args
+        self.kwargs = kwargs
+        self.resultado = None
+        self.erro = None
+        self.pronta = threading.Event()
+        self.estado = self.AGUARDANDO
+        self._lock = threading.Lock()
+
+    def iniciar(self):
+        """Escritor: marca como em execução; False se o chamador já desistiu."""
+        with self._lock:
+            if self.estado == self.ABANDONADA:
+                return False
+            self.estado = self.EXECUTANDO
+            return True
+
+    def abandonar(self):
+        """Chamador: desiste da espera; False se o escritor já começou a gravar."""
+        with self._lock:
+            if self.estado == self.EXECUTANDO:
+                return False
+            self.estado = self.ABANDONADA
+            return True
+
+
+class WriteQueue:
+    """
+    Fila de escrita opcional (settings.WRITE_QUEUE_ENABLED).
+
+    Em vez de cada thread de request disputar o lock de escrita do SQLite,
+    as mutações do service layer são entregues a uma única thread escritora,
+    que junta o que chegou em uma janela curta e grava tudo em UM commit
+    (cada mutação no seu savepoint: a falha de uma não derruba as outras).
+    A thread do request espera o resultado, que só é entregue após o COMMIT.
+
+    O escritor é por processo: para serializar de fato, rode um único
+    processo de aplicação com várias threads (ex.: gunicorn -w 1 --threads 16).
+    """
+
+    def __init__(self):
+        self._fila = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def executar(self, funcao, *args, **kwargs):
+        # Já estamos no escritor, ou o chamador tem uma transação aberta
+        # (ex.: testes, services chamando services): executa direto
+        if threading.current_thread() is self._thread or connection.in_atomic_block:
+            return funcao(*args, **kwargs)
+
+        self._garantir_thread()
+        tarefa = _Tarefa(funcao, args, kwargs)
+        self._fila.put(tarefa)
+
+        limite = getattr(settings, "WRITE_QUEUE_TIMEOUT_SEG", 30)
+        if not tarefa.pronta.wait(limite):
+            if tarefa.abandonar():
+                # Nunca chegou a rodar (e não vai mais): nada foi gravado
+                raise EscritaExpirada(f"Fila de escrita sem resposta em {limite}s; nada foi gravado")
+            raise EscritaExpirada(
+                f"Fila de escrita sem resposta em {limite}s; a mutação estava em andamento"
+            )
+
+        if tarefa.erro is not None:
+            raise tarefa.erro
+        return tarefa.resultado
+
+    def _garantir_thread(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._loop, name="write-queue", daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while True:
+            lote = [self._fila.get()]
+            try:
+                janela = getattr(settings, "WRITE_QUEUE_JANELA_MS", 2) / 1000
+                maximo = getattr(settings, "WRITE_QUEUE_LOTE_MAX", 32)
+                prazo = time.monotonic() + janela
+
+                # Junta o que chegar durante a janela (group commit)
+                while len(lote) < maximo:
+                    restante = prazo - time.monotonic()
+                    if restante <= 0:
+                        break
+                    try:
+                        lote.append(self._fila.get(timeout=restante))
+                    except queue.Empty:
+                        break
+
+                self._executar_lote(lote)
+            except BaseException as e:
+                # Nada pode matar o escritor com chamadores esperando: o lote
+                # inteiro volta com erro e a thread segue para o próximo
+                print(f"Erro na fila de escrita: {e}")
+                for tarefa in lote:
+                    if not tarefa.pronta.is_set():
+                        tarefa.resultado, tarefa.erro = None, e
+                        tarefa.pronta.set()
+                if not isinstance(e, Exception):
+                    raise
+
+    def _executar_lote(self, lote):
+        try:
+            # Dentro do try: "database is locked" aqui também volta para os chamadores
+            close_old_connections()
+            lote = [tarefa for tarefa in lote if tarefa.iniciar()]
+            with transaction.atomic():
+                for tarefa in lote:
+                    try:
+                        with transaction.atomic():
+                            tarefa.resultado = tarefa.funcao(*tarefa.args, **tarefa.kwargs)
+                    except Exception as e:
+                        tarefa.erro = e
+        except Exception as e:
+            # O COMMIT do lote falhou: nenhuma mutação foi gravada
+            print(f"Erro no commit da fila de escrita: {e}")
+            for tarefa in lote:
+                if tarefa.erro is None:
+                    tarefa.resultado, tarefa.erro = None, e
+        finally:
+            for tarefa in lote:
+                tarefa.pronta.set()
+
+write_queue = WriteQueue()
+
+
+def serializar_escrita(funcao):
+    """Envia a mutação para o escritor único quando o modo está ligado."""
+
+    @functools.wraps(funcao)
+    def wrapper(*args, **kwargs):
+        if getattr(settings, "WRITE_QUEUE_ENABLED", False):
+            return write_queue.executar(funcao, *args, **kwargs)
+        return funcao(*args, **kwargs)
+
+    return wrapper
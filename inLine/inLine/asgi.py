@@ -13,4 +13,14 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'inLine.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# O import do canal de eventos precisa vir depois do setup do Django
+from core.events import SSE_PATH, sse_application  # noqa: E402
+
+
+async def application(scope, receive, send):
+    # Canal de push (SSE) das telas de produção/monitor; o resto segue para o Django
+    if scope["type"] == "http" and scope["path"] == SSE_PATH:
+        return await sse_application(scope, receive, send)
+    return await django_application(scope, receive, send)
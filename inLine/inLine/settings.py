@@ -10,12 +10,16 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 import os
+import sys
 import datetime
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# `manage.py test`: desliga o que é estado global de processo (ver FILA_MEMORIA_ATIVA)
+TESTANDO = len(sys.argv) > 1 and sys.argv[1] == "test"
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
@@ -44,11 +48,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.InstrumentacaoSQLMiddleware',  # Primeiro: mede o request inteiro
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.PerfilamentoMiddleware',  # Depois da autenticação: aceita usuário staff
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'core.middleware.LicensingMiddleware',
@@ -78,16 +84,78 @@ WSGI_APPLICATION = 'inLine.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Perfis de PRAGMA do SQLite, aplicados em TODA conexão nova (cada thread/worker),
+# não só na primeira. Escolha com a variável de ambiente INLINE_SQLITE_PERFIL.
+SQLITE_PERFIS = {
+    # Durabilidade máxima: cada COMMIT vai para o disco (fsync)
+    "seguro": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "busy_timeout": 30000,
+    },
+    # Pico do evento: WAL + NORMAL, cache grande e arquivo mapeado em memória
+    "festival": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 30000,
+        "cache_size": -65536,  # 64 MB (valor negativo = KiB)
+        "mmap_size": 268435456,  # 256 MB
+        "temp_store": "MEMORY",
+    },
+}
+SQLITE_PERFIL = os.environ.get("INLINE_SQLITE_PERFIL", "festival")
+SQLITE_PRAGMAS = SQLITE_PERFIS[SQLITE_PERFIL]
+
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
         "OPTIONS": {
             "timeout": 30,  # essencial sob concorrência
+            "init_command": ";".join(f"PRAGMA {nome}={valor}" for nome, valor in SQLITE_PRAGMAS.items()),
+            # Transações já pedem o lock de escrita no BEGIN: sem "database is locked"
+            # imediato ao promover uma leitura para escrita com outro writer ativo
+            "transaction_mode": "IMMEDIATE",
+        },
+        # Conexões persistentes no servidor de aplicação (0 = fecha a cada request)
+        "CONN_MAX_AGE": int(os.environ.get("INLINE_CONN_MAX_AGE", 600)),
+        "CONN_HEALTH_CHECKS": True,
+        # Testes de concorrência precisam de arquivo: o SQLite em memória
+        # compartilhada falha na hora em vez de esperar o lock (timeout)
+        "TEST": {
+            "NAME": BASE_DIR / "test_db.sqlite3",
+        },
+    },
+    # Mesmo arquivo, conexão só de leitura (query_only) para dashboards e monitores:
+    # transações DEFERRED que nunca pedem o lock de escrita, e no WAL o leitor
+    # não espera o writer (nem o segura).
+    "leitura": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "db.sqlite3",
+        "OPTIONS": {
+            "timeout": 30,
+            "init_command": ";".join(
+                [f"PRAGMA {nome}={valor}" for nome, valor in SQLITE_PRAGMAS.items()]
+                + ["PRAGMA query_only=1"]
+            ),
         },
-    }
+        "CONN_MAX_AGE": int(os.environ.get("INLINE_CONN_MAX_AGE", 600)),
+        "CONN_HEALTH_CHECKS": True,
+        "TEST": {
+            "MIRROR": "default",
+        },
+    },
 }
 
+# Senhas sequenciais por evento (vazio = reinicia a cada dia)
+EVENTO = os.environ.get("INLINE_EVENTO", "")
+
+# Banco de arquivo (ATTACH): pedidos retirados e histórico de TMA saem das
+# tabelas vivas no fechamento do dia (manage.py arquivar_pedidos)
+ARQUIVO_DB_PATH = Path(os.environ.get("INLINE_ARQUIVO_DB", BASE_DIR / "arquivo.sqlite3"))
+
+DATABASE_ROUTERS = ["core.routers.LeituraRouter"]
+
 
 
 # Password validation
@@ -142,4 +210,77 @@ LICENSE_EXPIRY = datetime.date(2026, 12, 31) # Data vinda do contrato
 
 
 # Se estiveres a usar CSRF (necessário para POST)
-CSRF_TRUSTED_ORIGINS = ['https://*.githubpreview.dev', 'https://*.app.github.dev']
\ No newline at end of file
+CSRF_TRUSTED_ORIGINS = ['https://*.githubpreview.dev', 'https://*.app.github.dev']
+
+# Worker de TMA (métricas calculadas fora do request de finalização)
+TMA_WORKER_ASYNC = True  # False: calcula na hora (útil em testes)
+TMA_WORKER_AGRUPAMENTO_SEG = 2  # Janela para juntar rajadas de finalizações
+
+# Monitor do cliente: máximo de senhas exibidas por coluna
+MONITOR_LIMITES = {
+    "pendentes": 30,
+    "preparando": 30,
+    "prontos": 40,
+}
+
+# Escritor único (group commit) para as mutações do service layer
+WRITE_QUEUE_ENABLED = False
+WRITE_QUEUE_JANELA_MS = 2  # Quanto o escritor espera para juntar mutações em um commit
+WRITE_QUEUE_LOTE_MAX = 32  # Máximo de mutações por commit
+WRITE_QUEUE_TIMEOUT_SEG = 30  # Espera máxima do request pelo escritor (EscritaExpirada)
+
+# Instrumentação SQL por request (Server-Timing + agregados por rota)
+INSTRUMENTACAO_SQL = True
+
+# Perfil sob demanda (X-Inline-Perfil / ?_perfil=): pstats + pilhas "collapsed".
+# Desligado por padrão (INLINE_PERFILAMENTO=1 liga) e só para usuário staff;
+# PERFILAMENTO_LAN também aceita a rede local sem login (bancada de testes).
+PERFILAMENTO_ATIVO = os.environ.get("INLINE_PERFILAMENTO", "") == "1"
+PERFILAMENTO_LAN = False
+PERFIS_DIR = BASE_DIR / "perfis"
+PERFIS_MAX = 50  # Perfis guardados; os mais antigos são apagados
+PERFIL_INTERVALO_AMOSTRAGEM = 0.005  # segundos entre amostras de pilha
+
+# Impressão no servidor (spooler ESC/POS). Desligada por padrão: o navegador
+# do atendimento continua imprimindo. INLINE_IMPRESSAO=1 liga o spooler.
+IMPRESSAO_ATIVA = os.environ.get("INLINE_IMPRESSAO", "") == "1"
+IMPRESSAO_ASYNC = True  # False: imprime na hora, após o commit (útil em testes)
+IMPRESSORAS = {
+    # "arquivo:<caminho>" (bancada) ou "tcp://<host>:9100" (térmica de rede)
+    "balcao": os.environ.get("INLINE_IMPRESSORA_BALCAO", f"arquivo:{BASE_DIR / 'impressoes' / 'balcao.bin'}"),
+    "cozinha": os.environ.get("INLINE_IMPRESSORA_COZINHA", f"arquivo:{BASE_DIR / 'impressoes' / 'cozinha.bin'}"),
+}
+IMPRESSORA_POR_PRATO = {}  # Nome do prato -> impressora da comanda (padrão: "cozinha")
+IMPRESSAO_CABECALHO = "InLine"
+IMPRESSAO_COLUNAS = 42  # 80mm, fonte A
+IMPRESSAO_THREADS = 3
+IMPRESSAO_TIMEOUT_SEG = 5
+IMPRESSAO_RESERVA_SEG = 60  # IMPRIMINDO há mais tempo que isso: processo caiu, volta para a fila
+IMPRESSAO_MAX_TENTATIVAS = 10
+IMPRESSAO_VARREDURA_SEG = 30
+
+# Fila em memória (heap por prato) para painel, atendimento e estações.
+# Um processo por vez é o dono (flock no arquivo abaixo); os demais usam SQL.
+# Desligada no `manage.py test`: a global (flock + thread) atravessaria os
+# testes; os testes da fila montam a sua própria FilaMemoria.
+FILA_MEMORIA_ATIVA = not TESTANDO
+FILA_MEMORIA_LOCK = BASE_DIR / "fila_memoria.lock"
+FILA_MEMORIA_ACOMPANHAMENTO_SEG = 0.5  # Leitura do log de mudanças (escritas de outros workers)
+FILA_MEMORIA_VERIFICACAO_SEG = 10  # Conferência dos ids pendentes com o banco
+FILA_MEMORIA_RESERVA_SEG = 60  # Claim sem item_iniciado depois disso: rollback, a unidade volta ao heap
+FILA_MEMORIA_HISTORICO = 5000  # Mudanças guardadas para os deltas do painel (?since=)
+
+# Painel da cozinha: teto do ?limit=
+PAINEL_LIMITE_MAX = 500
+
+# Log de mudanças (/api/v1/changes/): página padrão/máxima e quanto tempo o
+# log fica no banco vivo antes de `arquivar_pedidos` compactá-lo para o arquivo
+MUDANCAS_LIMITE_PADRAO = 100
+MUDANCAS_LIMITE_MAX = 1000
+MUDANCAS_RETENCAO_HORAS = 12
+
+# Cache de respostas dos GETs de polling (ETag/304). As versões por domínio
+# ficam num arquivo mapeado em memória, compartilhado entre os workers.
+CACHE_RESPOSTAS_ATIVO = True
+CACHE_RESPOSTAS_MAX = 256  # Respostas guardadas por processo
+CACHE_VERSOES_ARQUIVO = BASE_DIR / "versoes_cache.bin"
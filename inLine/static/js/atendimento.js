@@ -5,14 +5,21 @@ let pedidosProntosConhecidos = new Set();
 
 document.addEventListener("DOMContentLoaded", () => {
   console.log("Terminal de Atendimento iniciado...");
-  carregarListaPendentes();
 
-  // 1. Atualiza a fila visual de espera a cada 10 segundos
-  setInterval(carregarListaPendentes, 10000);
+  // 1. Atualiza a fila visual de espera quando entra/sai pedido (polling de 10s sem conexão)
+  assinarEventos({
+    tipos: ["pedido_criado", "pedido_liberado"],
+    aoAtualizar: carregarListaPendentes,
+    intervaloPolling: 10000,
+  });
 
   // 2. SOLUÇÃO 3: Vigia a API para imprimir quando a cozinha finalizar TUDO
-  // Verificação a cada 7 segundos para garantir agilidade na entrega
-  setInterval(monitorarPedidosParaImpressao, 7000);
+  // Disparado pelo evento de finalização (polling de 7s sem conexão)
+  assinarEventos({
+    tipos: ["item_finalizado"],
+    aoAtualizar: monitorarPedidosParaImpressao,
+    intervaloPolling: 7000,
+  });
 });
 
 async function carregarListaPendentes() {
@@ -37,7 +44,7 @@ async function carregarListaPendentes() {
     }
 
     pendentes.forEach((p) => {
-      const senha = String(p.pedido_id).toUpperCase().slice(0, 4);
+      const senha = p.senha;
       const corBorda =
         p.tipo === "PREFERENCIAL" ? "border-red-500" : "border-amber-500";
 
@@ -0,0 +1,50 @@
+// static/js/eventos.js
+
+// Canal de push do servidor (Server-Sent Events em /api/v1/eventos/).
+// Enquanto o canal estiver conectado a tela só recarrega quando algo muda;
+// se cair (ou o servidor rodar sem ASGI), volta ao polling de sempre.
+function assinarEventos({ tipos, aoAtualizar, intervaloPolling }) {
+  let fonte = null;
+  let timerPolling = null;
+  let timerAgrupamento = null;
+
+  function iniciarPolling() {
+    if (!timerPolling) timerPolling = setInterval(aoAtualizar, intervaloPolling);
+  }
+
+  function pararPolling() {
+    clearInterval(timerPolling);
+    timerPolling = null;
+  }
+
+  // Agrupa rajadas (ex.: 6 pastéis finalizados juntos) em uma única recarga
+  function agendarAtualizacao() {
+    clearTimeout(timerAgrupamento);
+    timerAgrupamento = setTimeout(aoAtualizar, 300);
+  }
+
+  function conectar() {
+    if (!window.EventSource) return;
+
+    fonte = new EventSource("/api/v1/eventos/");
+
+    fonte.onopen = () => {
+      pararPolling();
+      aoAtualizar(); // Pode ter mudado algo enquanto estávamos desconectados
+    };
+
+    tipos.forEach((tipo) => fonte.addEventListener(tipo, agendarAtualizacao));
+
+    fonte.onerror = () => {
+      iniciarPolling();
+      // Canal indisponível (ex.: runserver/WSGI): tentamos de novo mais tarde
+      if (fonte.readyState === EventSource.CLOSED) {
+        setTimeout(conectar, 30000);
+      }
+    };
+  }
+
+  aoAtualizar();
+  iniciarPolling();
+  conectar();
+}
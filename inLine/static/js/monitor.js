@@ -47,6 +47,9 @@ async function atualizarPainel() {
   }
 }
 
-// Inicialização
-atualizarPainel();
-setInterval(atualizarPainel, 5000); // Atualiza a cada 5 segundos
+// Inicialização: push pelo servidor, polling a cada 5 segundos só sem conexão
+assinarEventos({
+  tipos: ["pedido_criado", "pedido_liberado", "item_finalizado", "pedido_retirado"],
+  aoAtualizar: atualizarPainel,
+  intervaloPolling: 5000,
+});
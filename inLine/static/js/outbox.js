@@ -0,0 +1,157 @@
+// static/js/outbox.js
+
+// Outbox do caixa: sem rede, a venda fica guardada no IndexedDB do navegador
+// e é enviada depois, em lote, para /api/v1/pedidos/sincronizar/.
+// Cada pedido leva a própria chave de idempotência e o horário original da
+// venda, então reenviar nunca duplica e a ordem da fila é preservada.
+//
+// Stores:
+//   pedidos       vendas aguardando envio
+//   sincronizados senha definitiva de cada venda offline (OFF-XXXX -> 012)
+//   rejeitados    vendas recusadas pelo servidor (4xx / ERRO): não travam a fila
+const Outbox = (() => {
+  const BANCO = "inline-caixa";
+  const STORE = "pedidos";
+  const SINCRONIZADOS = "sincronizados";
+  const REJEITADOS = "rejeitados";
+  const TAMANHO_LOTE = 50;
+  let sincronizando = false;
+
+  function abrir() {
+    return new Promise((ok, erro) => {
+      const req = indexedDB.open(BANCO, 2);
+      req.onupgradeneeded = () => {
+        for (const nome of [STORE, SINCRONIZADOS, REJEITADOS]) {
+          if (!req.result.objectStoreNames.contains(nome)) {
+            req.result.createObjectStore(nome, { keyPath: "idempotency_key" });
+          }
+        }
+      };
+      req.onsuccess = () => ok(req.result);
+      req.onerror = () => erro(req.error);
+    });
+  }
+
+  async function transacao(stores, modo, operacao) {
+    const db = await abrir();
+    return new Promise((ok, erro) => {
+      const tx = db.transaction(stores, modo);
+      const resultado = operacao(tx);
+      tx.oncomplete = () => ok(resultado && resultado.result);
+      tx.onerror = () => erro(tx.error);
+    });
+  }
+
+  function adicionar(pedido) {
+    return transacao(STORE, "readwrite", (tx) => tx.objectStore(STORE).put(pedido));
+  }
+
+  function listar(store = STORE) {
+    return transacao(store, "readonly", (tx) => tx.objectStore(store).getAll());
+  }
+
+  function contar() {
+    return transacao(STORE, "readonly", (tx) => tx.objectStore(STORE).count());
+  }
+
+  // Tira da fila de envio e guarda no destino, na mesma transação
+  function mover(pedido, destino, extras) {
+    return transacao([STORE, destino], "readwrite", (tx) => {
+      tx.objectStore(STORE).delete(pedido.idempotency_key);
+      tx.objectStore(destino).put({ ...pedido, ...extras });
+    });
+  }
+
+  function avisar() {
+    window.dispatchEvent(new CustomEvent("outbox:atualizada"));
+  }
+
+  // 408/429 e 5xx são passageiros; qualquer outro 4xx não muda no reenvio
+  function recusaDefinitiva(status) {
+    return status >= 400 && status < 500 && status !== 408 && status !== 429;
+  }
+
+  async function sincronizar() {
+    if (sincronizando || !navigator.onLine) return;
+    sincronizando = true;
+
+    try {
+      const pendentes = (await listar()).sort((a, b) =>
+        a.criado_em.localeCompare(b.criado_em),
+      );
+
+      for (let i = 0; i < pendentes.length; i += TAMANHO_LOTE) {
+        const lote = pendentes.slice(i, i + TAMANHO_LOTE);
+        const res = await fetch("/api/v1/pedidos/sincronizar/", {
+          method: "POST",
+          headers: { "Content-Type": "application/json" },
+          body: JSON.stringify({ pedidos: lote }),
+        });
+
+        if (!res.ok) {
+          if (!recusaDefinitiva(res.status)) break; // Servidor indisponível: próximo ciclo
+          // Lote recusado inteiro: separa para conferência e segue com o próximo
+          const erro = `HTTP ${res.status}: ${await res.text()}`;
+          for (const pedido of lote) await mover(pedido, REJEITADOS, { erro });
+          continue;
+        }
+
+        const { resultados } = await res.json();
+        const porChave = new Map(lote.map((p) => [p.idempotency_key, p]));
+        for (const r of resultados) {
+          const pedido = porChave.get(r.idempotency_key);
+          if (!pedido) continue;
+          if (r.resultado === "ERRO") {
+            // ERRO é definitivo (ex.: prato removido): não pode travar a outbox
+            console.error(`Pedido offline ${r.idempotency_key} rejeitado:`, r.erro);
+            await mover(pedido, REJEITADOS, { erro: r.erro });
+          } else {
+            // CRIADO ou DUPLICADO: guarda a senha definitiva para o atendente
+            await mover(pedido, SINCRONIZADOS, {
+              senha: r.senha,
+              pedido_id: r.pedido_id,
+              sincronizado_em: new Date().toISOString(),
+            });
+          }
+        }
+      }
+    } catch (e) {
+      console.error("Falha ao sincronizar pedidos offline:", e); // Rede caiu no meio
+    } finally {
+      sincronizando = false;
+      avisar();
+    }
+  }
+
+  // Devolve uma venda recusada para a fila de envio (ex.: licença regularizada)
+  async function reenviar(chave) {
+    await transacao([REJEITADOS, STORE], "readwrite", (tx) => {
+      const req = tx.objectStore(REJEITADOS).get(chave);
+      req.onsuccess = () => {
+        if (!req.result) return;
+        const { erro, ...pedido } = req.result;
+        tx.objectStore(REJEITADOS).delete(chave);
+        tx.objectStore(STORE).put(pedido);
+      };
+    });
+    await sincronizar();
+  }
+
+  function esquecer(chave, store = SINCRONIZADOS) {
+    return transacao(store, "readwrite", (tx) => tx.objectStore(store).delete(chave)).then(avisar);
+  }
+
+  window.addEventListener("online", sincronizar);
+  setInterval(sincronizar, 15000);
+  sincronizar();
+
+  return {
+    adicionar,
+    contar,
+    sincronizar,
+    reenviar,
+    esquecer,
+    sincronizados: () => listar(SINCRONIZADOS),
+    rejeitados: () => listar(REJEITADOS),
+  };
+})();
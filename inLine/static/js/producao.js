@@ -23,15 +23,74 @@ async function finalizarItem(filaId) {
   }
 }
 
-// 2. Função de Atualização do Painel
+// 1b. Finalização em lote (ex.: vários pastéis que saíram juntos da fritadeira)
+const selecionados = new Set();
+
+function alternarSelecao(filaId) {
+  if (selecionados.has(filaId)) selecionados.delete(filaId);
+  else selecionados.add(filaId);
+  atualizarPainel();
+}
+
+async function finalizarSelecionados() {
+  if (selecionados.size === 0) return;
+  try {
+    const res = await fetch("/api/v1/fila/finalizar/lote/", {
+      method: "POST",
+      headers: {
+        "Content-Type": "application/json",
+        "X-CSRFToken": getCookie("csrftoken"),
+      },
+      body: JSON.stringify({ fila_ids: [...selecionados] }),
+    });
+
+    if (res.ok) {
+      selecionados.clear();
+      atualizarPainel();
+    } else {
+      console.error("Erro na resposta do servidor ao finalizar lote");
+    }
+  } catch (e) {
+    console.error("Falha na requisição de finalização em lote:", e);
+  }
+}
+
+// 2. Estado local do painel: a primeira leitura traz a fila inteira, as
+// seguintes só o que entrou/saiu desde a última versão (?since=)
+const painel = { versao: null, itens: new Map() };
+
+async function carregarPainel() {
+  const url = painel.versao
+    ? `/api/v1/fila/painel/?since=${encodeURIComponent(painel.versao)}`
+    : "/api/v1/fila/painel/";
+  const res = await fetch(url);
+  const data = await res.json();
+  if (!res.ok) {
+    painel.versao = null;
+    throw new Error(data.error || `HTTP ${res.status}`);
+  }
+
+  if (data.completo) {
+    painel.itens = new Map((data.pendentes || []).map((item) => [item.fila_id, item]));
+  } else {
+    data.removidos.forEach((id) => painel.itens.delete(id));
+    data.inseridos.forEach((item) => painel.itens.set(item.fila_id, item));
+  }
+  painel.versao = data.versao;
+
+  // O cursor de cada unidade é também a sua posição na fila
+  return [...painel.itens.values()].sort((a, b) =>
+    a.cursor < b.cursor ? -1 : a.cursor > b.cursor ? 1 : 0,
+  );
+}
+
+// 3. Função de Atualização do Painel
 async function atualizarPainel() {
   const container = document.getElementById("painel-estacoes");
   if (!container) return;
 
   try {
-    const res = await fetch("/api/v1/fila/painel/");
-    const data = await res.json();
-    const pendentes = data.pendentes || [];
+    const pendentes = await carregarPainel();
 
     // Agrupamento
     const grupos = {};
@@ -40,7 +99,22 @@ async function atualizarPainel() {
       grupos[item.prato_nome].push(item);
     });
 
+    // Itens que já saíram da fila não podem continuar selecionados
+    const visiveis = new Set(pendentes.map((item) => item.fila_id));
+    selecionados.forEach((id) => {
+      if (!visiveis.has(id)) selecionados.delete(id);
+    });
+
     container.innerHTML = "";
+    if (selecionados.size > 0) {
+      container.insertAdjacentHTML(
+        "beforeend",
+        `<button onclick="finalizarSelecionados()"
+            class="flex-none self-start bg-green-600 hover:bg-green-500 text-white px-6 py-4 rounded-3xl font-black shadow-lg">
+            CONCLUIR ${selecionados.size} SELECIONADOS
+        </button>`,
+      );
+    }
     Object.keys(grupos)
       .sort()
       .forEach((nomePrato) => {
@@ -57,11 +131,17 @@ async function atualizarPainel() {
                             (item) => `
                             <div class="bg-white rounded-2xl border-l-8 ${item.tipo === "PREFERENCIAL" ? "border-red-500" : "border-blue-500"} p-4 shadow-lg">
                                 <div class="text-[10px] font-black text-gray-400 mb-2 uppercase">${item.tipo}</div>
-                                <div class="text-2xl font-black text-gray-900 mb-4">#${item.pedido_id.slice(0, 4).toUpperCase()}</div>
-                                <button onclick="finalizarItem('${item.fila_id}')" 
-                                    class="w-full bg-gray-900 hover:bg-green-600 text-white py-3 rounded-xl font-bold transition-all">
-                                    CONCLUIR
-                                </button>
+                                <div class="text-2xl font-black text-gray-900 mb-4">#${item.senha}</div>
+                                <div class="flex gap-2">
+                                    <button onclick="finalizarItem('${item.fila_id}')" 
+                                        class="flex-1 bg-gray-900 hover:bg-green-600 text-white py-3 rounded-xl font-bold transition-all">
+                                        CONCLUIR
+                                    </button>
+                                    <button onclick="alternarSelecao('${item.fila_id}')"
+                                        class="px-4 rounded-xl font-bold transition-all ${selecionados.has(item.fila_id) ? "bg-green-600 text-white" : "bg-gray-200 text-gray-700"}">
+                                        ${selecionados.has(item.fila_id) ? "✓" : "+"}
+                                    </button>
+                                </div>
                             </div>
                         `,
                           )
@@ -75,7 +155,7 @@ async function atualizarPainel() {
   }
 }
 
-// 3. Auxiliar para CSRF (Obrigatório no Django)
+// 4. Auxiliar para CSRF (Obrigatório no Django)
 function getCookie(name) {
   let cookieValue = null;
   if (document.cookie && document.cookie !== "") {
@@ -91,8 +171,11 @@ function getCookie(name) {
   return cookieValue;
 }
 
-// 4. Inicialização
+// 5. Inicialização
 document.addEventListener("DOMContentLoaded", () => {
-  atualizarPainel();
-  setInterval(atualizarPainel, 5000);
+  assinarEventos({
+    tipos: ["pedido_liberado", "item_iniciado", "item_finalizado"],
+    aoAtualizar: atualizarPainel,
+    intervaloPolling: 5000,
+  });
 });